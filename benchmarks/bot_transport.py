@@ -0,0 +1,152 @@
+"""
+Сравнение задержки ответа бота в режимах polling и webhook.
+
+Бот поднимается против локальной заглушки Bot API (bot_api_stub.py), сеть не нужна.
+Автоматизация Telegram Desktop подменяется мгновенной, human_delay и лимиты отправки
+(send_scheduler.py) отключаются - измеряется только транспорт: от отправки обновления до вызова бота в Bot API.
+
+Запуск: python benchmarks/bot_transport.py --rounds 200
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+import bot
+from bot_api_stub import BotApiStub
+from send_scheduler import SendScheduler
+
+USER_ID = 424242
+
+
+class ClosedBreaker:
+    """Предохранитель окна, который никогда не срабатывает (окно Telegram "всегда есть")"""
+
+    is_open = False
+
+    def status(self) -> str:
+        return ''
+
+
+class InstantAutomation:
+    """Автоматизация, которая сразу сообщает об успехе"""
+
+    telegram_window = None
+
+    def __init__(self):
+        self.breaker = ClosedBreaker()
+
+    def window_unavailable(self) -> bool:
+        return False
+
+    def check_if_authorized(self):
+        return False
+
+    def enter_phone_number(self, phone):
+        return True
+
+    def enter_code(self, code):
+        return True
+
+    def check_cloud_password_needed(self):
+        return False
+
+    def enter_cloud_password(self, password):
+        return True
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _push(stub: BotApiStub, func, *args) -> float:
+    """Отправляет обновление из пула потоков (webhook-доставка синхронная). Возвращает момент отправки"""
+    started = time.monotonic()
+    await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    return started
+
+
+async def run_mode(stub: BotApiStub, mode: str, rounds: int, cert: str = None, key: str = None) -> dict:
+    application = bot.build_application('123456:STUB', run_mode=mode, base_url=stub.base_url)
+    await application.initialize()
+    await application.start()
+    if mode == 'webhook':
+        port = _free_port()
+        scheme = 'https' if cert else 'http'
+        await application.updater.start_webhook(
+            listen='127.0.0.1',
+            port=port,
+            url_path='telegram',
+            webhook_url=f'{scheme}://127.0.0.1:{port}/telegram',
+            secret_token='stub-secret',
+            cert=cert,
+            key=key,
+            drop_pending_updates=True,
+        )
+    else:
+        await application.updater.start_polling(poll_interval=0.0, timeout=10, drop_pending_updates=True)
+
+    answer_latency = []
+    edit_latency = []
+    try:
+        # Доводим диалог до клавиатуры ввода кода
+        loop = asyncio.get_running_loop()
+        since = await _push(stub, stub.message_update, USER_ID, '/start')
+        await loop.run_in_executor(None, stub.wait_for_call, 'sendMessage', since)
+        since = await _push(stub, stub.message_update, USER_ID, '+79991234567')
+        await loop.run_in_executor(
+            None, lambda: stub.wait_for_call('sendMessage', since, predicate=lambda p: 'reply_markup' in p))
+
+        for i in range(rounds):
+            # Не даем коду дойти до 5 цифр, чтобы не уйти в ввод кода
+            data = 'code_clear' if i % 4 == 3 else 'code_1'
+            since = await _push(stub, stub.callback_update, USER_ID, data)
+            answered = await loop.run_in_executor(None, stub.wait_for_call, 'answerCallbackQuery', since)
+            edited = await loop.run_in_executor(None, stub.wait_for_call, 'editMessageText', since)
+            if answered is not None:
+                answer_latency.append((answered - since) * 1000)
+            if edited is not None:
+                edit_latency.append((edited - since) * 1000)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+    row = {'mode': mode, 'rounds': rounds, 'lost': rounds - len(edit_latency)}
+    for name, samples in (('answer', answer_latency), ('edit', edit_latency)):
+        stats = percentiles(samples)
+        row[f'{name} p50 ms'] = stats.get('p50')
+        row[f'{name} p95 ms'] = stats.get('p95')
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=100, help="Нажатий кнопок на режим")
+    parser.add_argument('--cert', default=None, help="Сертификат для https:// webhook (самоподписанный)")
+    parser.add_argument('--key', default=None, help="Ключ сертификата")
+    args = parser.parse_args()
+
+    bot.automation = InstantAutomation()
+    bot.MIN_DELAY = bot.MAX_DELAY = 0.0
+    bot.MAX_REQUESTS_PER_MINUTE = bot.MAX_REQUESTS_PER_HOUR = 10 ** 6
+    bot.MAX_LOGINS_PER_DAY = 10 ** 6
+    bot.outbound = SendScheduler(global_rate=10 ** 6, global_burst=10 ** 6, chat_rate=10 ** 6, chat_burst=10 ** 6)
+
+    rows = []
+    for mode in ('polling', 'webhook'):
+        stub = BotApiStub(port=0, webhook_cafile=args.cert).start()
+        try:
+            rows.append(asyncio.run(run_mode(stub, mode, args.rounds, args.cert, args.key)))
+        finally:
+            stub.stop()
+    print_table("Задержка обработки нажатия кнопки (заглушка Bot API, без сети)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Общие помощники для скриптов замеров в benchmarks/"""
+import os
+import sys
+from typing import Dict, Iterable, List
+
+# Скрипты запускаются как python benchmarks/<имя>.py - делаем модули проекта импортируемыми
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+
+def percentiles(samples: Iterable[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """Перцентили (метод ближайшего ранга) плюс min/max/mean; значения в тех же единицах, что и samples"""
+    data = sorted(samples)
+    if not data:
+        return {}
+    result = {'min': data[0], 'max': data[-1], 'mean': sum(data) / len(data)}
+    for p in points:
+        index = max(0, min(len(data) - 1, int(round(p / 100.0 * len(data) + 0.5)) - 1))
+        result[f'p{p}'] = data[index]
+    return result
+
+
+def print_table(title: str, rows: List[Dict[str, object]]):
+    """Печатает строки-словари выровненной таблицей"""
+    print(f"\n{title}")
+    if not rows:
+        print("  (нет данных)")
+        return
+    columns = list(rows[0].keys())
+    cells = [[_fmt(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  " + "  ".join(column.ljust(widths[i]) for i, column in enumerate(columns)))
+    for line in cells:
+        print("  " + "  ".join(value.ljust(widths[i]) for i, value in enumerate(line)))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return "" if value is None else str(value)
@@ -0,0 +1,92 @@
+"""
+Проверка бюджета времени импорта (python -X importtime).
+
+Для каждого модуля берется лучшее из нескольких запусков (cumulative, мкс из вывода importtime)
+и сравнивается с бюджетом. Дополнительно проверяется, что стек GUI-автоматизации
+(pyautogui, pywinauto) не импортируется при старте. Код выхода 1 - бюджет превышен.
+
+Запуск: python benchmarks/import_time.py [--runs 5] [--budget bot=900]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+import common
+from common import print_table
+
+# Бюджеты в миллисекундах (с запасом для медленных машин)
+BUDGETS_MS = {
+    'telegram_automation': 150,
+    'web_app': 500,
+    'bot': 900,
+}
+
+# Модули, которые не должны загружаться при импорте
+FORBIDDEN = ('pyautogui', 'pywinauto', 'comtypes')
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def measure(module: str):
+    """Один запуск: (cumulative мс для модуля, множество импортированных модулей)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=common.PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, LOG_LEVEL='ERROR'),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} завершился с ошибкой:\n{result.stderr[-2000:]}")
+    cumulative_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        imported.add(name)
+        if name == module and not match.group(3).strip():
+            cumulative_us = int(match.group(2))
+    return cumulative_us / 1000.0, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="Запусков на модуль (берется лучший)")
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS',
+                        help="Переопределить бюджет, например bot=1200")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        name, _, value = item.partition('=')
+        budgets[name] = float(value)
+
+    rows = []
+    failed = False
+    for module, budget in budgets.items():
+        best = None
+        leaked = set()
+        for _ in range(args.runs):
+            elapsed, imported = measure(module)
+            best = elapsed if best is None else min(best, elapsed)
+            leaked |= {name for name in imported if name.split('.')[0] in FORBIDDEN}
+        ok = best <= budget and not leaked
+        failed = failed or not ok
+        rows.append({
+            'module': module,
+            'best ms': best,
+            'budget ms': float(budget),
+            'gui imports': ', '.join(sorted(leaked)[:3]) or '-',
+            'result': 'OK' if ok else 'FAIL',
+        })
+
+    print_table("Время импорта (python -X importtime)", rows)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
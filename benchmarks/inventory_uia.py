@@ -0,0 +1,152 @@
+"""
+Обращения к UI в минуту при одновременно работающих боте и веб-приложении:
+каждый опрашивает окна сам против общей службы инвентаризации (inventory_service.py).
+
+Окна - simulated_backend (процессы Telegram настоящие, спящие), время ускорено в --scale раз.
+Нагрузка за одну имитированную минуту:
+- веб-приложение: открытая панель с автообновлением - каждые 5 с настоящие запросы
+  /api/sessions и /api/status с If-None-Match, как у index.html; список - либо все поля
+  (панель по умолчанию), либо выборка ?fields=... (--fields);
+- бот: прогрев окна каждые 30 с (WINDOW_WARMUP=1) и /start раз в 20 с (проверка авторизации).
+Пробы окон у веб-приложения без службы (SESSION_PROBE_TTL) и у службы (INVENTORY_PROBE_TTL) -
+15 имитированных секунд, кэш снимка (SESSIONS_CACHE_TTL) и замер ресурсов
+(RESOURCE_SAMPLE_INTERVAL) - 5.
+Считается метрика ui_calls_total (подключение, проверка окна, обходы дерева, чтение текста)
+и то, дошел ли до панели вход, случившийся посреди прогона.
+
+Запуск: python benchmarks/inventory_uia.py --sessions 3 --minutes 2 --scale 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import common
+from common import print_table
+
+
+def run_scenario(scenario: str, sessions: int, minutes: float, scale: float, fields: str) -> dict:
+    """Выполняется в отдельном процессе: модули читают INVENTORY_ADDR при импорте"""
+    from simulated_backend import SimulatedDesktop, spawn_processes, stop_processes
+    import telegram_automation
+    from ui_locator import UI_CALLS
+
+    processes = spawn_processes(sessions)
+    desktop = SimulatedDesktop(call_latency=0.0005).install()
+    for index, proc in enumerate(processes):
+        desktop.add_window(proc.pid, authorized=index == 0)
+    # Кэш элементов экрана входа живет 60 с имитированного времени
+    telegram_automation.LOGIN_CONTROLS_TTL = 60 / scale
+
+    service = None
+    try:
+        if scenario == 'daemon':
+            from inventory_service import InventoryService
+            service = InventoryService('127.0.0.1:0', interval=5 / scale).start()
+            os.environ['INVENTORY_ADDR'] = f'127.0.0.1:{service.port}'
+            time.sleep(0.2)  # первый обход
+
+        import web_app
+        import bot
+
+        def calls_by_kind():
+            return {dict(labels)['kind']: value for _, labels, value in UI_CALLS.samples()}
+
+        baseline = calls_by_kind()
+        duration = minutes * 60 / scale
+        stop = threading.Event()
+        client = web_app.app.test_client()
+        sessions_url = f'/api/sessions?fields={fields}' if fields else '/api/sessions'
+        etags = {}
+        latest = {}
+
+        def fetch_if_changed(url: str):
+            """Запрос панели: If-None-Match с последним ETag, 304 - ответ прежний"""
+            headers = {'If-None-Match': etags[url]} if url in etags else {}
+            response = client.get(url, headers=headers)
+            if response.status_code == 200:
+                etags[url] = response.headers.get('ETag')
+                latest[url] = response.get_json()
+
+        def dashboard():
+            while True:
+                fetch_if_changed(sessions_url)
+                fetch_if_changed('/api/status')
+                if stop.wait(5 / scale):
+                    return
+
+        async def bot_frontend():
+            loop = asyncio.get_running_loop()
+            warmup = asyncio.create_task(bot.window_warmup_loop(30 / scale))
+            started = time.monotonic()
+            while time.monotonic() - started < duration:
+                await loop.run_in_executor(None, bot.check_authorized)
+                await asyncio.sleep(20 / scale)
+            warmup.cancel()
+
+        thread = threading.Thread(target=dashboard, daemon=True)
+        thread.start()
+        # Посреди прогона одна сессия входит в аккаунт - изменение должно дойти до панели
+        threading.Timer(duration / 2, lambda: desktop.windows[processes[-1].pid].set_authorized(True)).start()
+        asyncio.run(bot_frontend())
+        stop.set()
+        thread.join()
+
+        by_kind = {kind: value - baseline.get(kind, 0) for kind, value in calls_by_kind().items()}
+        total = sum(by_kind.values())
+        shown = {session['pid']: session for session in latest.get(sessions_url, {}).get('sessions', [])}
+        last = shown.get(processes[-1].pid, {})
+        return {
+            'scenario': scenario,
+            'panel': sessions_url,
+            'ui calls/min': total / minutes,
+            'attach/min': by_kind.get('attach', 0) / minutes,
+            'tree walks/min': by_kind.get('descendants', 0) / minutes,
+            'text reads/min': by_kind.get('window_text', 0) / minutes,
+            'login seen': 'yes' if last.get('status') == 'Авторизован' else 'no',
+        }
+    finally:
+        if service is not None:
+            service.stop()
+        stop_processes(processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=3, help="Окон Telegram на рабочем столе")
+    parser.add_argument('--minutes', type=float, default=2, help="Имитированных минут")
+    parser.add_argument('--scale', type=float, default=20, help="Ускорение времени")
+    parser.add_argument('--fields', default='pid,name,status',
+                        help="Выборка полей панели для второго прогона (первый - все поля)")
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--panel-fields', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.sessions, args.minutes, args.scale, args.panel_fields)))
+        return
+
+    rows = []
+    ttl = {'SESSION_PROBE_TTL': 15, 'INVENTORY_PROBE_TTL': 15, 'SESSIONS_CACHE_TTL': 5,
+           'RESOURCE_SAMPLE_INTERVAL': 5}
+    for fields in ('', args.fields):
+        for scenario in ('standalone', 'daemon'):
+            env = dict(os.environ, LOG_LEVEL='ERROR', WINDOW_WARMUP='1',
+                       **{name: str(seconds / args.scale) for name, seconds in ttl.items()})
+            env.pop('INVENTORY_ADDR', None)
+            result = subprocess.run(
+                [sys.executable, __file__, '--scenario', scenario, '--sessions', str(args.sessions),
+                 '--minutes', str(args.minutes), '--scale', str(args.scale), '--panel-fields', fields],
+                cwd=common.PROJECT_DIR, env=env, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"сценарий {scenario} завершился с ошибкой:\n{result.stderr[-2000:]}")
+            rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    print_table(f"Обращения к UI: бот + веб-приложение, {args.sessions} окна, {args.minutes} мин", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Влияние логирования на задержку обработчика: синхронные обработчики против очереди (LOG_QUEUE=1).
+
+"Обработчик" повторяет профиль логов TelegramAutomation: INFO на каждый найденный процесс,
+DEBUG на каждую неудачную попытку подключения (при уровне INFO отбрасывается) и итоговая запись.
+Консольный вывод перенаправляется в файл, чтобы замер включал реальную запись на диск.
+
+Запуск: python benchmarks/logging_overhead.py --calls 2000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+import logging_setup
+
+logger = logging.getLogger('telegram_automation')
+
+
+def handler(processes: int):
+    """Имитация одного прохода поиска окна"""
+    for pid in range(processes):
+        logger.info("Найден процесс Telegram: %s (PID: %s)", 'Telegram.exe', 1000 + pid)
+        logger.debug("Не удалось подключиться через uia (PID %s): %s", 1000 + pid, 'timeout')
+        logger.debug("Не удалось подключиться через win32 (PID %s): %s", 1000 + pid, 'timeout')
+    logger.info("Окно Telegram найдено по PID (uia)")
+
+
+def run(name: str, use_queue: bool, json_file: bool, calls: int, processes: int, workdir: str) -> dict:
+    console_path = os.path.join(workdir, f'{name}.console.log')
+    json_path = os.path.join(workdir, f'{name}.jsonl')
+    saved_stderr = sys.stderr
+    with open(console_path, 'w', encoding='utf-8') as console:
+        sys.stderr = console
+        if json_file:
+            os.environ['LOG_JSON_FILE'] = json_path
+        else:
+            os.environ.pop('LOG_JSON_FILE', None)
+        try:
+            logging_setup.setup_logging('INFO', use_queue=use_queue)
+            samples = []
+            for _ in range(calls):
+                started = time.perf_counter()
+                handler(processes)
+                samples.append((time.perf_counter() - started) * 1_000_000)
+            drain_started = time.perf_counter()
+            logging_setup.stop_logging()
+            drain_ms = (time.perf_counter() - drain_started) * 1000
+        finally:
+            logging.getLogger().handlers.clear()
+            sys.stderr = saved_stderr
+    stats = percentiles(samples)
+    return {
+        'config': name,
+        'p50 us': stats['p50'],
+        'p95 us': stats['p95'],
+        'p99 us': stats['p99'],
+        'max us': stats['max'],
+        'drain ms': drain_ms if use_queue else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000, help="Вызовов обработчика на конфигурацию")
+    parser.add_argument('--processes', type=int, default=4, help="Процессов Telegram на проход")
+    args = parser.parse_args()
+
+    configs = [
+        ('sync', False, False),
+        ('sync+json', False, True),
+        ('queue', True, False),
+        ('queue+json', True, True),
+    ]
+    with tempfile.TemporaryDirectory() as workdir:
+        rows = [run(name, use_queue, json_file, args.calls, args.processes, workdir)
+                for name, use_queue, json_file in configs]
+    print_table(f"Задержка обработчика ({args.processes} процессов, {args.calls} вызовов)", rows)
+
+
+if __name__ == '__main__':
+    main()
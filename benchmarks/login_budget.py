@@ -0,0 +1,94 @@
+"""
+Бюджет времени на ввод номера (deadline.py) в виртуальном времени.
+
+Шаг номера повторяет handle_phone бота: human_delay, проверка авторизации, human_delay,
+enter_phone_number. Паузы бота и автоматизации идут по clock.VirtualClock, окно -
+simulated_backend. Сценарии:
+
+- ok: обычное окно, бюджет по умолчанию - уложились, части видны в отчете;
+- no_controls: UIA не видит полей, ввод идет резервным путем pyautogui; без бюджета
+  и с бюджетом;
+- tight: то же при малом бюджете - паузы "для человека" укорачиваются, резервный путь
+  пропускается, шаг быстро завершается неудачей вместо долгого ввода вслепую;
+- overrun: бюджет меньше даже быстрого пути - отчет называет шаг, где он кончился.
+
+Запуск: python benchmarks/login_budget.py
+"""
+import asyncio
+import logging
+import random
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import print_table
+
+import bot
+import deadline
+from clock import VirtualClock
+from simulated_backend import SimulatedDesktop
+from telegram_automation import TelegramAutomation
+
+PHONE = '+79991234567'
+
+
+async def phone_flow() -> bool:
+    """Работа с окном из handle_phone (без ответов пользователю)"""
+    await bot.human_delay()
+    if bot.check_authorized():
+        return True
+    await bot.human_delay()
+    return bot.automation.enter_phone_number(PHONE)
+
+
+def run(name: str, budget_seconds, controls: bool = True) -> dict:
+    random.seed(7)  # Одинаковые human_delay во всех сценариях
+    clock = VirtualClock()
+    bot.clock = clock
+    bot.automation = TelegramAutomation(clock=clock)
+    desktop = SimulatedDesktop(call_latency=0).install()
+    window = desktop.add_window(1)
+    if not controls:
+        window.controls = [control for control in window.controls if control.control_type == 'Button']
+
+    budget = deadline.Budget('phone', budget_seconds, clock=clock) if budget_seconds else None
+    if budget is None:
+        result = asyncio.run(phone_flow())
+        report = None
+    else:
+        with budget.use():
+            result = asyncio.run(phone_flow())
+        report = budget.finish('ok' if result else 'fail')
+    row = {
+        'scenario': name,
+        'budget s': budget_seconds or '-',
+        'virtual s': clock.elapsed,
+        'result': 'ok' if result else 'fail',
+        'entered': window.entered.get('phone', '-'),
+        'overran': report['overran'] if report else '-',
+        'shortcuts': ', '.join(report['shortcuts']) if report and report['shortcuts'] else '-',
+    }
+    return {'row': row, 'report': report}
+
+
+def main():
+    logging.getLogger('telegram_automation').setLevel(logging.CRITICAL)
+    logging.getLogger('deadline').setLevel(logging.CRITICAL)
+    scenarios = [
+        run('ok', deadline.LOGIN_BUDGET_PHONE),
+        run('no_controls', None, controls=False),
+        run('no_controls', deadline.LOGIN_BUDGET_PHONE, controls=False),
+        run('tight', 6, controls=False),
+        run('overrun', 3),
+    ]
+    print_table("Бюджет шага номера", [scenario['row'] for scenario in scenarios])
+    for scenario in scenarios:
+        report = scenario['report']
+        if report is None or scenario['row']['scenario'] not in ('tight', 'overrun'):
+            continue
+        print_table(f"Части шага: {scenario['row']['scenario']} (бюджет {report['budget_s']} с)", [
+            {'step': step['step'], 'at s': step['at_s'], 'seconds': step['seconds'],
+             'waited s': step['waited_s'], 'over': 'yes' if step['over'] else ''}
+            for step in report['steps']])
+
+
+if __name__ == '__main__':
+    main()
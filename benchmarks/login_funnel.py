@@ -0,0 +1,228 @@
+"""
+Воронка входа (login_funnel.py): сверка с известным сценарием и цена учета на вызов обработчика.
+
+--users синтетических диалогов проходят /start -> номер -> код -> пароль с заданными
+вероятностями: пользователь думает (логнормально), окно иногда не дает ввести номер, код
+или пароль (повтор "Не удалось выполнить"), часть пользователей бросает диалог или
+отменяет его. Обработчики устроены как в боте: паузы human_delay / password_wait и работа
+с окном - шаги бюджета (deadline.Budget), у каждого диалога свои виртуальные часы.
+
+Проверяется, что воронка насчитала те же переходы, выходы, повторы и время по частям
+(user, automation, delay, bot), что заложены в сценарий, а брошенные диалоги закрылись
+через LOGIN_FUNNEL_IDLE. Замеряется цена begin/end (вместе с use) на вызов обработчика.
+
+Запуск: python benchmarks/login_funnel.py --users 5000
+"""
+import argparse
+import heapq
+import random
+import time
+from collections import Counter, defaultdict
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+import deadline
+import login_funnel
+from clock import VirtualClock
+from login_funnel import FUNNEL_STATE_SECONDS, PARTS, LoginFunnel
+
+# Вероятности сценария
+AUTHORIZED = 0.03  # Telegram Desktop уже авторизован - /start завершает диалог
+FAIL = {'phone': 0.15, 'code': 0.1, 'password': 0.1}  # Окно не дало ввести - повтор
+GIVE_UP = {'phone': 0.2, 'code': 0.1, 'password': 0.15}  # Пользователь бросает, не ответив
+CANCEL = 0.05  # /cancel на шаге кода
+CLOUD_PASSWORD = 0.3  # Нужен облачный пароль
+MAX_TRIES = 3  # После стольких неудач пользователь бросает
+
+
+class Truth:
+    """Что заложено в сценарий: с этим сверяется воронка"""
+
+    def __init__(self):
+        self.exits = defaultdict(Counter)
+        self.retries = Counter()
+        self.seconds = defaultdict(float)  # (state, part) -> секунды
+
+
+class Dialog:
+    """Один синтетический диалог: свои часы и сценарий вызовов обработчиков"""
+
+    def __init__(self, key, rng, funnel: LoginFunnel, truth: Truth, arrival: float, costs: list):
+        self.key = key
+        self.rng = rng
+        self.funnel = funnel
+        self.truth = truth
+        self.clock = VirtualClock()
+        self.clock.advance(arrival)
+        self.costs = costs
+        self.thinking = 0.0  # Пауза пользователя до следующего вызова (в сверку - когда вызов случился)
+        self.needs_password = False
+        self.script = self._script()
+
+    def think(self, mean: float) -> float:
+        self.thinking = self.rng.lognormvariate(0, 0.6) * mean
+        return self.thinking
+
+    def call(self, state, to_ok, end, work) -> str:
+        """Вызов обработчика: begin, шаги бюджета, end; возвращает, куда перешел диалог"""
+        clock = self.clock
+        budget = deadline.Budget(state or 'funnel', float('inf'), clock=clock)
+        measured = time.perf_counter()
+        call = self.funnel.begin(self.key, state, clock.monotonic(), budget)
+        cost = time.perf_counter() - measured
+        self.truth.seconds[(call.state, 'user')] += self.thinking
+        self.thinking = 0.0
+        with self.funnel.use(call):
+            to = work(budget, call.state)
+        # Ответ пользователю (очередь отправки) - вне шагов
+        reply = self.rng.uniform(0.05, 0.3)
+        clock.advance(reply)
+        self.truth.seconds[(call.state, 'bot')] += reply
+        if to is None:
+            to = to_ok
+        measured = time.perf_counter()
+        self.funnel.end(call, end if to == 'END' else to, clock.monotonic())
+        self.costs.append(cost + time.perf_counter() - measured)
+        return to
+
+    def step(self, budget, state: str, name: str, seconds: float):
+        part = 'delay' if name in login_funnel.DELAY_STEPS else 'automation'
+        with budget.step(name):
+            self.clock.advance(seconds)
+        self.truth.seconds[(state, part)] += seconds
+
+    def _script(self):
+        rng, truth = self.rng, self.truth
+
+        def start(budget, state):
+            self.step(budget, state, 'human_delay', rng.uniform(1, 3))
+            self.step(budget, state, 'check_authorized', rng.uniform(0.1, 0.5))
+            return 'END' if rng.random() < AUTHORIZED else None
+
+        def attempt(state, name, seconds, delays):
+            def work(budget, current):
+                for delay_name, delay in delays:
+                    self.step(budget, current, delay_name, delay)
+                self.step(budget, current, name, seconds)
+                if rng.random() < FAIL[state]:
+                    login_funnel.retry('automation')
+                    truth.retries[state] += 1
+                    return state
+                return None
+            return work
+
+        to = self.call('start', 'phone', 'authorized', start)
+        truth.exits['start']['authorized' if to == 'END' else 'phone'] += 1
+        if to == 'END':
+            return
+        yield self.think(15)
+
+        for state in ('phone', 'code', 'password'):
+            tries = 0
+            while True:
+                if rng.random() < GIVE_UP[state] or tries == MAX_TRIES:
+                    truth.exits[state]['abandoned'] += 1
+                    return
+                if state == 'code':
+                    # Четыре цифры кнопками: каждый вызов - только ответ бота
+                    for _ in range(4):
+                        self.call('code', 'code', 'logged_in', lambda budget, current: None)
+                        yield self.think(1.0)
+                    if rng.random() < CANCEL:
+                        self.call(None, 'END', 'cancelled', lambda budget, current: None)
+                        truth.exits['code']['cancelled'] += 1
+                        return
+                    self.needs_password = rng.random() < CLOUD_PASSWORD
+                    work = attempt('code', 'enter_code', rng.uniform(1, 2.5),
+                                   [('password_wait', rng.uniform(2, 4))])
+                    following = 'password' if self.needs_password else 'END'
+                elif state == 'phone':
+                    work = attempt('phone', 'enter_phone_number', rng.uniform(2, 6),
+                                   [('human_delay', rng.uniform(1, 3)), ('human_delay', rng.uniform(1, 3))])
+                    following = 'code'
+                else:
+                    work = attempt('password', 'enter_cloud_password', rng.uniform(1, 3), [])
+                    following = 'END'
+                to = self.call(state, following, 'logged_in', work)
+                if to != state:
+                    truth.exits[state]['logged_in' if to == 'END' else to] += 1
+                    if to == 'END':
+                        return
+                    yield self.think({'code': 30, 'password': 12}[to])
+                    break
+                tries += 1
+                yield self.think(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5000, help="Синтетических диалогов")
+    parser.add_argument('--hours', type=float, default=1.0, help="За сколько часов приходят диалоги")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    funnel = LoginFunnel(idle=login_funnel.LOGIN_FUNNEL_IDLE)
+    truth = Truth()
+    costs = []
+    queue = []
+    for user_id in range(args.users):
+        arrival = rng.uniform(0, args.hours * 3600)
+        heapq.heappush(queue, (arrival, user_id))
+    dialogs = {}
+    open_peak = 0
+    last = 0.0
+    started = time.perf_counter()
+    while queue:
+        at, user_id = heapq.heappop(queue)
+        dialog = dialogs.get(user_id)
+        if dialog is None:
+            dialog = dialogs[user_id] = Dialog((user_id, user_id), random.Random(user_id), funnel, truth, at, costs)
+        else:
+            dialog.clock.advance(at - dialog.clock.monotonic())
+        think = next(dialog.script, None)
+        last = max(last, dialog.clock.monotonic())
+        open_peak = max(open_peak, len(funnel._visits))
+        if think is None:
+            del dialogs[user_id]
+        else:
+            heapq.heappush(queue, (dialog.clock.monotonic() + think, user_id))
+    wall = time.perf_counter() - started
+    summary = funnel.summary(last + funnel.idle + 1)  # Брошенные диалоги закрываются по простою
+
+    rows = []
+    for state in summary['states']:
+        row = {'state': state['state'], 'entered': state['entered'], 'forward %': state['conversion'] * 100,
+               'dropped %': state['dropped'] * 100, 'retries': sum(state['retries'].values())}
+        for part in ('total',) + PARTS:
+            row[f'{part} mean s'] = state['seconds'][part]['mean']
+        rows.append(row)
+    print_table(f"Воронка: {args.users} диалогов за {args.hours} ч, "
+                f"вошли {summary['logged_in']} ({summary['conversion'] * 100:.1f}%)", rows)
+
+    checks = []
+    for state in summary['states']:
+        name = state['state']
+        checks.append({'check': f'{name}: выходы', 'expected': dict(truth.exits[name]), 'funnel': state['exits'],
+                       'ok': 'yes' if state['exits'] == dict(truth.exits[name]) else 'NO'})
+        retries = state['retries'].get('automation', 0)
+        checks.append({'check': f'{name}: повторы', 'expected': truth.retries[name], 'funnel': retries,
+                       'ok': 'yes' if retries == truth.retries[name] else 'NO'})
+        for part in PARTS:
+            measured = (FUNNEL_STATE_SECONDS.mean(state=name, part=part) or 0.0) * \
+                FUNNEL_STATE_SECONDS.count(state=name, part=part)
+            expected = truth.seconds[(name, part)]
+            checks.append({'check': f'{name}: {part} s (сумма)', 'expected': round(expected, 1),
+                           'funnel': round(measured, 1), 'ok': 'yes' if abs(measured - expected) < 1e-6 * max(1.0, expected) else 'NO'})
+    print_table("Сверка со сценарием", checks)
+
+    cost = percentiles([seconds * 1e6 for seconds in costs])
+    print_table("Цена учета на вызов обработчика", [{
+        'calls': len(costs), 'begin+end p50 us': cost['p50'], 'p99 us': cost['p99'],
+        'open peak': open_peak, 'open after idle': sum(state['open'] for state in summary['states']),
+        'wall s': wall,
+    }])
+
+
+if __name__ == '__main__':
+    main()
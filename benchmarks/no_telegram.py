@@ -0,0 +1,84 @@
+"""
+Попытки входа без запущенного Telegram: полный поиск окна против предохранителя (window_breaker.py).
+
+Окна - simulated_backend, паузы автоматизации - виртуальные часы (считаются, но не ждутся).
+Сначала процессов Telegram нет, и бот раз за разом пробует ввести номер; затем процесс
+появляется, и замеряется, через сколько фоновая проверка снова пускает к окну.
+
+- off: предохранитель не размыкается (прежнее поведение);
+- on: WINDOW_BREAKER_FAILURES неудач подряд, дальше отказ сразу.
+
+Запуск: python benchmarks/no_telegram.py --attempts 20 --latency 0.02
+"""
+import argparse
+import logging
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+from clock import VirtualClock
+from simulated_backend import SimulatedDesktop, spawn_processes, stop_processes
+from telegram_automation import TelegramAutomation
+from ui_locator import UI_CALLS
+from window_breaker import WINDOW_BREAKER_FAILURES, WindowBreaker
+
+
+def ui_calls() -> float:
+    return sum(value for _, _, value in UI_CALLS.samples())
+
+
+def run(mode: str, attempts: int, latency: float, probe_interval: float) -> dict:
+    desktop = SimulatedDesktop(call_latency=latency).install()
+    clock = VirtualClock()
+    automation = TelegramAutomation(clock=clock)
+    failures = WINDOW_BREAKER_FAILURES if mode == 'on' else 10 ** 9
+    automation.breaker = WindowBreaker(failures=failures, probe_interval=probe_interval)
+
+    calls_before = ui_calls()
+    durations = []
+    for _ in range(attempts):
+        started = time.perf_counter()
+        virtual_started = clock.elapsed
+        automation.enter_phone_number('+79991234567')
+        durations.append((time.perf_counter() - started, clock.elapsed - virtual_started))
+    calls = ui_calls() - calls_before
+
+    # Telegram запустился: когда окно снова находится
+    processes = spawn_processes(1)
+    try:
+        desktop.add_window(processes[0].pid)
+        started = time.perf_counter()
+        while not automation.find_telegram_window() and time.perf_counter() - started < 30:
+            time.sleep(0.05)
+        recovered = time.perf_counter() - started
+    finally:
+        stop_processes(processes)
+
+    wall = percentiles(seconds for seconds, _ in durations)
+    return {
+        'breaker': mode,
+        'attempts': attempts,
+        'wall p50 ms': wall['p50'] * 1000,
+        'wall max ms': wall['max'] * 1000,
+        'waits s/attempt': sum(virtual for _, virtual in durations) / attempts,
+        'ui calls': int(calls),
+        'pyautogui actions': len(desktop.pyautogui.actions),
+        'recovery s': recovered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--attempts', type=int, default=20, help="Попыток ввода номера без Telegram")
+    parser.add_argument('--latency', type=float, default=0.02, help="Задержка каждого обращения к окну (секунды)")
+    parser.add_argument('--probe-interval', type=float, default=0.5, help="Первая пауза фоновой проверки (секунды)")
+    args = parser.parse_args()
+
+    logging.getLogger('telegram_automation').setLevel(logging.ERROR)
+    rows = [run(mode, args.attempts, args.latency, args.probe_interval) for mode in ('off', 'on')]
+    print_table(f"Ввод номера без запущенного Telegram ({args.attempts} попыток)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Резервный ввод номера (pyautogui): прежние отдельные вызовы против пакетного ввода (input_batch.py).
+
+Окно - simulated_backend без полей UIA, поэтому enter_phone_number сразу идет резервным
+путем. Вызовы pyautogui стоят виртуального времени, как настоящие:
+
+- после каждого вызова pyautogui - пауза PAUSE (--pause, в боте случайная 0.2-0.5 с),
+  если вызов не сделан с _pause=False;
+- write(interval=0.05) ждет между символами, click(duration=0.1) - движение мыши;
+- каждое событие ввода (нажатие, отпускание, движение мыши) в pyautogui - отдельный
+  вызов ОС (--call-ms), пакет SendInput - один вызов на кусок.
+
+Сравниваются:
+- legacy: прежняя последовательность вызовов и пауз enter_phone_number (до input_batch);
+- batch/pyautogui: пакетный ввод без SendInput (не Windows, INPUT_SENDINPUT=0);
+- batch/sendinput: пакетный ввод одним SendInput на кусок (модель; события INPUT при
+  этом собираются настоящим SendInputSender.events - его стоимость видна в build ms).
+
+Время - часть резервного пути в бюджете входа (enter_phone_number/pyautogui) и включает
+паузу 0.5 с после Enter (в имитации экран не снимается, см. screen_change.py).
+
+Запуск: python benchmarks/phone_entry_input.py --pause 0.35 --call-ms 1
+"""
+import argparse
+import logging
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+import deadline
+import telegram_automation
+from clock import VirtualClock
+from input_batch import InputSequence, PyAutoGuiSender, SendInputSender
+from simulated_backend import SimulatedDesktop
+from telegram_automation import TelegramAutomation
+
+PHONE = '+79991234567'
+
+
+class CostedPyAutoGui:
+    """pyautogui имитации с ценой вызовов по виртуальным часам"""
+
+    __name__ = 'pyautogui'
+
+    def __init__(self, inner, clock: VirtualClock, pause: float, call: float):
+        self.inner = inner
+        self.clock = clock
+        self.pause = pause
+        self.call = call
+        self.os_calls = 0
+        self.paused = 0.0
+
+    def _pay(self, events: int, extra: float, _pause: bool):
+        self.os_calls += events
+        self.clock.sleep(events * self.call + extra)
+        if _pause:
+            self.paused += self.pause
+            self.clock.sleep(self.pause)
+
+    def click(self, x=None, y=None, duration=0.0, _pause=True, **kwargs):
+        self.inner.click(x, y)
+        self._pay(3, duration, _pause)  # Движение, нажатие и отпускание кнопки
+
+    def hotkey(self, *keys, _pause=True, **kwargs):
+        self.inner.hotkey(*keys)
+        self._pay(2 * len(keys), 0.0, _pause)
+
+    def press(self, key, _pause=True, **kwargs):
+        self.inner.press(key)
+        self._pay(2, 0.0, _pause)
+
+    def write(self, text, interval=0.0, _pause=True, **kwargs):
+        self.inner.write(text)
+        self._pay(2 * len(text), interval * len(text), _pause)
+
+    def size(self):
+        return self.inner.size()
+
+
+class ModelSendInput:
+    """SendInput по модели: кусок - один вызов ОС; события INPUT собираются по-настоящему"""
+
+    name = 'sendinput'
+
+    def __init__(self, costed: CostedPyAutoGui):
+        self.costed = costed
+        self.builder = SendInputSender(user32=None)
+        self.build_ms = []
+
+    def send(self, actions):
+        started = time.perf_counter()
+        self.builder.events(actions)
+        self.build_ms.append((time.perf_counter() - started) * 1000)
+        costed = self.costed
+        costed.os_calls += 1
+        costed.clock.sleep(costed.call)
+        PyAutoGuiSender(costed.inner).send(actions)  # Действия в имитации окна
+
+
+def legacy_fallback(pyautogui, wait, country, phone_number: str):
+    """Прежний резервный путь enter_phone_number (поле номера - по Tab)"""
+    pyautogui.click(country[0], country[1], duration=0.1)
+    wait(0.4)
+    pyautogui.hotkey('ctrl', 'a')
+    wait(0.1)
+    pyautogui.press('delete')
+    wait(0.1)
+    pyautogui.write('7', interval=0.05)
+    wait(0.3)
+    pyautogui.press('enter')
+    wait(0.3)
+    pyautogui.press('tab')
+    wait(0.2)
+    pyautogui.hotkey('ctrl', 'a')
+    wait(0.1)
+    pyautogui.press('delete')
+    wait(0.1)
+    pyautogui.write(phone_number, interval=0.05)
+    wait(0.3)
+    pyautogui.press('enter')
+    wait(0.5)  # _await_screen без снимка экрана
+
+
+def run(path: str, pause: float, call: float) -> dict:
+    clock = VirtualClock()
+    desktop = SimulatedDesktop(call_latency=0).install()
+    window = desktop.add_window(1)
+    window.controls = [control for control in window.controls if control.control_type == 'Button']
+    costed = CostedPyAutoGui(desktop.pyautogui, clock, pause, call)
+    telegram_automation._pyautogui = costed
+    automation = TelegramAutomation(clock=clock)
+    sender = None
+
+    if path == 'legacy':
+        started = clock.monotonic()
+        waited = []
+
+        def wait(seconds):
+            waited.append(seconds)
+            clock.sleep(seconds)
+        legacy_fallback(costed, wait, (300, 300), PHONE[2:])
+        seconds = clock.monotonic() - started
+        result = True
+    else:
+        sender = ModelSendInput(costed) if path == 'batch/sendinput' else PyAutoGuiSender(costed)
+        telegram_automation._input_sender = sender
+        budget = deadline.Budget('phone', 60, clock=clock)
+        with budget.use():
+            result = automation.enter_phone_number(PHONE)
+        report = budget.finish('ok' if result else 'fail')
+        seconds = next(step['seconds'] for step in report['steps'] if step['step'] == 'enter_phone_number/pyautogui')
+        waited = [step['waited_s'] for step in report['steps'] if step['step'] == 'enter_phone_number/pyautogui']
+    build = percentiles(sender.build_ms) if isinstance(sender, ModelSendInput) else None
+    return {
+        'path': path,
+        'virtual s': seconds,
+        'result': 'ok' if result else 'fail',
+        'input calls': costed.os_calls,
+        'waits s': sum(waited),
+        'PAUSE s': costed.paused,
+        'build ms p50': build['p50'] if build else '-',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pause', type=float, default=0.35, help="pyautogui.PAUSE (в боте случайная 0.2-0.5 с)")
+    parser.add_argument('--call-ms', type=float, default=1.0, help="Цена одного вызова ОС для ввода (мс)")
+    args = parser.parse_args()
+    logging.getLogger('telegram_automation').setLevel(logging.CRITICAL)
+
+    rows = [run(path, args.pause, args.call_ms / 1000) for path in ('legacy', 'batch/pyautogui', 'batch/sendinput')]
+    print_table(f"Резервный ввод номера {PHONE}: PAUSE {args.pause} с, вызов ОС {args.call_ms} мс", rows)
+    sequence = InputSequence().click(300, 300).wait(0.4).hotkey('ctrl', 'a').press('delete').write('7')
+    sequence.press('enter').wait(0.3).press('tab').hotkey('ctrl', 'a').press('delete').write(PHONE[2:])
+    print_table("Куски пакетного ввода номера", [
+        {'segment': index + 1, 'actions': ', '.join(action[0] for action in actions),
+         'INPUT events': len(SendInputSender(None).events(actions)), 'wait after s': pause}
+        for index, (actions, pause) in enumerate(sequence.segments())])
+
+
+if __name__ == '__main__':
+    main()
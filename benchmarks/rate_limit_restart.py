@@ -0,0 +1,177 @@
+"""
+Снимок лимитов бота (rate_limit_store.py) против полного JSON-файла: запись, загрузка, размер.
+
+Состояние --users пользователей похоже на настоящее: у каждого 1-20 запросов за последний
+час, у части блокировка и входы за сегодня. Замеряются:
+
+- JSON: весь словарь переписывается каждый раз (и весь разбор при запуске);
+- SQLite WAL: первый полный снимок, затем снимки только отмеченных (--dirty %)
+  пользователей - отдельно сборка строк в цикле бота (collect) и запись в пуле (write);
+- загрузка при "перезапуске" в пустые словари и сверка с исходным состоянием;
+- обрыв процесса посреди записи снимка: прежний снимок читается целиком.
+
+Запуск: python benchmarks/rate_limit_restart.py --users 100000 --dirty 1
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import PROJECT_DIR, percentiles, print_table
+
+from rate_limit_store import RateLimitStore
+
+NOW = 1_700_000_000.0
+TODAY = date(2023, 11, 14)
+
+
+def make_state(users: int, rng: random.Random):
+    requests, blocked, daily, last_date = defaultdict(list), {}, defaultdict(int), {}
+    for user_id in range(10_000_000, 10_000_000 + users):
+        requests[user_id] = sorted(NOW - rng.uniform(0, 3500) for _ in range(rng.randint(1, 20)))
+        if rng.random() < 0.05:
+            blocked[user_id] = NOW + rng.uniform(60, 3600)
+        if rng.random() < 0.3:
+            daily[user_id] = rng.randint(1, 3)
+            last_date[user_id] = TODAY
+    return requests, blocked, daily, last_date
+
+
+def touch(state, users: list, rng: random.Random):
+    """Новые запросы у части пользователей (как после check_rate_limit)"""
+    requests = state[0]
+    for user_id in users:
+        requests[user_id].append(NOW + rng.uniform(0, 5))
+
+
+def json_dump(path: str, state):
+    requests, blocked, daily, last_date = state
+    payload = {
+        'requests': requests, 'blocked': blocked, 'daily': daily,
+        'last_date': {user_id: day.isoformat() for user_id, day in last_date.items()},
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(payload, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def json_load(path: str):
+    with open(path) as f:
+        payload = json.load(f)
+    requests = defaultdict(list, {int(k): v for k, v in payload['requests'].items()})
+    blocked = {int(k): v for k, v in payload['blocked'].items()}
+    daily = defaultdict(int, {int(k): v for k, v in payload['daily'].items()})
+    last_date = {int(k): date.fromisoformat(v) for k, v in payload['last_date'].items()}
+    return requests, blocked, daily, last_date
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def db_size(path: str) -> int:
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+def store_load(path: str):
+    state = (defaultdict(list), {}, defaultdict(int), {})
+    store = RateLimitStore(path, *state)
+    loaded = store.load(NOW + 10, TODAY)
+    store.close()
+    return loaded, state
+
+
+def same(a, b) -> bool:
+    return all(dict(x) == dict(y) for x, y in zip(a, b))
+
+
+CRASH_SCRIPT = """
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from rate_limit_store import RateLimitStore
+store = RateLimitStore(sys.argv[2], {}, {}, {}, {})
+conn = store._connect()
+conn.execute('BEGIN')
+conn.executemany('INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?, ?)',
+                 [(user_id, None, 0, None, None, b'') for user_id in range(10_000_000, 10_050_000)])
+os._exit(1)  # Обрыв до COMMIT
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000, help="Пользователей в состоянии лимитов")
+    parser.add_argument('--dirty', type=float, default=1.0, help="Процент пользователей, измененных между снимками")
+    parser.add_argument('--runs', type=int, default=5, help="Повторов снимков и загрузки")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    state = make_state(args.users, rng)
+    user_ids = list(state[0])
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'limits.json')
+        db_path = os.path.join(tmp, 'rate_limits.db')
+        store = RateLimitStore(db_path, *state)
+
+        json_save = [timed(json_dump, json_path, state)[0] for _ in range(args.runs)]
+        json_loads = [timed(json_load, json_path)[0] for _ in range(args.runs)]
+
+        for user_id in user_ids:
+            store.mark(user_id)
+        full_collect, (rows, deleted) = timed(store.collect)
+        full_ms = full_collect + timed(store.write, rows, deleted)[0]
+
+        collect, write = [], []
+        for _ in range(args.runs):
+            changed = rng.sample(user_ids, max(1, int(len(user_ids) * args.dirty / 100)))
+            touch(state, changed, rng)
+            for user_id in changed:
+                store.mark(user_id)
+            collect_ms, (rows, deleted) = timed(store.collect)
+            write_ms, _ = timed(store.write, rows, deleted)
+            collect.append(collect_ms)
+            write.append(write_ms)
+        store.close()
+
+        loads = []
+        for _ in range(args.runs):
+            load_ms, (loaded, restored) = timed(store_load, db_path)
+            loads.append(load_ms)
+
+        json_size = os.path.getsize(json_path)
+        sqlite_size = db_size(db_path)
+        print_table(f"Снимок лимитов: {args.users} пользователей, меняется {args.dirty}% между снимками", [
+            {'format': 'json (целиком)', 'snapshot p50 ms': percentiles(json_save)['p50'],
+             'on event loop ms': percentiles(json_save)['p50'], 'load p50 ms': percentiles(json_loads)['p50'],
+             'size KB': json_size // 1024},
+            {'format': 'sqlite wal (полный)', 'snapshot p50 ms': full_ms, 'on event loop ms': full_collect,
+             'load p50 ms': '-', 'size KB': '-'},
+            {'format': 'sqlite wal (измененные)',
+             'snapshot p50 ms': percentiles(collect)['p50'] + percentiles(write)['p50'],
+             'on event loop ms': percentiles(collect)['p50'], 'load p50 ms': percentiles(loads)['p50'],
+             'size KB': sqlite_size // 1024},
+        ])
+
+        # Обрыв посреди записи: транзакция не закоммичена - снимок тот же
+        subprocess.run([sys.executable, '-c', CRASH_SCRIPT, PROJECT_DIR, db_path], check=False)
+        after_crash, crashed = store_load(db_path)
+        print_table("Проверка", [
+            {'check': 'загрузка без потерь', 'users': loaded, 'ok': 'yes' if same(restored, state) else 'NO'},
+            {'check': 'обрыв до COMMIT', 'users': after_crash, 'ok': 'yes' if same(crashed, state) else 'NO'},
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Вход по записи настоящего окна: ui_recorder пишет, simulated_backend.ReplayWindow воспроизводит.
+
+С --recording воспроизводится готовая запись (UI_RECORD_DIR на Windows с Telegram Desktop).
+Без нее запись сначала делается здесь же на самодельном окне simulated_backend - так
+проверяется сам цикл запись -> воспроизведение.
+
+Действия записи повторяются по порядку той же TelegramAutomation (вводятся тестовые
+номер, код и пароль), паузы идут по виртуальным часам. Для каждого действия сравнивается
+результат и экран после него с записанными; воспроизведение выполняется дважды, и оба
+прогона должны совпасть (детерминизм).
+
+Запуск: python benchmarks/replay_login.py [--recording ui-20240101-120000-1234.jsonl]
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import print_table
+
+from clock import VirtualClock
+from simulated_backend import SimulatedDesktop
+from telegram_automation import TelegramAutomation
+from ui_recorder import Recording, UiTreeRecorder
+
+INPUTS = {
+    'enter_phone_number': ('+79991234567',),
+    'enter_code': ('12345',),
+    'enter_cloud_password': ('secret',),
+}
+LOGIN_STEPS = ('check_if_authorized', 'enter_phone_number', 'enter_code', 'check_cloud_password_needed',
+               'enter_cloud_password', 'check_if_authorized')
+
+
+def record(path: str):
+    """Запись входа на самодельном окне (облачный пароль включен)"""
+    desktop = SimulatedDesktop(call_latency=0).install()
+    desktop.add_window(1, cloud_password=True)
+    clock = VirtualClock()
+    automation = TelegramAutomation(clock=clock)
+    automation.tree_recorder = UiTreeRecorder(path, settle=2, clock=clock)
+    for name in LOGIN_STEPS:
+        getattr(automation, name)(*INPUTS.get(name, ()))
+
+
+def replay(recording: Recording) -> list:
+    desktop = SimulatedDesktop(call_latency=0).install()
+    clock = VirtualClock()
+    window = desktop.add_replay_window(1, recording, clock)
+    automation = TelegramAutomation(clock=clock)
+    steps = []
+    for action in recording.actions:
+        result = getattr(automation, action['name'])(*INPUTS.get(action['name'], ()))
+        # Задержки записи: следующее действие начинается не раньше, чем в записи
+        clock.sleep(action['delay'] or 0.0)
+        window._call()
+        steps.append({'result': result, 'screen': window.screen, 'virtual s': clock.elapsed,
+                      'ui calls': desktop.calls, 'entered': dict(window.entered)})
+    return steps
+
+
+def deterministic(step: dict, again: dict) -> bool:
+    """Число обращений к UI не сравнивается: backend-ы uia и win32 подключаются наперегонки"""
+    return all(step[key] == again[key] for key in ('result', 'screen', 'virtual s', 'entered'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', help="Файл записи ui_recorder (по умолчанию - записать на имитации)")
+    args = parser.parse_args()
+
+    logging.getLogger('telegram_automation').setLevel(logging.ERROR)
+    path = args.recording
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='ui-record-'), 'simulated.jsonl')
+        record(path)
+    recording = Recording.load(path)
+
+    first, second = replay(recording), replay(recording)
+    rows = []
+    for action, step, again in zip(recording.actions, first, second):
+        same = step['result'] == action['result'] and step['screen'] == action['after']
+        rows.append({
+            'action': action['name'],
+            'recorded': f"{action['result']} -> {action['after']}",
+            'replayed': f"{step['result']} -> {step['screen']}",
+            'delay s': action['delay'],
+            'virtual s': step['virtual s'],
+            'ui calls': step['ui calls'],
+            'result': ('ok' if same else 'DIFF') + ('' if deterministic(step, again) else ', nondeterministic'),
+        })
+    print_table(f"Воспроизведение {os.path.basename(path)}: {len(recording.screens)} экранов", rows)
+    if first:
+        print(f"\nОкно получило: {first[-1]['entered']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Замер ресурсов процессов Telegram: отдельные вызовы psutil против ResourceSampler (resource_sampler.py).
+
+- naive: на каждое значение свой вызов psutil.Process (cpu_percent, memory_info,
+  num_threads, дескрипторы), как если бы их читал каждый запрос списка сессий;
+- oneshot: один проход Process.oneshot() на процесс, CPU% по разнице с прошлым замером.
+
+Процессы Telegram - настоящие спящие процессы (simulated_backend.spawn_processes).
+В Linux значения читаются из разных файлов /proc и oneshot выигрывает мало; в Windows
+CPU-время, память, потоки и handles приходят одним системным вызовом. Главное в другом:
+замер идет раз в RESOURCE_SAMPLE_INTERVAL, а не в каждом запросе списка сессий.
+
+Запуск: python benchmarks/resource_sampling.py --sessions 5 --rounds 200
+"""
+import argparse
+import os
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+import psutil
+
+from resource_sampler import ResourceSampler
+from simulated_backend import spawn_processes, stop_processes
+
+
+def naive_sample() -> dict:
+    resources = {}
+    for proc in psutil.process_iter(['name']):
+        try:
+            if not proc.info['name'] or 'telegram' not in proc.info['name'].lower():
+                continue
+            resources[proc.pid] = {
+                'cpu_percent': proc.cpu_percent(),
+                'rss_mb': round(proc.memory_info().rss / 1024 / 1024, 1),
+                'threads': proc.num_threads(),
+                'handles': proc.num_handles() if os.name == 'nt' else proc.num_fds(),
+            }
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return resources
+
+
+def measure(name: str, sample, rounds: int) -> dict:
+    sample()  # Первый замер: база для CPU%
+    durations = []
+    cpu_before = psutil.Process().cpu_times()
+    for _ in range(rounds):
+        started = time.perf_counter()
+        sample()
+        durations.append(time.perf_counter() - started)
+    cpu_after = psutil.Process().cpu_times()
+    stats = percentiles(durations)
+    return {
+        'mode': name,
+        'p50 ms': stats['p50'] * 1000,
+        'p95 ms': stats['p95'] * 1000,
+        'cpu ms/sample': ((cpu_after.user + cpu_after.system) - (cpu_before.user + cpu_before.system))
+                         / rounds * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=5, help="Процессов Telegram")
+    parser.add_argument('--rounds', type=int, default=200, help="Замеров в каждом режиме")
+    args = parser.parse_args()
+
+    processes = spawn_processes(args.sessions)
+    try:
+        time.sleep(0.2)
+        sampler = ResourceSampler()
+        rows = [measure('naive', naive_sample, args.rounds), measure('oneshot', sampler.sample, args.rounds)]
+    finally:
+        stop_processes(processes)
+    print_table(f"Замер ресурсов {args.sessions} процессов Telegram", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Обнаружение смены экрана по dHash (screen_change.py) против фиксированных пауз резервного пути.
+
+Кадры синтетические (Pillow, экран входа из visual_match.py) и идут по виртуальным часам:
+детектор опрашивает "экран" каждые SCREEN_POLL_INTERVAL и получает кадр текущего момента.
+
+- advance: Enter на экране номера -> через --react секунд плавный переход (--fade) на экран кода;
+- auto_code: цифры кода вводятся по одной (мелкие изменения), после пятой - переход;
+- no_change: Enter ничего не сделал, мигает курсор и шумит сжатие - смены быть не должно.
+
+Для каждого сценария: что решил детектор, через сколько (виртуальных) секунд и насколько
+прежняя пауза (0.5 с после номера, 1 с после "Продолжить") раньше или позже настоящего
+перехода. Отдельно - стоимость хэша кадра разных размеров и расстояния в битах.
+
+С --frames DIR вместо синтетики берутся снятые кадры (PNG по порядку имен): печатаются
+расстояния между соседними кадрами и кадр, на котором детектор увидит смену.
+
+Запуск: python benchmarks/screen_change_frames.py --react 0.3 --fade 0.2
+"""
+import argparse
+import os
+import random
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+from PIL import Image, ImageDraw
+
+from clock import VirtualClock
+from screen_change import HASH_SIZE, SCREEN_CHANGE_BITS, ScreenChangeDetector, dhash, distance
+from visual_match import draw_login_screen
+
+WIDTH, HEIGHT = 800, 600
+
+
+def code_screen(width, height, digits: str = ''):
+    scene = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(scene)
+    draw.text((width // 2 - 70, height // 6), "Enter the code we sent", fill=(0, 0, 0))
+    draw.text((width // 2 - 90, height // 6 + 24), "to your Telegram app", fill=(120, 120, 120))
+    box = (width // 2 - 100, height // 3, width // 2 + 100, height // 3 + 36)
+    draw.rectangle(box, outline=(200, 200, 200), width=2)
+    draw.text((box[0] + 8, box[1] + 12), digits or "Code", fill=(0, 0, 0) if digits else (120, 120, 120))
+    draw.rounded_rectangle((width // 2 - 110, height - 170, width // 2 + 110, height - 126), radius=8,
+                           fill=(51, 144, 236))
+    return scene
+
+
+def with_caret(scene, t: float, rng: random.Random):
+    """Мигающий курсор (0.5 с) и легкий шум, как у снимка экрана со сглаживанием"""
+    frame = scene.copy()
+    draw = ImageDraw.Draw(frame)
+    if int(t / 0.5) % 2 == 0:
+        draw.line((WIDTH // 2 + 60, HEIGHT // 4 + 26, WIDTH // 2 + 60, HEIGHT // 4 + 50), fill=(0, 0, 0), width=2)
+    for _ in range(40):
+        x, y = rng.randrange(WIDTH), rng.randrange(HEIGHT)
+        frame.putpixel((x, y), tuple(max(0, c - rng.randrange(12)) for c in frame.getpixel((x, y))))
+    return frame
+
+
+def transition(start, end, t: float, at: float, fade: float):
+    if t < at:
+        return start
+    if t >= at + fade or fade <= 0:
+        return end
+    return Image.blend(start, end, (t - at) / fade)
+
+
+def scenarios(react: float, fade: float):
+    """Сценарий: (имя, кадр(t), момент окончания перехода или None, прежняя пауза)"""
+    phone, _ = draw_login_screen(WIDTH, HEIGHT)
+    code = code_screen(WIDTH, HEIGHT)
+    rng = random.Random(1)
+
+    def advance(t):
+        return with_caret(transition(phone, code, t, react, fade), t, rng)
+
+    def auto_code(t):
+        # Цифры каждые 0.15 с, после пятой - переход к следующему экрану (облачный пароль)
+        typed = min(5, int(t / 0.15))
+        if typed < 5:
+            return with_caret(code_screen(WIDTH, HEIGHT, '12345'[:typed]), t, rng)
+        return with_caret(transition(code_screen(WIDTH, HEIGHT, '12345'), phone, t, 0.75 + react, fade), t, rng)
+
+    def no_change(t):
+        return with_caret(phone, t, rng)
+
+    return [
+        ('advance', advance, react + fade, 0.5),
+        ('auto_code', auto_code, 0.75 + react + fade, 1.0),
+        ('no_change', no_change, None, 0.5),
+    ]
+
+
+def run_scenario(name, frame_at, settled_at, old_wait) -> dict:
+    clock = VirtualClock()
+    detector = ScreenChangeDetector(capture=lambda bbox: frame_at(clock.elapsed), clock=clock)
+    before = detector.hash(None)
+    changed = detector.wait_change(None, before)
+    return {
+        'scenario': name,
+        'changed': 'yes' if changed else 'no',
+        'expected': 'yes' if settled_at is not None else 'no',
+        'detected s': clock.elapsed,
+        'screen ready s': settled_at,
+        'old wait s': old_wait,
+        'old wait': ('too early' if old_wait < settled_at else 'ok') if settled_at is not None else 'assumed ok',
+        'polls': round(clock.elapsed / detector.poll) + 1,
+    }
+
+
+def hash_cost(runs: int) -> list:
+    rows = []
+    for width, height in ((800, 600), (1280, 800), (1920, 1080)):
+        scene, _ = draw_login_screen(width, height)
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            dhash(scene)
+            samples.append((time.perf_counter() - started) * 1000)
+        stats = percentiles(samples)
+        rows.append({'frame': f'{width}x{height}', 'p50 ms': stats['p50'], 'p95 ms': stats['p95']})
+    return rows
+
+
+def distances() -> list:
+    phone, _ = draw_login_screen(WIDTH, HEIGHT)
+    code = code_screen(WIDTH, HEIGHT)
+    rng = random.Random(2)
+    base = dhash(phone)
+    pairs = {
+        'caret + noise': dhash(with_caret(phone, 0.2, rng)),
+        'one code digit': distance(dhash(code_screen(WIDTH, HEIGHT)), dhash(code_screen(WIDTH, HEIGHT, '1'))),
+        'half-way fade': dhash(Image.blend(phone, code, 0.5)),
+        'phone -> code': dhash(code),
+    }
+    return [{'change': name, 'bits': value if name == 'one code digit' else distance(base, value),
+             'threshold': SCREEN_CHANGE_BITS} for name, value in pairs.items()]
+
+
+def from_frames(directory: str):
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith('.png'))
+    hashes = [dhash(Image.open(os.path.join(directory, name))) for name in names]
+    rows = []
+    for index in range(1, len(names)):
+        bits = distance(hashes[index], hashes[0])
+        rows.append({'frame': names[index], 'vs previous': distance(hashes[index], hashes[index - 1]),
+                     'vs first': bits, 'changed': 'yes' if bits > SCREEN_CHANGE_BITS else ''})
+    print_table(f"Снятые кадры {directory} (порог {SCREEN_CHANGE_BITS} бит)", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--react', type=float, default=0.3, help="Через сколько секунд окно начинает переход")
+    parser.add_argument('--fade', type=float, default=0.2, help="Длительность анимации перехода (секунды)")
+    parser.add_argument('--runs', type=int, default=50, help="Замеров стоимости хэша")
+    parser.add_argument('--frames', help="Каталог снятых кадров PNG")
+    args = parser.parse_args()
+
+    if args.frames:
+        from_frames(args.frames)
+        return
+    rows = [run_scenario(*scenario) for scenario in scenarios(args.react, args.fade)]
+    print_table(f"Смена экрана: реакция {args.react} с, анимация {args.fade} с", rows)
+    print_table("Расстояние от экрана номера, бит из %d" % (HASH_SIZE * HASH_SIZE), distances())
+    print_table("Стоимость хэша кадра", hash_cost(args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Исходящие сообщения под нагрузкой: прямые вызовы Bot API против планировщика (send_scheduler.py).
+
+Бот работает против bot_api_stub.py с лимитами Telegram (сообщений в чат и всего за секунду,
+лишние получают 429 с retry_after) и задержкой сети на каждый вызов. Пользователи одновременно
+быстро нажимают кнопки клавиатуры ввода кода; последнее нажатие каждого оставляет код 123.
+
+- direct: прежнее поведение - вызов сразу, RetryAfter теряет сообщение;
+- scheduler: очередь с ведрами токенов, повтором после RetryAfter и заменой устаревших правок.
+
+Считается: сколько нажатий в секунду обработал бот, сколько вызовов потеряно,
+у скольких пользователей на экране итоговое состояние клавиатуры и когда оно появилось.
+
+Запуск: python benchmarks/send_flood.py --users 20 --taps 13 --latency 0 0.03
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import print_table
+
+from telegram.error import NetworkError, TimedOut
+
+import bot
+from bot_api_stub import BotApiStub
+from send_scheduler import SEND_TOTAL, SendScheduler
+from bot_transport import InstantAutomation
+
+TAPS = ('code_1', 'code_2', 'code_3', 'code_4', 'code_clear')
+
+
+class DirectSender:
+    """Прежняя отправка: сразу, повтор только при TimedOut/NetworkError, остальное теряется"""
+
+    def __init__(self):
+        self.failed = 0
+
+    async def send(self, chat_id, call, priority=None, key=None, max_retries=3, wait=True):
+        for attempt in range(max_retries):
+            try:
+                return await call()
+            except (TimedOut, NetworkError):
+                if attempt == max_retries - 1:
+                    self.failed += 1
+                    raise
+                await asyncio.sleep(1)
+            except Exception:
+                self.failed += 1
+                raise
+
+    async def drain(self, timeout=5.0):
+        return True
+
+    def pending(self):
+        return 0
+
+
+def expected_text(taps: int) -> str:
+    code = ''
+    for i in range(taps):
+        data = TAPS[i % len(TAPS)]
+        code = '' if data == 'code_clear' else code + data.split('_')[1]
+    return f"`{code + '•' * (5 - len(code))}`"
+
+
+async def run_mode(mode: str, users: int, taps: int, interval: float, latency: float, flood_every: int) -> dict:
+    stub = BotApiStub(port=0).start()
+    stub.latency = latency
+    stub.chat_limit, stub.global_limit, stub.flood_every = 4, 30, flood_every
+    if mode == 'direct':
+        bot.outbound = DirectSender()
+    else:
+        bot.outbound = SendScheduler(global_rate=bot.SEND_GLOBAL_RATE, chat_rate=bot.SEND_CHAT_RATE,
+                                     chat_burst=bot.SEND_CHAT_BURST)
+    failed_before = SEND_TOTAL.value(outcome='failed')
+    application = bot.build_application('123456:STUB', run_mode='polling', base_url=stub.base_url)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10, drop_pending_updates=True)
+    user_ids = [500000 + i for i in range(users)]
+    try:
+        # Все пользователи доходят до клавиатуры ввода кода
+        for user_id in user_ids:
+            stub.message_update(user_id, '/start')
+            stub.message_update(user_id, '+79991234567')
+        await asyncio.sleep(1.0)
+        while bot.outbound.pending():
+            await asyncio.sleep(0.05)
+
+        since = time.monotonic()
+        for i in range(taps):
+            for user_id in user_ids:
+                stub.callback_update(user_id, TAPS[i % len(TAPS)])
+            await asyncio.sleep(interval)
+        pushed = time.monotonic()
+
+        # Ждем, пока бот ответит на все нажатия, очередь опустеет и у всех появится итоговое состояние
+        expected = expected_text(taps)
+        settled = idle_since = None
+        while time.monotonic() < pushed + 120:
+            now = time.monotonic()
+            final = sum(1 for user_id in user_ids if expected in stub.chat_state.get((user_id, 1), ''))
+            answered = stub.calls_by_method().get('answerCallbackQuery', 0)
+            if answered >= users * taps and not bot.outbound.pending():
+                if final == users:
+                    settled = now
+                    break
+                idle_since = idle_since or now
+                if now - idle_since > 3:
+                    break  # Бот все обработал, но часть итоговых правок потеряна
+            await asyncio.sleep(0.02)
+        handled = [at for at, method, _ in stub.calls if method == 'answerCallbackQuery' and at >= since]
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        stub.stop()
+
+    if mode == 'direct':
+        dropped = bot.outbound.failed
+    else:
+        dropped = SEND_TOTAL.value(outcome='failed') - failed_before
+    duration = (max(handled) - since) if handled else float('nan')
+    return {
+        'mode': mode,
+        'latency ms': latency * 1000,
+        'taps': users * taps,
+        'taps/s handled': len(handled) / duration if handled else 0.0,
+        '429 responses': stub.flood_responses,
+        'dropped': int(dropped),
+        'final state': f'{final}/{users}',
+        'settle s': (settled - pushed) if settled else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help="Одновременных пользователей")
+    parser.add_argument('--taps', type=int, default=13, help="Нажатий на пользователя")
+    parser.add_argument('--interval', type=float, default=0.1, help="Пауза между нажатиями (секунды)")
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.0, 0.03],
+                        help="Задержка сети на вызов Bot API (секунды), можно несколько")
+    parser.add_argument('--flood-every', type=int, default=0, help="Дополнительно: каждый N-й вызов получает 429")
+    args = parser.parse_args()
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    bot.automation = InstantAutomation()
+    bot.MIN_DELAY = bot.MAX_DELAY = 0.0
+    bot.MAX_REQUESTS_PER_MINUTE = bot.MAX_REQUESTS_PER_HOUR = 10 ** 6
+    bot.MAX_LOGINS_PER_DAY = 10 ** 6
+
+    rows = [asyncio.run(run_mode(mode, args.users, args.taps, args.interval, latency, args.flood_every))
+            for latency in args.latency for mode in ('direct', 'scheduler')]
+    print_table(f"Нажатия клавиатуры при лимитах Telegram ({args.users} пользователей)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Выборка полей /api/sessions (?fields=) и ленивые пробы окон (session_probe.py).
+
+Процессы Telegram настоящие, спящие, окна - simulated_backend с задержкой каждого
+обращения (--latency, как межпроцессный вызов UIA). Для каждого вида запроса:
+
+- cold: первый запрос после запуска (снимок устарел, проб еще не было);
+- warm: тот же запрос сразу после - снимок и пробы свежие;
+- stale: снимок устарел (прошло SESSIONS_CACHE_TTL), пробы еще свежие (SESSION_PROBE_TTL) -
+  обычное обновление открытой панели.
+
+Считаются время ответа и обращения к окнам. Для сравнения - прежний опрос
+get_telegram_sessions: подключение, проверка авторизации и текст окна для всех сессий
+на каждое обновление снимка, какие бы поля ни были нужны.
+
+Запуск: python benchmarks/session_fields.py --sessions 5 --latency 0.002
+"""
+import argparse
+import logging
+import os
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import print_table
+
+from simulated_backend import SimulatedDesktop, spawn_processes, stop_processes
+
+VIEWS = (
+    ('/api/status', 'счетчики'),
+    ('/api/sessions?fields=pid,name,started', 'компактный список'),
+    ('/api/sessions?fields=pid,status', 'статус входа'),
+    ('/api/sessions?fields=pid,phone', 'номера'),
+    ('/api/sessions', 'все поля (панель)'),
+)
+
+
+def reset(web_app):
+    """Как после запуска: снимок устарел, кэш проб пуст"""
+    web_app.prober._entries.clear()
+    web_app.snapshot.apply([])
+    web_app.snapshot.loaded_at = 0.0
+
+
+def measure(desktop, call) -> tuple:
+    calls = desktop.calls
+    started = time.perf_counter()
+    result = call()
+    return (time.perf_counter() - started) * 1000, desktop.calls - calls, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=5, help="Окон Telegram на рабочем столе")
+    parser.add_argument('--latency', type=float, default=0.002, help="Задержка каждого обращения к окну (секунды)")
+    args = parser.parse_args()
+
+    os.environ.pop('INVENTORY_ADDR', None)
+    os.environ['RESOURCE_SAMPLE_INTERVAL'] = '0'
+    logging.getLogger().addHandler(logging.NullHandler())
+
+    processes = spawn_processes(args.sessions)
+    try:
+        desktop = SimulatedDesktop(call_latency=args.latency).install()
+        for index, proc in enumerate(processes):
+            desktop.add_window(proc.pid, authorized=index % 2 == 0)
+
+        import web_app
+        client = web_app.app.test_client()
+        rows = []
+        for url, view in VIEWS:
+            reset(web_app)
+            cold_ms, cold_calls, response = measure(desktop, lambda: client.get(url))
+            warm_ms, warm_calls, _ = measure(desktop, lambda: client.get(url))
+            web_app.snapshot.loaded_at = 0.0
+            stale_ms, stale_calls, _ = measure(desktop, lambda: client.get(url))
+            sample = response.get_json()
+            rows.append({'view': view, 'request': url, 'cold ms': cold_ms, 'cold UI calls': cold_calls,
+                         'warm ms': warm_ms, 'warm UI calls': warm_calls,
+                         'stale ms': stale_ms, 'stale UI calls': stale_calls,
+                         'sample': sample['sessions'][0] if 'sessions' in sample else sample})
+        legacy_ms, legacy_calls, _ = measure(desktop, web_app.get_telegram_sessions)
+        # Прежде любой запрос при устаревшем снимке опрашивал все окна целиком
+        rows.append({'view': 'прежний опрос', 'request': 'get_telegram_sessions()', 'cold ms': legacy_ms,
+                     'cold UI calls': legacy_calls, 'warm ms': '-', 'warm UI calls': '-',
+                     'stale ms': legacy_ms, 'stale UI calls': legacy_calls,
+                     'sample': 'любой запрос при устаревшем снимке'})
+        print_table(f"Запросы панели: {args.sessions} окон, обращение к окну {args.latency * 1000:.0f} мс",
+                    [{key: value for key, value in row.items() if key != 'sample'} for row in rows])
+        print_table("Пример ответа (первая сессия)", [{'view': row['view'], 'sample': row['sample']} for row in rows])
+    finally:
+        stop_processes(processes)
+
+
+if __name__ == '__main__':
+    main()
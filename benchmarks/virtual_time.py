@@ -0,0 +1,144 @@
+"""
+Диалог входа и лимиты бота в виртуальном времени (clock.VirtualClock).
+
+Паузы human_delay, ожидания окна Telegram и окна лимитов (минута, час, сутки, блокировка
+на час) идут по виртуальным часам, поэтому сценарии, которые заняли бы минуты и сутки,
+выполняются за доли секунды:
+
+- conversation: /start -> номер -> 5 нажатий клавиатуры -> облачный пароль, через заглушку
+  Bot API; TelegramAutomation работает с simulated_backend и проверяется, что окно
+  получило номер, код и пароль и перешло к чатам, а воронка входа (login_funnel) -
+  что диалог прошел все состояния и закончился входом;
+- minute_block: 6-й запрос за минуту блокирует на час, через час доступ возвращается;
+- hour_limit: 21-й запрос за час (не чаще лимита в минуту) блокирует;
+- day_rollover: 4-я попытка входа за день отклоняется, после полуночи разрешена.
+
+Запуск: python benchmarks/virtual_time.py
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import print_table
+
+import bot
+from bot_api_stub import BotApiStub
+from clock import VirtualClock
+from send_scheduler import SendScheduler
+from simulated_backend import SimulatedDesktop
+from telegram_automation import TelegramAutomation
+
+
+def use_clock(clock: VirtualClock):
+    """Переводит бот, автоматизацию и очередь отправки на виртуальные часы"""
+    bot.clock = clock
+    bot.automation = TelegramAutomation(clock=clock)
+    bot.outbound = SendScheduler(global_rate=bot.SEND_GLOBAL_RATE, chat_rate=bot.SEND_CHAT_RATE,
+                                 chat_burst=bot.SEND_CHAT_BURST, clock=clock)
+
+
+async def conversation(clock: VirtualClock):
+    desktop = SimulatedDesktop(call_latency=0).install()
+    window = desktop.add_window(1, cloud_password=True)
+    stub = BotApiStub(port=0).start()
+    application = bot.build_application('123456:STUB', run_mode='polling', base_url=stub.base_url)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10, drop_pending_updates=True)
+    loop = asyncio.get_running_loop()
+    user_id = 700001
+
+    async def step(push, method, text):
+        since = time.monotonic()
+        push()
+        at = await loop.run_in_executor(
+            None, lambda: stub.wait_for_call(method, since, timeout=5,
+                                             predicate=lambda params: text in params.get('text', '')))
+        if at is None:
+            raise AssertionError(f"бот не ответил {text!r}")
+
+    try:
+        await step(lambda: stub.message_update(user_id, '/start'), 'sendMessage', 'Отправь мне номер')
+        await step(lambda: stub.message_update(user_id, '+79991234567'), 'sendMessage', 'Номер введен')
+        for digit in '1234':
+            await step(lambda: stub.callback_update(user_id, f'code_{digit}'), 'editMessageText', 'Осталось')
+        await step(lambda: stub.callback_update(user_id, 'code_5'), 'editMessageText', 'дополнительная проверка')
+        await step(lambda: stub.message_update(user_id, 'secret'), 'sendMessage', 'Проверь Telegram')
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        stub.stop()
+
+    expected = {'phone': '79991234567', 'code': '12345', 'password': 'secret'}
+    if window.entered != expected or window.screen != 'chats':
+        raise AssertionError(f"окно получило {window.entered}, экран {window.screen}")
+    exits = {state['state']: state['exits'] for state in bot.funnel.summary(clock.monotonic())['states']}
+    if exits != {'start': {'phone': 1}, 'phone': {'code': 1}, 'code': {'password': 1}, 'password': {'logged_in': 1}}:
+        raise AssertionError(f"воронка входа: {exits}")
+    return "номер, код и пароль введены"
+
+
+async def minute_block(clock: VirtualClock):
+    user_id = 700002
+    for _ in range(bot.MAX_REQUESTS_PER_MINUTE):
+        assert bot.check_rate_limit(user_id)[0]
+        clock.sleep(5)
+    assert not bot.check_rate_limit(user_id)[0], "лимит в минуту не сработал"
+    clock.sleep(bot.BLOCK_DURATION - 60)
+    assert not bot.check_rate_limit(user_id)[0], "блокировка снята раньше часа"
+    clock.sleep(120)
+    assert bot.check_rate_limit(user_id)[0], "блокировка не снята через час"
+    return "блокировка на час и снятие"
+
+
+async def hour_limit(clock: VirtualClock):
+    user_id = 700003
+    for _ in range(bot.MAX_REQUESTS_PER_HOUR):
+        assert bot.check_rate_limit(user_id)[0]
+        clock.sleep(55 * 60 / bot.MAX_REQUESTS_PER_HOUR)
+    assert not bot.check_rate_limit(user_id)[0], "лимит в час не сработал"
+    return f"{bot.MAX_REQUESTS_PER_HOUR + 1}-й запрос за час отклонен"
+
+
+async def day_rollover(clock: VirtualClock):
+    user_id = 700004
+    for _ in range(bot.MAX_LOGINS_PER_DAY):
+        assert bot.check_rate_limit(user_id, is_login_attempt=True)[0]
+        clock.sleep(20 * 60)
+    allowed, message = bot.check_rate_limit(user_id, is_login_attempt=True)
+    assert not allowed and 'в день' in message, "дневной лимит входов не сработал"
+    tomorrow = datetime.combine(clock.now().date() + timedelta(days=1), datetime.min.time())
+    clock.sleep((tomorrow - clock.now()).total_seconds() + 60)
+    assert bot.check_rate_limit(user_id, is_login_attempt=True)[0], "после полуночи вход не разрешен"
+    return "после полуночи счетчик сброшен"
+
+
+def main():
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    rows = []
+    total_started = time.perf_counter()
+    for scenario in (conversation, minute_block, hour_limit, day_rollover):
+        clock = VirtualClock(start=datetime(2024, 1, 1, 21, 0, 0))
+        use_clock(clock)
+        started = time.perf_counter()
+        try:
+            detail = asyncio.run(scenario(clock))
+            result = 'ok'
+        except AssertionError as e:
+            detail, result = str(e), 'FAIL'
+        rows.append({
+            'scenario': scenario.__name__,
+            'virtual s': clock.elapsed,
+            'wall ms': (time.perf_counter() - started) * 1000,
+            'result': result,
+            'detail': detail,
+        })
+    print_table("Сценарии в виртуальном времени", rows)
+    print(f"\nВсего: {(time.perf_counter() - total_started) * 1000:.0f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Поиск элементов по шаблону: точность и время первого поиска против поиска из кэша.
+
+Снимок окна синтетический (Pillow): экран входа с полями кода страны и номера, полем кода
+и кнопкой "Продолжить". Шаблоны вырезаются из него, элементы сдвигаются относительно
+долей окна, которыми раньше пользовался pyautogui, - видно, насколько те промахиваются.
+
+Запуск: python benchmarks/visual_match.py --width 800 --height 600 --runs 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+from PIL import Image, ImageDraw
+
+import visual_locator
+from visual_locator import VisualLocator
+
+
+class FakeRect:
+    def __init__(self, left, top, width, height):
+        self.left, self.top = left, top
+        self.right, self.bottom = left + width, top + height
+
+    def width(self):
+        return self.right - self.left
+
+    def height(self):
+        return self.bottom - self.top
+
+
+class FakeWindow:
+    """Окно с прямоугольником и PID - все, что нужно VisualLocator"""
+
+    def __init__(self, rect):
+        self._rect = rect
+        self.handle = 0
+
+    def rectangle(self):
+        return self._rect
+
+    def process_id(self):
+        return os.getpid()
+
+
+def draw_login_screen(width, height):
+    """Снимок экрана входа и прямоугольники элементов"""
+    scene = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(scene)
+    draw.text((width // 2 - 60, height // 6), "Your phone number", fill=(0, 0, 0))
+    boxes = {
+        'country_field': (width // 2 - 150, height // 4 + 20, width // 2 - 90, height // 4 + 56),
+        'phone_field': (width // 2 - 80, height // 4 + 20, width // 2 + 150, height // 4 + 56),
+        'code_field': (width // 2 - 100, height // 2 + 60, width // 2 + 100, height // 2 + 96),
+        'continue_button': (width // 2 - 110, height - 170, width // 2 + 110, height - 126),
+    }
+    for name, box in boxes.items():
+        if name == 'continue_button':
+            draw.rounded_rectangle(box, radius=8, fill=(51, 144, 236))
+            draw.text((box[0] + 80, box[1] + 16), "NEXT", fill=(255, 255, 255))
+        else:
+            draw.rectangle(box, outline=(200, 200, 200), width=2)
+            draw.line((box[0] + 4, box[3] - 3, box[2] - 4, box[3] - 3), fill=(51, 144, 236), width=2)
+            labels = {'country_field': "+7", 'phone_field': "--- --- -- --", 'code_field': "Code"}
+            draw.text((box[0] + 8, box[1] + 12), labels[name], fill=(120, 120, 120))
+    return scene, boxes
+
+
+def old_guess(target, rect):
+    """Доли окна из прежнего резервного пути"""
+    if target == 'country_field':
+        return rect.left + rect.width() // 4, rect.top + rect.height() // 3
+    if target == 'phone_field':
+        return rect.left + rect.width() // 2, rect.top + rect.height() // 3 + 30
+    if target == 'code_field':
+        return rect.left + rect.width() // 2, rect.top + rect.height() // 2
+    return rect.left + rect.width() // 2, rect.top + rect.height() - 100
+
+
+def inside(point, box, rect):
+    x, y = point[0] - rect.left, point[1] - rect.top
+    return box[0] <= x <= box[2] and box[1] <= y <= box[3]
+
+
+def no_capture(left, top, right, bottom):
+    raise AssertionError("снимок не нужен: точка должна браться из кэша")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=600)
+    parser.add_argument('--runs', type=int, default=20, help="Поисков из кэша на цель")
+    args = parser.parse_args()
+
+    scene, boxes = draw_login_screen(args.width, args.height)
+    rect = FakeRect(100, 50, args.width, args.height)
+    window = FakeWindow(rect)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, box in boxes.items():
+            scene.crop(box).save(os.path.join(workdir, f'{name}.png'))
+        locator = VisualLocator(templates_dir=workdir, cache_file=os.path.join(workdir, 'cache.json'))
+        capture = lambda left, top, right, bottom: scene  # noqa: E731
+
+        rows = []
+        for name, box in boxes.items():
+            started = time.perf_counter()
+            point = locator.locate(name, window, capture=capture)
+            cold_ms = (time.perf_counter() - started) * 1000
+            samples = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                locator.locate(name, window, capture=capture)
+                samples.append((time.perf_counter() - started) * 1000)
+            rows.append({
+                'target': name,
+                'first ms': cold_ms,
+                'cached p50 ms': percentiles(samples)['p50'],
+                'template hit': 'yes' if point and inside(point, box, rect) else 'NO',
+                'old fraction hit': 'yes' if inside(old_guess(name, rect), box, rect) else 'no',
+            })
+        # Новый экземпляр читает точки из файла - сравнение не повторяется
+        reloaded = VisualLocator(templates_dir=workdir, cache_file=os.path.join(workdir, 'cache.json'))
+        reloaded_hit = reloaded.locate('continue_button', window, capture=no_capture) is not None
+
+    print_table(f"Поиск по шаблону (окно {args.width}x{args.height}, уменьшение x{visual_locator.VISUAL_DOWNSCALE})", rows)
+    print(f"Точка из файла кэша после перезапуска: {'да' if reloaded_hit else 'нет'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,565 @@
+"""
+Нагрузка на API панели (web_app.py) от многих одновременных клиентов.
+
+Веб-приложение работает в этом процессе на том же многопоточном сервере werkzeug, что и
+app.run (поток на запрос), окна - simulated_backend, процессы Telegram настоящие, спящие.
+Клиенты ведут себя как открытая панель: список и счетчики с If-None-Match, иногда
+"Обновить" (?refresh=1), подключение и отключение случайной сессии.
+
+Считается:
+- задержка по маршрутам (p50/p95/p99) и доля ошибок (4xx/5xx, обрывы);
+- конкуренция за блокировки: автоматизации (_ui_lock) и снимка сессий (_lock,
+  _refresh_lock) - сколько захватов ждали, сколько ждали и сколько держали;
+- найденные гонки:
+  - telegram_window подменен другим запросом между записью и чтением в одном запросе;
+  - обращение к окну, пока _ui_lock держит другой поток;
+  - счетчики снимка разошлись со списком сессий;
+  - подключение к PID активировало окно другого процесса.
+
+С --server async та же нагрузка идет на web_async.py (tornado, блокирующая работа в
+ограниченном пуле), с --server both - на оба по очереди с таблицей задержек рядом и
+пиком потоков и памяти процесса. --idle N добавляет соединения, которые начали запрос
+и молчат: werkzeug держит на каждом поток, tornado - только сокет.
+
+Запуск: python benchmarks/web_load.py --clients 16 --duration 10 --sessions 3 [--server both --idle 100]
+"""
+import argparse
+import asyncio
+import http.client
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import common  # noqa: F401  (добавляет корень проекта в sys.path)
+from common import percentiles, print_table
+
+import psutil
+from werkzeug.serving import make_server
+
+from simulated_backend import SimulatedDesktop, spawn_processes, stop_processes
+
+# Операции клиента и их доли
+OPERATIONS = (
+    ('GET /api/sessions', 40),
+    ('GET /api/status', 30),
+    ('GET /api/sessions?refresh=1', 10),
+    ('POST /api/connect/<pid>', 10),
+    ('POST /api/disconnect/<pid>', 10),
+    ('GET /', 5),
+    ('GET /metrics', 5),
+)
+
+
+class TimedLock:
+    """Обертка Lock/RLock: считает захваты с ожиданием, время ожидания и удержания, знает владельца"""
+
+    def __init__(self, name: str, inner):
+        self.name = name
+        self._inner = inner
+        self.owner = None
+        self._depth = 0
+        self._acquired_at = 0.0
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.waits: List[float] = []
+        self.holds: List[float] = []
+
+    def reset(self):
+        with self._stats_lock:
+            self.acquisitions = 0
+            self.contended = 0
+            self.waits = []
+            self.holds = []
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        waited = 0.0
+        if not self._inner.acquire(blocking=False):
+            if not blocking:
+                return False
+            started = time.perf_counter()
+            if not self._inner.acquire(True, timeout):
+                return False
+            waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.acquisitions += 1
+            if waited:
+                self.contended += 1
+                self.waits.append(waited)
+        if self._depth == 0:
+            self._acquired_at = time.perf_counter()
+        self.owner = threading.get_ident()
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            held = time.perf_counter() - self._acquired_at
+            self.owner = None
+            with self._stats_lock:
+                self.holds.append(held)
+        self._inner.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def row(self, duration: float) -> dict:
+        waits = percentiles(self.waits)
+        return {
+            'lock': self.name,
+            'acquired': self.acquisitions,
+            'contended %': 100.0 * self.contended / self.acquisitions if self.acquisitions else 0.0,
+            'wait p95 ms': waits.get('p95', 0.0) * 1000,
+            'wait max ms': waits.get('max', 0.0) * 1000,
+            'wait total s': sum(self.waits),
+            'held %': 100.0 * sum(self.holds) / duration,
+        }
+
+
+class RaceWatch:
+    """Ищет гонки вокруг общего объекта автоматизации и снимка сессий"""
+
+    def __init__(self, desktop: SimulatedDesktop, ui_lock: TimedLock):
+        self.desktop = desktop
+        self.ui_lock = ui_lock
+        self.local = threading.local()
+        self.findings: Dict[tuple, int] = Counter()
+        self.examples: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.findings.clear()
+            self.examples.clear()
+
+    # --- Запрос ---
+
+    def begin(self, route: str):
+        self.local.route = route
+        self.local.wrote = False
+        self.local.mine = None
+        self.local.last = None
+        self.local.flagged = set()
+
+    def end(self):
+        self.local.route = None
+
+    def flag(self, kind: str, example: str):
+        route = getattr(self.local, 'route', None) or '-'
+        if kind in getattr(self.local, 'flagged', ()):
+            return  # Одна находка каждого вида на запрос
+        if hasattr(self.local, 'flagged'):
+            self.local.flagged.add(kind)
+        with self._lock:
+            self.findings[(kind, route)] += 1
+            self.examples.setdefault((kind, route), example)
+
+    # --- telegram_window ---
+
+    def watch_window(self, automation):
+        """Перехватывает чтение и запись automation.telegram_window"""
+        watch = self
+
+        class WatchedAutomation(type(automation)):
+            @property
+            def telegram_window(self):
+                return watch.read(self.__dict__.get('_watched_window'))
+
+            @telegram_window.setter
+            def telegram_window(self, value):
+                self.__dict__['_watched_window'] = value
+                watch.write(value)
+
+        value = automation.__dict__.pop('telegram_window', None)
+        automation.__class__ = WatchedAutomation
+        automation.__dict__['_watched_window'] = value
+
+    def read(self, value):
+        local = self.local
+        if getattr(local, 'route', None) is None:
+            return value
+        if local.wrote and value is not local.mine:
+            self.flag('telegram_window подменен другим запросом',
+                      f"записано окно {_pid(local.mine)}, прочитано {_pid(value)}")
+        local.last = value
+        return value
+
+    def write(self, value):
+        if getattr(self.local, 'route', None) is not None:
+            self.local.wrote = True
+            self.local.mine = value
+            self.local.last = value
+
+    # --- Окна ---
+
+    def check_ui_lock(self, what: str):
+        owner = self.ui_lock.owner
+        if owner is not None and owner != threading.get_ident():
+            self.flag('обращение к окну под чужим _ui_lock', f"{what}, пока окно занято другим запросом")
+
+    def watch_desktop(self, *modules):
+        """
+        Каждое обращение к окну: не держит ли _ui_lock в это время другой поток
+
+        Подключение (attach) проверяется в потоке запроса, в modules: само оно идет
+        в рабочих потоках window_attach, которые не знают, под чьей блокировкой их запустили.
+        """
+        pay = self.desktop.pay
+
+        def checked_pay():
+            if getattr(self.local, 'route', None) is not None:
+                self.check_ui_lock("вызов окна")
+            pay()
+
+        self.desktop.pay = checked_pay
+        for module in modules:
+            attach = module.attach
+
+            def checked_attach(*args, attach=attach, **kwargs):
+                if getattr(self.local, 'route', None) is not None:
+                    self.check_ui_lock("подключение к окну")
+                return attach(*args, **kwargs)
+
+            module.attach = checked_attach
+
+    def check_connect(self, pid: int, status: int):
+        """Подключение к pid должно работать с окном этого процесса"""
+        window = self.local.last
+        if status == 200 and window is not None and window.pid != pid:
+            self.flag('подключение активировало окно другого процесса',
+                      f"запрошен PID {pid}, окно PID {window.pid}")
+
+    # --- Снимок ---
+
+    def check_snapshot(self, snapshot):
+        """Счетчики снимка должны совпадать со списком сессий (сверка под блокировкой снимка)"""
+        with snapshot._lock:
+            sessions = list(snapshot.sessions.values())
+            total, authorized = snapshot.total_count, snapshot.authorized_count
+            unchecked = snapshot.unchecked_count
+        expected = sum(1 for session in sessions if session.get('authorized'))
+        expected_unchecked = sum(1 for session in sessions if 'authorized' not in session)
+        if total != len(sessions) or authorized != expected or unchecked != expected_unchecked:
+            with self._lock:
+                key = ('счетчики снимка разошлись со списком', 'snapshot')
+                self.findings[key] += 1
+                self.examples.setdefault(key, f"total {total}/{len(sessions)}, authorized {authorized}/{expected}, "
+                                                  f"unchecked {unchecked}/{expected_unchecked}")
+
+    def rows(self) -> List[dict]:
+        return [{'race': kind, 'route': route, 'count': count, 'example': self.examples[(kind, route)]}
+                for (kind, route), count in sorted(self.findings.items(), key=lambda item: -item[1])]
+
+
+def _pid(window):
+    return getattr(window, 'pid', None)
+
+
+def _route(path: str) -> str:
+    return re.sub(r'/\d+$', '/<pid>', path)
+
+
+class ErrorCounter(logging.Handler):
+    """Ошибки, которые веб-приложение записало в лог (в том числе проглоченные исключения)"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = Counter()
+
+    def emit(self, record):
+        self.messages[re.sub(r'\d+', 'N', record.getMessage())[:80]] += 1
+
+
+def client(port: int, pids: List[int], seed: int, deadline: float, results: Dict[str, list]):
+    """Один клиент панели: запросы подряд до deadline"""
+    rng = random.Random(seed)
+    operations, weights = zip(*OPERATIONS)
+    etags = {}
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        method, path = operation.split(' ')
+        path = path.replace('<pid>', str(rng.choice(pids)))
+        headers = {}
+        if method == 'GET' and path in etags:
+            headers['If-None-Match'] = etags[path]
+        started = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            connection.request(method, path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('ETag'):
+                etags[path] = response.getheader('ETag')
+            connection.close()
+        except (OSError, http.client.HTTPException):
+            status = 0
+        results[operation].append((time.perf_counter() - started, status))
+
+
+class ProcessWatch:
+    """Пик потоков и памяти процесса, пока идет нагрузка"""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.threads = 0
+        self.rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.05):
+            self.threads = max(self.threads, self.process.num_threads())
+            self.rss = max(self.rss, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def idle_connections(port: int, count: int) -> List[socket.socket]:
+    """Клиенты, которые открыли соединение, начали запрос и замолчали (открытая вкладка за плохой сетью)"""
+    connections = []
+    for _ in range(count):
+        connection = socket.create_connection(('127.0.0.1', port))
+        connection.sendall(b'GET /api/status HTTP/1.1\r\nHost: 127.0.0.1\r\n')
+        connections.append(connection)
+    return connections
+
+
+def serve_flask(web_app, watch: RaceWatch):
+    """web_app на многопоточном сервере werkzeug (поток на запрос, как app.run)"""
+    application = web_app.app.wsgi_app
+
+    def watched_app(environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        statuses = []
+
+        def capture(status, headers, *rest):
+            statuses.append(int(status.split(' ', 1)[0]))
+            return start_response(status, headers, *rest)
+
+        watch.begin(_route(path))
+        try:
+            return application(environ, capture)
+        finally:
+            if path.startswith('/api/connect/') and statuses:
+                watch.check_connect(int(path.rsplit('/', 1)[1]), statuses[0])
+            watch.end()
+
+    web_app.app.wsgi_app = watched_app
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        web_app.app.wsgi_app = application
+
+    return server.port, stop
+
+
+def serve_async(web_app, watch: RaceWatch):
+    """web_async в отдельном цикле asyncio; гонки отмечаются в потоках пула"""
+    import tornado.httpserver
+    import tornado.netutil
+    import web_async
+
+    connect_to_session, ensure_fresh = web_app.connect_to_session, web_app.snapshot.ensure_fresh
+
+    def watched_connect(pid):
+        watch.begin('/api/connect/<pid>')
+        try:
+            payload, status = connect_to_session(pid)
+            watch.check_connect(pid, status)
+            return payload, status
+        finally:
+            watch.end()
+
+    def watched_refresh(force=False):
+        watch.begin('/api/sessions (refresh)')
+        try:
+            return ensure_fresh(force)
+        finally:
+            watch.end()
+
+    web_app.connect_to_session = watched_connect
+    web_app.snapshot.ensure_fresh = watched_refresh
+    ready = threading.Event()
+    state = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+        server = tornado.httpserver.HTTPServer(web_async.make_app())
+        server.add_sockets(sockets)
+        state.update(port=sockets[0].getsockname()[1], loop=loop)
+        ready.set()
+        loop.run_forever()
+        server.stop()
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop():
+        state['loop'].call_soon_threadsafe(state['loop'].stop)
+        thread.join()
+        web_app.connect_to_session = connect_to_session
+        web_app.snapshot.ensure_fresh = ensure_fresh
+
+    return state['port'], stop
+
+
+SERVERS = {'flask': serve_flask, 'async': serve_async}
+
+
+def run_server(kind: str, args, web_app, pids: List[int], locks: List[TimedLock], watch: RaceWatch,
+               errors: ErrorCounter) -> dict:
+    """Одна нагрузка на сервер kind: строки таблиц и сводка"""
+    for lock in locks:
+        lock.reset()
+    watch.reset()
+    errors.messages.clear()
+    web_app.snapshot.loaded_at = 0.0  # Каждый сервер начинает с устаревшего снимка
+    port, stop_server = SERVERS[kind](web_app, watch)
+
+    results: Dict[str, list] = defaultdict(list)
+    stop = threading.Event()
+
+    def snapshot_checker():
+        while not stop.wait(0.02):
+            watch.check_snapshot(web_app.snapshot)
+
+    checker = threading.Thread(target=snapshot_checker, daemon=True)
+    checker.start()
+    idle = []
+    try:
+        with ProcessWatch() as process:
+            idle = idle_connections(port, args.idle)
+            started = time.monotonic()
+            deadline = started + args.duration
+            clients = [threading.Thread(target=client, args=(port, pids, seed, deadline, results))
+                       for seed in range(args.clients)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            duration = time.monotonic() - started
+    finally:
+        stop.set()
+        checker.join()
+        for connection in idle:
+            connection.close()
+        stop_server()
+
+    rows = []
+    for operation, _ in OPERATIONS:
+        samples = results.get(operation, [])
+        latency = percentiles(seconds for seconds, _ in samples)
+        statuses = Counter(status for _, status in samples)
+        failed = sum(count for status, count in statuses.items() if status == 0 or status >= 400)
+        rows.append({
+            'route': operation,
+            'requests': len(samples),
+            'rps': len(samples) / duration,
+            'p50 ms': latency.get('p50', 0.0) * 1000,
+            'p95 ms': latency.get('p95', 0.0) * 1000,
+            'p99 ms': latency.get('p99', 0.0) * 1000,
+            '304': statuses.get(304, 0),
+            '4xx': sum(count for status, count in statuses.items() if 400 <= status < 500),
+            '5xx': sum(count for status, count in statuses.items() if status >= 500),
+            'dropped': statuses.get(0, 0),
+            'error %': 100.0 * failed / len(samples) if samples else 0.0,
+        })
+    title = f"API панели ({kind}): {args.clients} клиентов, {args.idle} простаивающих, " \
+            f"{args.sessions} окна, {duration:.1f} с"
+    print_table(title, rows)
+    print_table(f"Блокировки ({kind})", [lock.row(duration) for lock in locks])
+    print_table(f"Найденные гонки ({kind})", watch.rows())
+    if errors.messages:
+        print_table(f"Ошибки в логе веб-приложения ({kind})",
+                    [{'message': message, 'count': count} for message, count in errors.messages.most_common(10)])
+    return {'rows': rows, 'threads': process.threads, 'rss': process.rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help="Одновременных клиентов")
+    parser.add_argument('--duration', type=float, default=10, help="Длительность нагрузки (секунды)")
+    parser.add_argument('--sessions', type=int, default=3, help="Окон Telegram на рабочем столе")
+    parser.add_argument('--latency', type=float, default=0.002, help="Задержка каждого обращения к окну (секунды)")
+    parser.add_argument('--idle', type=int, default=0, help="Простаивающих соединений (начали запрос и молчат)")
+    parser.add_argument('--server', choices=('flask', 'async', 'both'), default='flask',
+                        help="web_app (Flask), web_async (tornado) или оба по очереди")
+    args = parser.parse_args()
+
+    # Веб-приложение опрашивает окна само (без службы инвентаризации)
+    os.environ.pop('INVENTORY_ADDR', None)
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('tornado').setLevel(logging.ERROR)
+
+    processes = spawn_processes(args.sessions)
+    desktop = SimulatedDesktop(call_latency=args.latency).install()
+    for index, proc in enumerate(processes):
+        desktop.add_window(proc.pid, authorized=index % 2 == 0)
+    pids = [proc.pid for proc in processes]
+
+    import telegram_automation
+    import web_app
+
+    ui_lock = TimedLock('automation._ui_lock', web_app.automation._ui_lock)
+    web_app.automation._ui_lock = ui_lock
+    snapshot_lock = TimedLock('snapshot._lock', web_app.snapshot._lock)
+    web_app.snapshot._lock = snapshot_lock
+    refresh_lock = TimedLock('snapshot._refresh_lock', web_app.snapshot._refresh_lock)
+    web_app.snapshot._refresh_lock = refresh_lock
+    watch = RaceWatch(desktop, ui_lock)
+    watch.watch_window(web_app.automation)
+    watch.watch_desktop(web_app, telegram_automation)
+    errors = ErrorCounter()
+    web_app.logger.addHandler(errors)
+
+    kinds = ('flask', 'async') if args.server == 'both' else (args.server,)
+    summaries = {}
+    try:
+        for kind in kinds:
+            summaries[kind] = run_server(kind, args, web_app, pids, [ui_lock, snapshot_lock, refresh_lock],
+                                         watch, errors)
+    finally:
+        stop_processes(processes)
+
+    if len(summaries) > 1:
+        rows = []
+        for index, (operation, _) in enumerate(OPERATIONS):
+            row = {'route': operation}
+            for kind, summary in summaries.items():
+                row[f'{kind} p50 ms'] = summary['rows'][index]['p50 ms']
+                row[f'{kind} p95 ms'] = summary['rows'][index]['p95 ms']
+                row[f'{kind} error %'] = summary['rows'][index]['error %']
+            rows.append(row)
+        print_table("Flask против async: задержки по маршрутам", rows)
+        print_table("Flask против async: процесс", [
+            {'server': kind, 'threads peak': summary['threads'], 'rss peak MB': summary['rss'] / 1024 / 1024}
+            for kind, summary in summaries.items()])
+
+
+if __name__ == '__main__':
+    main()
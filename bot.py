@@ -1,16 +1,30 @@
 import asyncio
+import contextvars
+import functools
 import logging
 import warnings
 import json
 import time
 import random
 from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Tuple
+from typing import Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
 from telegram.error import TimedOut, NetworkError, RetryAfter, TelegramError
 from telegram_automation import TelegramAutomation
+from send_scheduler import SendScheduler, PRIORITY_INTERACTIVE
+from clock import SystemClock
+from inventory_service import InventoryClient
+from logging_setup import setup_logging
+from metrics import REGISTRY, add_route, serve_metrics
+from flight_recorder import runs_route
+from rate_limit_store import RateLimitStore
+import login_funnel
+from login_funnel import LoginFunnel
+import deadline
+from deadline import LOGIN_BUDGET_CODE, LOGIN_BUDGET_PASSWORD, LOGIN_BUDGET_PHONE, LOGIN_BUDGET_RESERVE, budgets_route
+import profiling
+from profiling import profiled
 import os
 from dotenv import load_dotenv
 
@@ -23,20 +37,28 @@ warnings.filterwarnings("ignore", category=UserWarning, module="telegram.ext")
 try:
     load_dotenv()
 except Exception as e:
-    logging.warning(f"Не удалось загрузить .env файл: {e}. Продолжаем работу...")
+    logging.warning("Не удалось загрузить .env файл: %s. Продолжаем работу...", e)
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Настройка логирования (LOG_QUEUE=1 - запись в фоновом потоке, LOG_JSON_FILE - JSON-lines с ротацией)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
 WAITING_PHONE, WAITING_CODE, WAITING_CLOUD_PASSWORD = range(3)
 
+# Состояния диалога в воронке входа (login_funnel.py)
+FUNNEL_STATES = {WAITING_PHONE: 'phone', WAITING_CODE: 'code', WAITING_CLOUD_PASSWORD: 'password'}
+funnel = LoginFunnel()
+
+# Часы для пауз и окон лимитов (в проверках подменяются на clock.VirtualClock)
+clock = SystemClock()
+
 # Глобальный объект автоматизации
-automation = TelegramAutomation()
+automation = TelegramAutomation(clock=clock)
+
+# Служба инвентаризации окон (inventory_service.py): если задана, статус окон берется у нее
+INVENTORY_ADDR = os.getenv('INVENTORY_ADDR', '')
+inventory = InventoryClient(INVENTORY_ADDR) if INVENTORY_ADDR else None
 
 # Путь к папке сессий
 SESSIONS_DIR = "sessions"
@@ -47,6 +69,13 @@ user_blocked = {}  # Заблокированные пользователи
 user_daily_logins = defaultdict(int)  # Количество входов в день
 user_last_login_date = {}  # Дата последнего входа
 
+# Снимок лимитов на диске (rate_limit_store.py): блокировки и входы за день переживают перезапуск.
+# Включается явно: относительный путь - от рабочего каталога, SQLite создаст рядом файлы -wal и -shm
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', '')  # Пусто (по умолчанию) - не сохранять
+RATE_LIMIT_SNAPSHOT_INTERVAL = float(os.getenv('RATE_LIMIT_SNAPSHOT_INTERVAL', '5'))  # Период снимка (секунды)
+limit_store = (RateLimitStore(RATE_LIMIT_DB, user_requests, user_blocked, user_daily_logins, user_last_login_date)
+               if RATE_LIMIT_DB else None)
+
 # Строгие лимиты для защиты от блокировки Telegram
 MAX_REQUESTS_PER_MINUTE = 5  # Максимум запросов в минуту (снижено для безопасности)
 MAX_REQUESTS_PER_HOUR = 20  # Максимум запросов в час (снижено для безопасности)
@@ -57,11 +86,50 @@ BLOCK_DURATION = 3600  # Время блокировки в секундах (1
 MIN_DELAY = 1.0  # Минимальная задержка между действиями (секунды)
 MAX_DELAY = 3.0  # Максимальная задержка между действиями (секунды)
 
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Внешний HTTPS-адрес, на который Telegram шлет обновления
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')  # Адрес локального сервера webhook
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_CERT = os.getenv('WEBHOOK_CERT') or None  # Самоподписанный сертификат (если TLS не завершает прокси)
+WEBHOOK_KEY = os.getenv('WEBHOOK_KEY') or None
+
+# Исходящие запросы к Bot API
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL') or None  # Например, локальная заглушка bot_api_stub.py
+BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', '16'))  # Соединений для sendMessage/editMessageText
+
+# Лимиты исходящих сообщений (send_scheduler.py): Telegram допускает около 30 в секунду на бота
+# и около 1 в секунду в один чат; запас нужен, чтобы не получать RetryAfter
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '25'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = float(os.getenv('SEND_CHAT_BURST', '3'))
+outbound = SendScheduler(global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                         clock=clock)
+
+# Фоновый прогрев окна Telegram: находит окно и экран входа до первого запроса
+WINDOW_WARMUP = os.getenv('WINDOW_WARMUP', '0').lower() in ('1', 'true', 'yes')
+WINDOW_WARMUP_INTERVAL = float(os.getenv('WINDOW_WARMUP_INTERVAL', '30'))  # Период перепроверки (секунды)
+
+# Служебный HTTP-сервер метрик (0 - выключен)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Метрики
+PHONE_AUTOMATION_SECONDS = REGISTRY.histogram(
+    'bot_phone_automation_seconds', 'Время работы с окном Telegram при вводе номера')
+FIRST_REQUEST_SECONDS = REGISTRY.histogram(
+    'bot_first_request_seconds', 'Время работы с окном Telegram для первого номера после старта')
+WARMUP_SECONDS = REGISTRY.histogram('bot_window_warmup_seconds', 'Длительность прохода прогрева окна')
+WINDOW_WARM = REGISTRY.gauge('bot_window_warm', '1 если окно Telegram и экран входа закэшированы')
+_first_phone_request_done = False
+
 
 def save_session(user_id: int, data: dict):
     """Сохраняет сессию пользователя (отключено - сессии не сохраняются)"""
     # Сессии не сохраняются по запросу пользователя
-    logger.debug(f"Сохранение сессии отключено для пользователя {user_id}")
+    logger.debug("Сохранение сессии отключено для пользователя %s", user_id)
 
 
 def load_session(user_id: int) -> dict:
@@ -73,7 +141,7 @@ def load_session(user_id: int) -> dict:
 def clear_session(user_id: int):
     """Удаляет сессию пользователя (отключено - сессии не сохраняются)"""
     # Сессии не удаляются, так как не сохраняются
-    logger.debug(f"Удаление сессии отключено для пользователя {user_id}")
+    logger.debug("Удаление сессии отключено для пользователя %s", user_id)
 
 
 def get_human_delay() -> float:
@@ -82,9 +150,185 @@ def get_human_delay() -> float:
 
 
 async def human_delay():
-    """Выполняет задержку для имитации человеческого поведения"""
-    delay = get_human_delay()
-    await asyncio.sleep(delay)
+    """Выполняет задержку для имитации человеческого поведения (не съедая бюджет работы с окном)"""
+    with deadline.step('human_delay'):
+        delay = deadline.clamp(get_human_delay(), keep=LOGIN_BUDGET_RESERVE, what='human_delay')
+        await clock.asleep(delay)
+        deadline.waited(delay)
+
+
+async def password_wait(delay: float):
+    """Пауза перед проверкой облачного пароля (укорачивается, если бюджет кода на исходе)"""
+    with deadline.step('password_wait'):
+        delay = deadline.clamp(delay, keep=LOGIN_BUDGET_RESERVE, what='password_wait')
+        await clock.asleep(delay)
+        deadline.waited(delay)
+
+
+def login_budget(flow: str, seconds: float, failed: int):
+    """
+    Декоратор обработчика: бюджет времени на шаг входа (deadline.py)
+
+    Args:
+        flow: phone, code или password
+        seconds: Бюджет (секунды)
+        failed: Состояние диалога, означающее неудачу шага
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+            budget = deadline.Budget(flow, seconds, clock=clock)
+            with budget.use():
+                try:
+                    state = await handler(update, context)
+                except BaseException:
+                    budget.finish('error')
+                    raise
+            budget.finish('fail' if state == failed else 'ok')
+            return state
+        return wrapper
+    return decorator
+
+
+def funnel_step(state: Optional[str], end: str):
+    """
+    Декоратор обработчика: учет в воронке входа (login_funnel.py)
+
+    Ставится под login_budget: время работы с окном и пауз берется из шагов бюджета.
+
+    Args:
+        state: Состояние, которое обрабатывает обработчик ('start' - новый диалог, None - текущее)
+        end: Выход диалога, если обработчик его завершает (ConversationHandler.END)
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+            chat, user = update.effective_chat, update.effective_user
+            key = (chat.id if chat else None, user.id if user else None)
+            budget = deadline.current() or deadline.Budget(state or 'funnel', float('inf'), clock=clock)
+            call = funnel.begin(key, state, clock.monotonic(), budget)
+            next_state = None  # Исключение - ConversationHandler оставляет прежнее состояние
+            try:
+                with funnel.use(call):
+                    try:
+                        next_state = await handler(update, context)
+                    except Exception:
+                        login_funnel.retry('error')
+                        raise
+            finally:
+                if next_state == ConversationHandler.END:
+                    to = end
+                else:
+                    to = FUNNEL_STATES.get(next_state, call.state)
+                funnel.end(call, to, clock.monotonic())
+            return next_state
+        return wrapper
+    return decorator
+
+
+def record_phone_automation(seconds: float):
+    """Записывает время автоматизации запроса номера (первый запрос - отдельно, с меткой прогрева)"""
+    global _first_phone_request_done
+    PHONE_AUTOMATION_SECONDS.observe(seconds)
+    if not _first_phone_request_done:
+        _first_phone_request_done = True
+        warmup = 'on' if WINDOW_WARMUP else 'off'
+        FIRST_REQUEST_SECONDS.observe(seconds, warmup=warmup)
+        logger.info("Первый запрос номера: %.2f с работы с окном (прогрев: %s)", seconds, warmup)
+
+
+async def in_thread(func, *args):
+    """
+    Вызов автоматизации окна в пуле потоков
+
+    Методы TelegramAutomation ждут блокировку UI, которую прогрев держит весь проход по
+    окнам; вызванные прямо из обработчика, они останавливали бы цикл событий и все диалоги.
+    Контекст копируется: бюджет входа (deadline) и воронка видят шаги автоматизации,
+    а снимаемый профиль обработчика (profiled) - работу в потоке.
+    """
+    call = functools.partial(contextvars.copy_context().run, profiling.follow(func), *args)
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+@deadline.stepped('check_authorized')
+def check_authorized() -> bool:
+    """
+    Авторизован ли Telegram Desktop, с окном которого работает бот
+
+    Со службой инвентаризации - по ее снимку для процесса этого окна (другие экземпляры,
+    например Portable, не в счет); нет данных о процессе - опрос окна.
+    """
+    if inventory is not None:
+        try:
+            pid = automation.target_pid()
+            authorized = inventory.authorization().get(pid) if pid is not None else None
+            if authorized is not None:
+                return authorized
+        except (OSError, ValueError) as e:
+            logger.warning("Служба инвентаризации недоступна (%s), проверяем окно сами", e)
+    return automation.check_if_authorized()
+
+
+async def warm_window_once():
+    """Один проход прогрева окна в пуле потоков"""
+    started = time.monotonic()
+    try:
+        warm = await asyncio.get_running_loop().run_in_executor(None, automation.warm_up)
+    except Exception as e:
+        logger.debug("Ошибка прогрева окна: %s", e)
+        warm = False
+    WARMUP_SECONDS.observe(time.monotonic() - started)
+    WINDOW_WARM.set(1 if warm else 0)
+
+
+async def window_warmup_loop(interval: float):
+    """
+    Держит окно Telegram и элементы экрана входа найденными
+
+    Без службы инвентаризации окно перепроверяется с заданным периодом. Со службой
+    таймера нет: прогрев повторяется только когда служба сообщает об изменении сессий
+    (новые замеры ресурсов прогрев не будят).
+    """
+    if inventory is None:
+        while True:
+            await warm_window_once()
+            await asyncio.sleep(interval)
+    
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    inventory.subscribe(lambda message: loop.call_soon_threadsafe(changed.set), resources=False)
+    while True:
+        await changed.wait()
+        changed.clear()
+        await warm_window_once()
+
+
+async def on_startup(application: Application):
+    """Запускает фоновые задачи после инициализации приложения"""
+    tasks = application.bot_data.setdefault('background_tasks', [])
+    if limit_store is not None:
+        started = time.perf_counter()
+        try:
+            loaded = limit_store.load(clock.time(), clock.now().date())
+            logger.info("Лимиты восстановлены из %s: %s пользователей за %.1f мс",
+                        RATE_LIMIT_DB, loaded, (time.perf_counter() - started) * 1000)
+        except Exception as e:
+            logger.error("Не удалось прочитать снимок лимитов %s: %s", RATE_LIMIT_DB, e)
+        tasks.append(asyncio.create_task(limit_store.run(RATE_LIMIT_SNAPSHOT_INTERVAL)))
+    if WINDOW_WARMUP:
+        logger.info("Прогрев окна Telegram включен (каждые %s с)", WINDOW_WARMUP_INTERVAL)
+        tasks.append(asyncio.create_task(window_warmup_loop(WINDOW_WARMUP_INTERVAL)))
+
+
+async def on_shutdown(application: Application):
+    """Дожидается отправки очереди сообщений и останавливает фоновые задачи"""
+    if not await outbound.drain():
+        logger.warning("Не отправлено сообщений при остановке: %s", outbound.pending())
+    for task in application.bot_data.get('background_tasks', []):
+        task.cancel()
+    if limit_store is not None:
+        await limit_store.save()  # Последний снимок лимитов
+        limit_store.close()
 
 
 def check_rate_limit(user_id: int, is_login_attempt: bool = False) -> Tuple[bool, str]:
@@ -98,8 +342,10 @@ def check_rate_limit(user_id: int, is_login_attempt: bool = False) -> Tuple[bool
     Returns:
         (allowed, message) - разрешено ли действие и сообщение об ошибке
     """
-    current_time = time.time()
-    current_date = datetime.now().date()
+    current_time = clock.time()
+    current_date = clock.now().date()
+    if limit_store is not None:
+        limit_store.mark(user_id)
     
     # Проверяем, не заблокирован ли пользователь
     if user_id in user_blocked:
@@ -186,7 +432,7 @@ async def safe_reply_with_rate_limit(update: Update, text: str, max_retries: int
         if not allowed:
             try:
                 if hasattr(update, 'message') and update.message:
-                    await update.message.reply_text(error_msg)
+                    await outbound.send(update.message.chat_id, lambda: update.message.reply_text(error_msg))
                 elif hasattr(update, 'callback_query') and update.callback_query:
                     await update.callback_query.answer(error_msg, show_alert=True)
             except:
@@ -198,26 +444,35 @@ async def safe_reply_with_rate_limit(update: Update, text: str, max_retries: int
 
 
 async def safe_reply(update: Update, text: str, max_retries: int = 3, reply_markup=None) -> bool:
-    """Безопасная отправка сообщения с повторными попытками"""
-    for attempt in range(max_retries):
-        try:
-            if hasattr(update, 'message') and update.message:
-                await update.message.reply_text(text, reply_markup=reply_markup)
-            elif hasattr(update, 'callback_query') and update.callback_query:
-                # Для callback_query используем edit_message_text
-                await update.callback_query.message.edit_text(text, reply_markup=reply_markup)
-            return True
-        except (TimedOut, NetworkError) as e:
-            if attempt < max_retries - 1:
-                logger.warning(f"Таймаут при отправке сообщения (попытка {attempt + 1}/{max_retries}), повтор...")
-                await asyncio.sleep(1)
-            else:
-                logger.error(f"Не удалось отправить сообщение после {max_retries} попыток: {e}")
-                return False
-        except Exception as e:
-            logger.error(f"Ошибка при отправке сообщения: {e}")
-            return False
-    return False
+    """Безопасная отправка сообщения через планировщик (лимиты Telegram, RetryAfter, повторы)"""
+    try:
+        if hasattr(update, 'message') and update.message:
+            message = update.message
+            await outbound.send(message.chat_id, lambda: message.reply_text(text, reply_markup=reply_markup),
+                                max_retries=max_retries)
+        elif hasattr(update, 'callback_query') and update.callback_query:
+            # Для callback_query используем edit_message_text
+            message = update.callback_query.message
+            await outbound.send(message.chat_id, lambda: message.edit_text(text, reply_markup=reply_markup),
+                                priority=PRIORITY_INTERACTIVE, key=(message.chat_id, message.message_id),
+                                max_retries=max_retries)
+        return True
+    except Exception as e:
+        logger.error("Ошибка при отправке сообщения: %s", e)
+        return False
+
+
+async def edit_code_message(query, text: str, wait: bool = True, **kwargs):
+    """
+    Правка сообщения с клавиатурой ввода кода через планировщик
+
+    Интерактивный приоритет; неотправленная правка того же сообщения заменяется новой.
+    wait=False - обработчик не ждет Bot API (перерисовка клавиатуры при быстрых нажатиях).
+    """
+    message = query.message
+    return await outbound.send(message.chat_id, lambda: query.edit_message_text(text, **kwargs),
+                               priority=PRIORITY_INTERACTIVE, key=(message.chat_id, message.message_id),
+                               wait=wait)
 
 
 def create_code_keyboard(current_code: str = "") -> InlineKeyboardMarkup:
@@ -265,6 +520,8 @@ def create_code_keyboard(current_code: str = "") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
+@profiled()
+@funnel_step('start', end='authorized')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик команды /start"""
     # Добавляем задержку для имитации человеческого поведения
@@ -275,12 +532,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if user_id:
         allowed, error_msg = check_rate_limit(user_id)
         if not allowed:
+            login_funnel.ended('rate_limited')
             await safe_reply(update, error_msg)
             return ConversationHandler.END
     
     # Проверяем, авторизован ли уже Telegram Desktop
     try:
-        is_authorized = automation.check_if_authorized()
+        is_authorized = await in_thread(check_authorized)
         if is_authorized:
             await safe_reply(
                 update,
@@ -290,7 +548,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             )
             return ConversationHandler.END
     except Exception as e:
-        logger.warning(f"Ошибка при проверке авторизации: {e}")
+        logger.warning("Ошибка при проверке авторизации: %s", e)
         # Продолжаем как обычно, если проверка не удалась
     
     await safe_reply(
@@ -303,6 +561,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return WAITING_PHONE
 
 
+@profiled()
+@login_budget('phone', LOGIN_BUDGET_PHONE, failed=WAITING_PHONE)
+@funnel_step('phone', end='authorized')
 async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик номера телефона"""
     # Добавляем задержку для имитации человеческого поведения
@@ -312,16 +573,27 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     
     # Простая валидация номера
     if not phone.startswith('+') or len(phone) < 10:
+        login_funnel.retry('invalid')
         await safe_reply(
             update,
             "❌ Неверный формат номера. Пожалуйста, отправь номер в формате: +79991234567"
         )
         return WAITING_PHONE
     
+    # Telegram Desktop не запущен - отвечаем сразу, без пауз и поиска окна
+    if await in_thread(automation.window_unavailable):
+        login_funnel.retry('no_window')
+        await safe_reply(update, f"❌ {automation.breaker.status()}.\nЗапусти Telegram Desktop/Portable и отправь номер еще раз.")
+        return WAITING_PHONE
+    
     # Проверяем, авторизован ли уже Telegram Desktop
+    automation_seconds = 0.0
     try:
-        is_authorized = automation.check_if_authorized()
+        check_started = time.monotonic()
+        is_authorized = await in_thread(check_authorized)
+        automation_seconds += time.monotonic() - check_started
         if is_authorized:
+            record_phone_automation(automation_seconds)
             await safe_reply(
                 update,
                 "✅ Telegram Desktop уже авторизован!\n"
@@ -332,7 +604,7 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             context.user_data.clear()
             return ConversationHandler.END
     except Exception as e:
-        logger.warning(f"Ошибка при проверке авторизации: {e}")
+        logger.warning("Ошибка при проверке авторизации: %s", e)
         # Продолжаем как обычно, если проверка не удалась
     
     # Проверяем rate limit для попытки входа (более строгие лимиты)
@@ -340,6 +612,7 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     if user_id:
         allowed, error_msg = check_rate_limit(user_id, is_login_attempt=True)
         if not allowed:
+            login_funnel.retry('rate_limit')
             await safe_reply(update, error_msg)
             return WAITING_PHONE
     
@@ -361,7 +634,11 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     
     try:
         # Вводим номер в Telegram
-        success = automation.enter_phone_number(phone)
+        entry_started = time.monotonic()
+        try:
+            success = await in_thread(automation.enter_phone_number, phone)
+        finally:
+            record_phone_automation(automation_seconds + time.monotonic() - entry_started)
         
         if success:
             # Инициализируем код в контексте
@@ -377,6 +654,7 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             )
             return WAITING_CODE
         else:
+            login_funnel.retry('automation')
             await safe_reply(
                 update,
                 "❌ Не удалось ввести номер. Убедись, что:\n"
@@ -387,7 +665,8 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             )
             return WAITING_PHONE
     except Exception as e:
-        logger.error(f"Ошибка при вводе номера: {e}")
+        logger.error("Ошибка при вводе номера: %s", e)
+        login_funnel.retry('error')
         await safe_reply(
             update,
             f"❌ Произошла ошибка: {str(e)}\n"
@@ -396,6 +675,9 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         return WAITING_PHONE
 
 
+@profiled()
+@login_budget('code', LOGIN_BUDGET_CODE, failed=WAITING_CODE)
+@funnel_step('code', end='logged_in')
 async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик нажатий на кнопки ввода кода"""
     query = update.callback_query
@@ -408,7 +690,8 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if query.data == "code_send":
         # Отправляем код
         if len(current_code) == 5:
-            await query.edit_message_text(
+            await edit_code_message(
+                query,
                 f"🔢 {current_code}\n"
                 "⏳ Обрабатываю..."
             )
@@ -418,24 +701,25 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 await human_delay()
                 
                 # Вводим код в Telegram
-                success = automation.enter_code(current_code)
+                success = await in_thread(automation.enter_code, current_code)
                 
                 if success:
                     # Проверяем, требуется ли облачный пароль
                     # Используем случайную задержку вместо фиксированной
-                    delay = get_human_delay() + 1.0  # Дополнительная задержка
-                    await asyncio.sleep(delay)
-                    needs_password = automation.check_cloud_password_needed()
+                    await password_wait(get_human_delay() + 1.0)  # Дополнительная задержка
+                    needs_password = await in_thread(automation.check_cloud_password_needed)
                     
                     if needs_password:
-                        await query.edit_message_text(
+                        await edit_code_message(
+                            query,
                             "✅ Готово!\n"
                             "🔐 Требуется дополнительная проверка.\n"
                             "📝 Отправь данные:"
                         )
                         return WAITING_CLOUD_PASSWORD
                     else:
-                        await query.edit_message_text(
+                        await edit_code_message(
+                            query,
                             "✅ Готово!\n"
                             "🎉 Проверь Telegram Desktop/Portable."
                         )
@@ -446,8 +730,10 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
                         context.user_data.clear()
                         return ConversationHandler.END
                 else:
+                    login_funnel.retry('automation')
                     keyboard = create_code_keyboard(current_code)
-                    await query.edit_message_text(
+                    await edit_code_message(
+                        query,
                         "❌ Не удалось выполнить. Убедись, что:\n"
                         "1. Telegram Desktop/Portable открыт\n"
                         "2. Окно активно\n\n"
@@ -457,9 +743,11 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     )
                     return WAITING_CODE
             except Exception as e:
-                logger.error(f"Ошибка при вводе кода: {e}")
+                logger.error("Ошибка при вводе кода: %s", e)
+                login_funnel.retry('error')
                 keyboard = create_code_keyboard(current_code)
-                await query.edit_message_text(
+                await edit_code_message(
+                    query,
                     f"❌ Произошла ошибка: {str(e)}\n"
                     f"🔢 Текущий код: {current_code or '(пусто)'}\n"
                     "Попробуй еще раз:",
@@ -468,8 +756,10 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 return WAITING_CODE
         else:
             # Код не полный
+            login_funnel.retry('invalid')
             keyboard = create_code_keyboard(current_code)
-            await query.edit_message_text(
+            await edit_code_message(
+                query,
                 f"❌ Нужно 5 цифр.\n"
                 f"🔢 {current_code or '(пусто)'}\n"
                 "Введи еще:",
@@ -495,29 +785,32 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Если код полный, автоматически отправляем
     if len(current_code) == 5:
-        await query.edit_message_text(
+        await edit_code_message(
+            query,
             f"🔢 {current_code}\n"
             "⏳ Обрабатываю..."
         )
         
         try:
             # Вводим код в Telegram
-            success = automation.enter_code(current_code)
+            success = await in_thread(automation.enter_code, current_code)
             
             if success:
                 # Проверяем, требуется ли облачный пароль (ждем немного и проверяем окно)
-                await asyncio.sleep(2)  # Даем время для появления запроса пароля
-                needs_password = automation.check_cloud_password_needed()
+                await password_wait(2)  # Даем время для появления запроса пароля
+                needs_password = await in_thread(automation.check_cloud_password_needed)
                 
                 if needs_password:
-                    await query.edit_message_text(
+                    await edit_code_message(
+                        query,
                         "✅ Готово!\n"
                         "🔐 Требуется дополнительная проверка.\n"
                         "📝 Отправь данные:"
                     )
                     return WAITING_CLOUD_PASSWORD
                 else:
-                    await query.edit_message_text(
+                    await edit_code_message(
+                        query,
                         "✅ Готово!\n"
                         "🎉 Проверь Telegram Desktop/Portable."
                     )
@@ -525,8 +818,10 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     context.user_data.clear()
                     return ConversationHandler.END
             else:
+                login_funnel.retry('automation')
                 keyboard = create_code_keyboard(current_code)
-                await query.edit_message_text(
+                await edit_code_message(
+                    query,
                     "❌ Не удалось выполнить. Убедись, что:\n"
                     "1. Telegram Desktop/Portable открыт\n"
                     "2. Окно активно\n\n"
@@ -536,9 +831,11 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 )
                 return WAITING_CODE
         except Exception as e:
-            logger.error(f"Ошибка при вводе кода: {e}")
+            logger.error("Ошибка при вводе кода: %s", e)
+            login_funnel.retry('error')
             keyboard = create_code_keyboard(current_code)
-            await query.edit_message_text(
+            await edit_code_message(
+                query,
                 f"❌ Произошла ошибка: {str(e)}\n"
                 f"🔢 {current_code}\n"
                 "Попробуй еще раз:",
@@ -564,8 +861,10 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         message_text += f"Осталось: {5 - len(current_code)}"
     
-    await query.edit_message_text(
+    await edit_code_message(
+        query,
         message_text,
+        wait=False,
         reply_markup=keyboard,
         parse_mode='Markdown'
     )
@@ -573,12 +872,16 @@ async def handle_code_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return WAITING_CODE
 
 
+@profiled()
+@login_budget('code', LOGIN_BUDGET_CODE, failed=WAITING_CODE)
+@funnel_step('code', end='logged_in')
 async def handle_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик кода подтверждения (текстовый ввод для обратной совместимости)"""
     code = update.message.text.strip()
     
     # Валидация кода (обычно 5 цифр)
     if not code.isdigit() or len(code) != 5:
+        login_funnel.retry('invalid')
         keyboard = create_code_keyboard("")
         await safe_reply(
             update,
@@ -599,14 +902,13 @@ async def handle_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         await human_delay()
         
         # Вводим код в Telegram
-        success = automation.enter_code(code)
+        success = await in_thread(automation.enter_code, code)
         
         if success:
             # Проверяем, требуется ли облачный пароль
             # Используем случайную задержку вместо фиксированной
-            delay = get_human_delay() + 1.0  # Дополнительная задержка
-            await asyncio.sleep(delay)
-            needs_password = automation.check_cloud_password_needed()
+            await password_wait(get_human_delay() + 1.0)  # Дополнительная задержка
+            needs_password = await in_thread(automation.check_cloud_password_needed)
             
             if needs_password:
                 await safe_reply(
@@ -626,6 +928,7 @@ async def handle_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
                 context.user_data.clear()
                 return ConversationHandler.END
         else:
+            login_funnel.retry('automation')
             keyboard = create_code_keyboard("")
             await safe_reply(
                 update,
@@ -637,7 +940,8 @@ async def handle_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             )
             return WAITING_CODE
     except Exception as e:
-        logger.error(f"Ошибка при вводе кода: {e}")
+        logger.error("Ошибка при вводе кода: %s", e)
+        login_funnel.retry('error')
         keyboard = create_code_keyboard("")
         await safe_reply(
             update,
@@ -648,11 +952,15 @@ async def handle_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         return WAITING_CODE
 
 
+@profiled()
+@login_budget('password', LOGIN_BUDGET_PASSWORD, failed=WAITING_CLOUD_PASSWORD)
+@funnel_step('password', end='logged_in')
 async def handle_cloud_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик облачного пароля"""
     password = update.message.text.strip()
     
     if not password:
+        login_funnel.retry('invalid')
         await safe_reply(
             update,
             "❌ Не может быть пустым. Отправь данные:"
@@ -667,7 +975,7 @@ async def handle_cloud_password(update: Update, context: ContextTypes.DEFAULT_TY
     
     try:
         # Вводим пароль в Telegram
-        success = automation.enter_cloud_password(password)
+        success = await in_thread(automation.enter_cloud_password, password)
         
         if success:
             await safe_reply(
@@ -682,6 +990,7 @@ async def handle_cloud_password(update: Update, context: ContextTypes.DEFAULT_TY
             context.user_data.clear()
             return ConversationHandler.END
         else:
+            login_funnel.retry('automation')
             await safe_reply(
                 update,
                 "❌ Не удалось выполнить. Убедись, что:\n"
@@ -691,7 +1000,8 @@ async def handle_cloud_password(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return WAITING_CLOUD_PASSWORD
     except Exception as e:
-        logger.error(f"Ошибка при вводе пароля: {e}")
+        logger.error("Ошибка при вводе пароля: %s", e)
+        login_funnel.retry('error')
         await safe_reply(
             update,
             f"❌ Произошла ошибка: {str(e)}\n"
@@ -700,6 +1010,8 @@ async def handle_cloud_password(update: Update, context: ContextTypes.DEFAULT_TY
         return WAITING_CLOUD_PASSWORD
 
 
+@profiled()
+@funnel_step(None, end='cancelled')
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена операции"""
     await safe_reply(update, "❌ Операция отменена.")
@@ -713,10 +1025,10 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     
     # Игнорируем таймауты - они обрабатываются в safe_reply
     if isinstance(error, (TimedOut, NetworkError)):
-        logger.warning(f"Таймаут или сетевая ошибка: {error}")
+        logger.warning("Таймаут или сетевая ошибка: %s", error)
         return
     
-    logger.error(f"Exception while handling an update: {error}", exc_info=error)
+    logger.error("Exception while handling an update: %s", error, exc_info=error)
     
     # Если это конфликт (другой экземпляр бота запущен)
     if isinstance(error, Exception) and "Conflict" in str(error):
@@ -725,35 +1037,55 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     # Пытаемся отправить сообщение об ошибке пользователю (если есть update)
     if update and hasattr(update, 'message') and update.message:
         try:
-            await update.message.reply_text(
+            await outbound.send(update.message.chat_id, lambda: update.message.reply_text(
                 "❌ Произошла ошибка при обработке запроса. Попробуй еще раз или отправь /start"
-            )
+            ))
         except:
             pass  # Игнорируем ошибки при отправке сообщения об ошибке
 
 
-def main():
-    """Запуск бота"""
-    # Сессии не сохраняются (отключено по запросу пользователя)
-    
-    # Получаем токен из переменных окружения
-    token = os.getenv('BOT_TOKEN')
-    
-    if not token:
-        logger.error("BOT_TOKEN не найден в переменных окружения!")
-        print("❌ Ошибка: Создай файл .env и добавь туда BOT_TOKEN=твой_токен_бота")
-        return
-    
-    # Создаем приложение с увеличенными таймаутами и защитой от блокировки
-    application = (
+def build_application(token: str, run_mode: str = None, base_url: str = None) -> Application:
+    """
+    Создает приложение бота с обработчиками
+
+    Args:
+        token: Токен бота
+        run_mode: "polling" или "webhook" (по умолчанию BOT_RUN_MODE)
+        base_url: Адрес Bot API (по умолчанию BOT_API_BASE_URL или api.telegram.org)
+    """
+    run_mode = run_mode or BOT_RUN_MODE
+    base_url = base_url or BOT_API_BASE_URL
+
+    builder = (
         Application.builder()
         .token(token)
-        .read_timeout(30)
-        .write_timeout(30)
-        .connect_timeout(30)
-        .pool_timeout(30)
-        .build()
+        .connection_pool_size(BOT_API_POOL_SIZE)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
     )
+    if base_url:
+        builder = builder.base_url(base_url)
+
+    if run_mode == 'webhook':
+        # Без длинного опроса соединения заняты только короткими вызовами:
+        # держим пул теплым и не ждем свободное соединение подолгу
+        builder = (
+            builder
+            .read_timeout(10)
+            .write_timeout(10)
+            .connect_timeout(5)
+            .pool_timeout(3)
+        )
+    else:
+        # Увеличенные таймауты для длинного опроса и защиты от блокировки
+        builder = (
+            builder
+            .read_timeout(30)
+            .write_timeout(30)
+            .connect_timeout(30)
+            .pool_timeout(30)
+        )
+    application = builder.build()
     
     # Создаем ConversationHandler для управления диалогом
     conv_handler = ConversationHandler(
@@ -774,16 +1106,76 @@ def main():
     # Добавляем обработчики
     application.add_handler(conv_handler)
     application.add_error_handler(error_handler)
+    return application
+
+
+def webhook_settings() -> dict:
+    """Параметры run_webhook/start_webhook из переменных окружения"""
+    return {
+        'listen': WEBHOOK_LISTEN,
+        'port': WEBHOOK_PORT,
+        'url_path': WEBHOOK_PATH,
+        'webhook_url': f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        'secret_token': WEBHOOK_SECRET,
+        'cert': WEBHOOK_CERT,
+        'key': WEBHOOK_KEY,
+    }
+
+
+def main():
+    """Запуск бота"""
+    # Сессии не сохраняются (отключено по запросу пользователя)
+    
+    # Получаем токен из переменных окружения
+    token = os.getenv('BOT_TOKEN')
+    
+    if not token:
+        logger.error("BOT_TOKEN не найден в переменных окружения!")
+        print("❌ Ошибка: Создай файл .env и добавь туда BOT_TOKEN=твой_токен_бота")
+        return
+    
+    if BOT_RUN_MODE not in ('polling', 'webhook'):
+        logger.error("Неизвестный BOT_RUN_MODE: %s", BOT_RUN_MODE)
+        print("❌ Ошибка: BOT_RUN_MODE должен быть polling или webhook")
+        return
+    
+    if BOT_RUN_MODE == 'webhook' and not WEBHOOK_URL:
+        logger.error("Для режима webhook нужен WEBHOOK_URL")
+        print("❌ Ошибка: Добавь в .env WEBHOOK_URL=https://твой-домен (адрес, который видит Telegram)")
+        return
+    
+    # Создаем приложение с таймаутами под выбранный режим и защитой от блокировки
+    application = build_application(token)
+    
+    if profiling.enabled():
+        profiling.arm_from_env()
+    
+    if METRICS_PORT:
+        add_route('/runs', runs_route)  # Бортовой самописец для панели веб-приложения
+        add_route('/budgets', budgets_route)  # Отчеты бюджетов входа: какой шаг вышел за предел
+        add_route('/funnel', funnel.route(clock))  # Воронка входа для панели веб-приложения
+        if profiling.enabled():
+            # Взвод профилирования и снимки памяти по токену (через веб-приложение)
+            for path in ('/debug/profile/arm', '/debug/tracemalloc'):
+                add_route(path, functools.partial(profiling.debug_route, path))
+        serve_metrics(METRICS_PORT, METRICS_HOST)
     
     # Запускаем бота
-    logger.info("Бот запущен...")
+    logger.info("Бот запущен (%s)...", BOT_RUN_MODE)
     print("✅ Бот запущен! Нажми Ctrl+C для остановки.")
     
     try:
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True  # Игнорируем старые обновления
-        )
+        if BOT_RUN_MODE == 'webhook':
+            application.run_webhook(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,  # Игнорируем старые обновления
+                **webhook_settings()
+            )
+        else:
+            application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True  # Игнорируем старые обновления
+            )
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
         print("\n👋 Бот остановлен.")
@@ -793,7 +1185,7 @@ def main():
             print("\n❌ Ошибка: Другой экземпляр бота уже запущен!")
             print("💡 Решение: Остановите все запущенные процессы Python или перезапустите компьютер.")
         else:
-            logger.error(f"Критическая ошибка: {e}")
+            logger.error("Критическая ошибка: %s", e)
             print(f"\n❌ Критическая ошибка: {e}")
 
 
@@ -0,0 +1,386 @@
+"""
+Локальная замена Telegram Bot API для проверки бота без сети.
+
+Сервер отвечает на методы Bot API, которые использует bot.py (getMe, sendMessage,
+editMessageText, answerCallbackQuery, getUpdates, setWebhook, deleteWebhook),
+и доставляет обновления боту так же, как это делает Telegram:
+- в режиме polling - через длинный опрос getUpdates;
+- в режиме webhook - POST-запросом на адрес, переданный в setWebhook
+  (с заголовком X-Telegram-Bot-Api-Secret-Token и, для https://, проверкой
+  самоподписанного сертификата бота).
+
+Ограничения Telegram на частоту сообщений можно включить (chat_limit, global_limit):
+лишние sendMessage/editMessageText получают 429 с retry_after, как от настоящего Bot API.
+
+Запуск: python bot_api_stub.py --port 8081
+В .env бота: BOT_API_BASE_URL=http://127.0.0.1:8081/bot
+Обновление вручную: POST http://127.0.0.1:8081/stub/update с JSON-телом Update.
+"""
+import argparse
+import email
+import json
+import logging
+import math
+import ssl
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    'id': 100000001,
+    'is_bot': True,
+    'first_name': 'StubBot',
+    'username': 'stub_bot',
+    'can_join_groups': True,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+
+def _decode_params(content_type: str, body: bytes) -> dict:
+    """Разбирает параметры запроса Bot API (form-urlencoded со значениями в JSON или JSON)"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body.decode('utf-8'))
+    if content_type.startswith('multipart/form-data'):
+        # setWebhook с сертификатом приходит как multipart - файлы пропускаем
+        message = email.message_from_bytes(b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+        params = {}
+        for part in message.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            if not name or part.get_filename():
+                continue
+            value = part.get_payload(decode=True).decode('utf-8')
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                params[name] = value
+        return params
+    params = {}
+    for key, value in parse_qsl(body.decode('utf-8'), keep_blank_values=True):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class BotApiStub:
+    """Заглушка Bot API: принимает вызовы бота, записывает их и доставляет обновления"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, webhook_cafile: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.webhook_cafile = webhook_cafile
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.calls = []  # (monotonic, method, params)
+        self.chat_state = {}  # (chat_id, message_id) -> текст, который сейчас видит пользователь
+        self.latency = 0.0  # Задержка ответа на вызов (секунды), как сеть до api.telegram.org
+        self.flood_every = 0  # Каждый N-й исходящий вызов отвечает 429 (для проверки RetryAfter)
+        self.flood_retry_after = 1
+        # Лимиты частоты как у Telegram: не больше N сообщений за flood_window секунд (0 - без лимита)
+        self.chat_limit = 0
+        self.global_limit = 0
+        self.flood_window = 1.0
+        self.flood_responses = 0
+        self._recent = deque()  # (monotonic, chat_id) принятых сообщений за окно
+        self._pending = deque()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._call_count = 0
+        self._cond = threading.Condition()
+        self._server = None
+        self._thread = None
+        self._ssl_context = None
+
+    # --- Жизненный цикл ---
+
+    def start(self):
+        """Запускает HTTP-сервер в фоновом потоке"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Иначе заголовки и тело ответа ждут задержанный ACK
+
+            def do_POST(self):
+                stub._handle(self)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                logger.debug("stub: " + format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        # Короткий интервал опроса - stop() не ждет по полсекунды
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,),
+                                        name='bot-api-stub', daemon=True)
+        self._thread.start()
+        logger.info("Заглушка Bot API запущена на %s", self.base_url)
+        return self
+
+    def stop(self):
+        """Останавливает сервер и будит ожидающие getUpdates"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def base_url(self) -> str:
+        """Значение для BOT_API_BASE_URL"""
+        return f"http://{self.host}:{self.port}/bot"
+
+    # --- Обработка вызовов Bot API ---
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        if request.path.startswith('/stub/update'):
+            # Служебный вход: обновление в формате Bot API для доставки боту
+            update = self.push_update(json.loads(body.decode('utf-8') or '{}'))
+            self._reply(request, 200, {'ok': True, 'result': update})
+            return
+        # Путь вида /bot<token>/<method>
+        method = request.path.rstrip('/').rsplit('/', 1)[-1].split('?')[0]
+        try:
+            params = _decode_params(request.headers.get('Content-Type', ''), body)
+        except ValueError:
+            params = {}
+
+        if method != 'getUpdates':
+            if self.latency:
+                time.sleep(self.latency)
+            with self._cond:
+                now = time.monotonic()
+                self.calls.append((now, method, params))
+                self._call_count += 1
+                retry_after = self._flood_wait(method, params, now)
+                if retry_after:
+                    self.flood_responses += 1
+                self._cond.notify_all()
+            if retry_after:
+                self._reply(request, 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                })
+                return
+
+        handler = getattr(self, f'_api_{method}', None)
+        if handler is None:
+            self._reply(request, 200, {'ok': True, 'result': True})
+            return
+        self._reply(request, 200, {'ok': True, 'result': handler(params)})
+
+    def _flood_wait(self, method: str, params: dict, now: float) -> int:
+        """retry_after для ответа 429 или 0, если сообщение принимается (вызывается под self._cond)"""
+        if method not in ('sendMessage', 'editMessageText'):
+            return 0
+        if self.flood_every and self._call_count % self.flood_every == 0:
+            return self.flood_retry_after
+        if not (self.chat_limit or self.global_limit):
+            return 0
+        while self._recent and now - self._recent[0][0] >= self.flood_window:
+            self._recent.popleft()
+        chat_id = params.get('chat_id')
+        same_chat = [at for at, chat in self._recent if chat == chat_id]
+        if self.chat_limit and len(same_chat) >= self.chat_limit:
+            return max(1, math.ceil(same_chat[0] + self.flood_window - now))
+        if self.global_limit and len(self._recent) >= self.global_limit:
+            return max(1, math.ceil(self._recent[0][0] + self.flood_window - now))
+        self._recent.append((now, chat_id))
+        return 0
+
+    @staticmethod
+    def _reply(request: BaseHTTPRequestHandler, status: int, payload: dict):
+        data = json.dumps(payload).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _api_getMe(self, params):
+        return BOT_USER
+
+    def _api_setWebhook(self, params):
+        self.webhook_url = params.get('url')
+        self.webhook_secret = params.get('secret_token')
+        logger.info("Заглушка: установлен webhook %s", self.webhook_url)
+        return True
+
+    def _api_deleteWebhook(self, params):
+        self.webhook_url = None
+        self.webhook_secret = None
+        if params.get('drop_pending_updates'):
+            with self._cond:
+                self._pending.clear()
+        return True
+
+    def _api_getWebhookInfo(self, params):
+        return {'url': self.webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': len(self._pending)}
+
+    def _api_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._pending and self._pending[0]['update_id'] < offset:
+                    self._pending.popleft()
+                if self._pending:
+                    limit = int(params.get('limit') or 100)
+                    return list(self._pending)[:limit]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._server is None:
+                    return []
+                self._cond.wait(remaining)
+
+    def _message(self, params, message_id=None):
+        if message_id is None:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        chat_id = params.get('chat_id')
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = params['reply_markup']
+        self.chat_state[(chat_id, message_id)] = message['text']
+        return message
+
+    def _api_sendMessage(self, params):
+        with self._cond:
+            return self._message(params)
+
+    def _api_editMessageText(self, params):
+        return self._message(params, message_id=params.get('message_id') or 1)
+
+    def _api_answerCallbackQuery(self, params):
+        return True
+
+    # --- Доставка обновлений боту ---
+
+    def push_update(self, update: dict) -> dict:
+        """Отправляет обновление боту (webhook или очередь getUpdates). Возвращает обновление с update_id"""
+        with self._cond:
+            update = dict(update, update_id=self._next_update_id)
+            self._next_update_id += 1
+            webhook_url = self.webhook_url
+            if not webhook_url:
+                self._pending.append(update)
+                self._cond.notify_all()
+                return update
+        self._post_webhook(webhook_url, update)
+        return update
+
+    def _post_webhook(self, url: str, update: dict):
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(update).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        if self.webhook_secret:
+            request.add_header('X-Telegram-Bot-Api-Secret-Token', self.webhook_secret)
+        context = None
+        if url.startswith('https://'):
+            # Как и Telegram, доверяем только сертификату, который передал бот
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context(cafile=self.webhook_cafile)
+                self._ssl_context.check_hostname = False
+            context = self._ssl_context
+        with urllib.request.urlopen(request, timeout=10, context=context) as response:
+            response.read()
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        """Отправляет боту текстовое сообщение от пользователя"""
+        message = {
+            'message_id': 10_000 + self._next_update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self.push_update({'message': message})
+
+    def callback_update(self, user_id: int, data: str, message_id: int = 1) -> dict:
+        """Отправляет боту нажатие inline-кнопки"""
+        return self.push_update({'callback_query': {
+            'id': str(self._next_update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': '...',
+            },
+        }})
+
+    # --- Ожидание ответов бота ---
+
+    def wait_for_call(self, method: str, since: float, timeout: float = 10.0,
+                      predicate: Optional[Callable[[dict], bool]] = None) -> Optional[float]:
+        """Ждет вызова method после момента since. Возвращает время вызова (monotonic) или None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for at, name, params in self.calls:
+                    if at >= since and name == method and (predicate is None or predicate(params)):
+                        return at
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def calls_by_method(self) -> Dict[str, int]:
+        """Количество вызовов по методам"""
+        counts = {}
+        with self._cond:
+            for _, name, _ in self.calls:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--webhook-cafile', default=None,
+                        help="Сертификат бота для проверки https:// webhook (как WEBHOOK_CERT)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    stub = BotApiStub(args.host, args.port, args.webhook_cafile).start()
+    print(f"🧪 Заглушка Bot API: BOT_API_BASE_URL={stub.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
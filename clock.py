@@ -0,0 +1,99 @@
+"""
+Часы бота и автоматизации: настоящие (SystemClock) и виртуальные (VirtualClock).
+
+Паузы "как человек" (human_delay), ожидания окна Telegram и окна лимитов (минута, час,
+сутки, блокировка на час) берут время из часов, переданных в bot.py и TelegramAutomation.
+С VirtualClock паузы не ждут, а сдвигают время: диалог целиком или смена суток для
+лимита входов проверяются за доли секунды (benchmarks/virtual_time.py).
+
+Замеры длительности для метрик по-прежнему идут по time.monotonic - это реальная работа.
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class SystemClock:
+    """Настоящее время"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    async def asleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    async def wait_event(self, event: asyncio.Event, timeout: Optional[float]) -> bool:
+        """Ждет событие не дольше timeout. True - событие наступило"""
+        if timeout is None:
+            await event.wait()
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class VirtualClock:
+    """
+    Виртуальное время: паузы сразу сдвигают часы вперед
+
+    Рассчитано на последовательные сценарии (один диалог за другим): паузы двух
+    одновременных задач складываются, а не перекрываются.
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.start = start or datetime(2024, 1, 1, 9, 0, 0)
+        self._epoch = self.start.timestamp()
+        self._elapsed = 0.0
+        self._lock = threading.Lock()  # sleep() вызывается и из потоков автоматизации
+
+    @property
+    def elapsed(self) -> float:
+        """Сколько виртуальных секунд прошло с начала"""
+        return self._elapsed
+
+    def advance(self, seconds: float):
+        if seconds > 0:
+            with self._lock:
+                self._elapsed += seconds
+
+    def time(self) -> float:
+        return self._epoch + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self._elapsed)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    async def asleep(self, seconds: float):
+        self.advance(seconds)
+        await asyncio.sleep(0)  # Точка переключения, как у настоящей паузы
+
+    async def wait_event(self, event: asyncio.Event, timeout: Optional[float]) -> bool:
+        if event.is_set():
+            return True
+        await asyncio.sleep(0)
+        if event.is_set() or timeout is None:
+            await event.wait()
+            return True
+        self.advance(timeout)
+        return False
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,281 @@
+"""
+Бюджет времени на вход: номер, код и облачный пароль - у каждого свой предел.
+
+Раньше время одного шага входа ничем не ограничивалось: паузы human_delay, повторы
+activate_window, резервный путь pyautogui с его паузами, ожидание кнопки "Продолжить"
+и проверка пароля после кода складывались как придется. Теперь обработчик бота
+открывает бюджет (LOGIN_BUDGET_PHONE / _CODE / _PASSWORD секунд), и все шаги тратят из него:
+
+- каждый шаг (step, stepped, mark) учитывается отдельно: сколько длился и сколько из
+  этого было пауз; вложенные шаги пишутся путем, например enter_phone_number/pyautogui;
+- когда бюджета мало (low), шаги выбирают самый дешевый путь: паузы "для человека"
+  укорачиваются (clamp), Alt+Tab и резервный путь pyautogui пропускаются;
+- отчет (finish) называет шаг, на котором бюджет кончился, и попадает в метрики
+  login_flow_seconds, login_step_seconds, login_budget_overrun_total и в /budgets
+  служебного сервера бота.
+
+Бюджет текущего обработчика хранится в contextvars: он виден автоматизации, вызванной
+из обработчика, и не смешивается с параллельными диалогами. Без бюджета (веб-приложение,
+прогрев) все функции модуля ничего не делают.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+from collections import deque
+from typing import List, Optional
+
+from clock import SYSTEM_CLOCK
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Бюджеты шагов входа (секунды)
+LOGIN_BUDGET_PHONE = float(os.getenv('LOGIN_BUDGET_PHONE', '40'))
+LOGIN_BUDGET_CODE = float(os.getenv('LOGIN_BUDGET_CODE', '30'))
+LOGIN_BUDGET_PASSWORD = float(os.getenv('LOGIN_BUDGET_PASSWORD', '20'))
+# Сколько секунд паузы "для человека" оставляют на работу с окном
+LOGIN_BUDGET_RESERVE = float(os.getenv('LOGIN_BUDGET_RESERVE', '10'))
+
+# Сколько последних отчетов отдавать по /budgets
+BUDGET_REPORTS = 50
+
+# Шаг, на который не пришлось ни одного открытого шага (например, ответ пользователю)
+UNTRACKED = 'other'
+
+LOGIN_FLOW_SECONDS = REGISTRY.histogram(
+    'login_flow_seconds', 'Длительность шага входа (flow: phone, code, password)',
+    buckets=(1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 120.0))
+LOGIN_STEP_SECONDS = REGISTRY.histogram('login_step_seconds', 'Длительность частей шага входа')
+LOGIN_BUDGET_OVERRUN = REGISTRY.counter(
+    'login_budget_overrun_total', 'Шаги входа, вышедшие за бюджет (step - на котором он кончился)')
+LOGIN_BUDGET_SHORTCUT = REGISTRY.counter(
+    'login_budget_shortcut_total', 'Пропущенные или укороченные действия из-за малого остатка бюджета')
+
+_current = contextvars.ContextVar('login_budget', default=None)
+_reports = deque(maxlen=BUDGET_REPORTS)
+
+
+class Budget:
+    """Бюджет одного шага входа и учет его частей"""
+
+    def __init__(self, flow: str, seconds: float, clock=None):
+        self.flow = flow
+        self.seconds = seconds
+        self.clock = clock or SYSTEM_CLOCK
+        self.started = self.clock.monotonic()
+        self.deadline = self.started + seconds
+        self.steps = []  # [путь, начало, конец или None, паузы]
+        self.overran = None
+        self.shortcuts = []
+        self._stack = []  # Открытые шаги: индексы в steps
+        self._marks = []  # Открытая отметка (mark) на каждом уровне или None
+
+    # --- Остаток ---
+
+    def remaining(self) -> float:
+        return self.deadline - self.clock.monotonic()
+
+    def low(self, need: float) -> bool:
+        """Осталось меньше need секунд"""
+        return self.remaining() < need
+
+    def clamp(self, seconds: float, keep: float = 0.0) -> float:
+        """Пауза не длиннее остатка бюджета за вычетом keep секунд"""
+        return max(0.0, min(seconds, self.remaining() - keep))
+
+    # --- Шаги ---
+
+    def _path(self, name: str) -> str:
+        if not self._stack:
+            return name
+        return f'{self.steps[self._stack[-1]][0]}/{name}'
+
+    def _open(self, name: str) -> int:
+        self.steps.append([self._path(name), self.clock.monotonic(), None, 0.0])
+        return len(self.steps) - 1
+
+    def _close(self, index: int):
+        step = self.steps[index]
+        step[2] = self.clock.monotonic()
+        # Вложенные шаги закрываются раньше - в overran остается самый глубокий
+        if self.overran is None and step[1] < self.deadline <= step[2]:
+            self.overran = step[0]
+
+    def _close_mark(self):
+        if self._marks and self._marks[-1] is not None:
+            self._close(self._marks[-1])
+            self._marks[-1] = None
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        """Часть шага входа (вложенные части пишутся путем parent/name)"""
+        self._close_mark()
+        index = self._open(name)
+        self._stack.append(index)
+        self._marks.append(None)
+        try:
+            yield self
+        finally:
+            self._close_mark()
+            self._marks.pop()
+            self._stack.pop()
+            self._close(index)
+
+    def mark(self, name: str):
+        """Начало новой части внутри текущего шага (до следующей отметки или конца шага)"""
+        self._close_mark()
+        if not self._marks:
+            self._marks.append(None)
+        self._marks[-1] = self._open(name)
+
+    def waited(self, seconds: float):
+        """Учитывает паузу в самой глубокой открытой части"""
+        if self._marks and self._marks[-1] is not None:
+            self.steps[self._marks[-1]][3] += seconds
+        elif self._stack:
+            self.steps[self._stack[-1]][3] += seconds
+
+    def shortcut(self, what: str):
+        """Отмечает действие, пропущенное или укороченное из-за малого остатка"""
+        self.shortcuts.append(what)
+        LOGIN_BUDGET_SHORTCUT.inc(flow=self.flow, step=what)
+        logger.info("Бюджет %s: осталось %.1f с, %s - короткий путь", self.flow, self.remaining(), what)
+
+    # --- Отчет ---
+
+    def report(self, outcome: Optional[str] = None) -> dict:
+        now = self.clock.monotonic()
+        return {
+            'flow': self.flow,
+            'budget_s': self.seconds,
+            'spent_s': round(now - self.started, 3),
+            'remaining_s': round(self.deadline - now, 3),
+            'outcome': outcome,
+            'overran': self.overran,
+            'shortcuts': list(self.shortcuts),
+            'steps': [
+                {
+                    'step': path,
+                    'at_s': round(start - self.started, 3),
+                    'seconds': round((end if end is not None else now) - start, 3),
+                    'waited_s': round(waited, 3),
+                    'over': (end if end is not None else now) > self.deadline,
+                }
+                for path, start, end, waited in self.steps
+            ],
+        }
+
+    def finish(self, outcome: str) -> Optional[dict]:
+        """
+        Закрывает бюджет: метрики, лог и отчет для /budgets
+
+        Returns:
+            Отчет или None, если ни одной части не было (обработчик не дошел до входа)
+        """
+        self._close_mark()
+        if not self.steps:
+            return None
+        now = self.clock.monotonic()
+        if self.overran is None and now > self.deadline:
+            self.overran = UNTRACKED  # Бюджет кончился между шагами
+        report = self.report(outcome)
+        LOGIN_FLOW_SECONDS.observe(now - self.started, flow=self.flow, outcome=outcome)
+        for path, start, end, _ in self.steps:
+            LOGIN_STEP_SECONDS.observe((end if end is not None else now) - start, flow=self.flow, step=path)
+        if self.overran is not None:
+            LOGIN_BUDGET_OVERRUN.inc(flow=self.flow, step=self.overran)
+            logger.warning("Бюджет %s (%.0f с) превышен на шаге %s: всего %.1f с (%s)",
+                           self.flow, self.seconds, self.overran, now - self.started, outcome)
+        else:
+            logger.debug("Бюджет %s: %.1f из %.0f с (%s)", self.flow, now - self.started, self.seconds, outcome)
+        _reports.append(report)
+        return report
+
+    @contextlib.contextmanager
+    def use(self):
+        """Делает бюджет текущим для кода внутри блока (и вызванной из него автоматизации)"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+# --- Текущий бюджет (без него функции ничего не делают) ---
+
+def current() -> Optional[Budget]:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def step(name: str):
+    budget = _current.get()
+    if budget is None:
+        yield None
+        return
+    with budget.step(name):
+        yield budget
+
+
+def stepped(name: Optional[str] = None):
+    """Декоратор: вызов функции - часть текущего бюджета"""
+    def decorator(func):
+        step_name = name or func.__name__.lstrip('_')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            budget = _current.get()
+            if budget is None:
+                return func(*args, **kwargs)
+            with budget.step(step_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def mark(name: str):
+    budget = _current.get()
+    if budget is not None:
+        budget.mark(name)
+
+
+def waited(seconds: float):
+    budget = _current.get()
+    if budget is not None:
+        budget.waited(seconds)
+
+
+def low(need: float) -> bool:
+    budget = _current.get()
+    return budget is not None and budget.low(need)
+
+
+def clamp(seconds: float, keep: float = 0.0, what: Optional[str] = None) -> float:
+    """Пауза, укороченная до остатка бюджета; what - имя для учета укороченных пауз"""
+    budget = _current.get()
+    if budget is None:
+        return seconds
+    clamped = budget.clamp(seconds, keep)
+    if what and clamped < seconds:
+        budget.shortcut(what)
+    return clamped
+
+
+def shortcut(what: str):
+    budget = _current.get()
+    if budget is not None:
+        budget.shortcut(what)
+
+
+def reports() -> List[dict]:
+    """Последние отчеты, от новых к старым"""
+    return list(reversed(list(_reports)))
+
+
+def budgets_route(query: str):
+    """Маршрут /budgets для служебного HTTP-сервера (metrics.add_route)"""
+    body = json.dumps({'budgets': reports()}, ensure_ascii=False).encode('utf-8')
+    return 200, 'application/json', body
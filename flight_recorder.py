@@ -0,0 +1,217 @@
+"""
+Бортовой самописец: последние N прогонов автоматизации Telegram в памяти.
+
+Прогон - один вызов ввода номера, кода или пароля со всеми вложенными действиями:
+поиск окна, поиски элементов, клики и нажатия pyautogui, выбранная стратегия
+(pywinauto / pyautogui), паузы и итог. Событие - кортеж, добавляемый в список прогона,
+словари собираются только при чтении, поэтому запись почти ничего не стоит.
+Готовые прогоны кладутся в deque фиксированного размера (FLIGHT_RECORDER_SIZE).
+
+Номера, коды и пароли маскируются в момент записи и в памяти не хранятся.
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+# Сколько последних прогонов хранить
+FLIGHT_RECORDER_SIZE = int(os.getenv('FLIGHT_RECORDER_SIZE', '50'))
+
+# Поля событий, значения которых маскируются
+SECRET_FIELDS = frozenset({'phone', 'code', 'password', 'text'})
+
+# Действия pyautogui, которые попадают в прогон; у write/typewrite маскируется текст
+PYAUTOGUI_ACTIONS = frozenset({'click', 'press', 'hotkey', 'write', 'typewrite', 'moveTo'})
+PYAUTOGUI_SECRET_ACTIONS = frozenset({'write', 'typewrite'})
+
+
+def redact(key: str, value):
+    """Маскирует секрет: у номера остаются первые и последние 2 символа, у остального - только длина"""
+    if value is None:
+        return None
+    text = str(value)
+    if key == 'phone' and len(text) > 4:
+        return text[:2] + '*' * (len(text) - 4) + text[-2:]
+    return '*' * len(text)
+
+
+class RunTrace:
+    """Один прогон автоматизации"""
+
+    __slots__ = ('run_id', 'kind', 'started_at', 'events', 'strategy', 'waited', 'outcome', 'error',
+                 'duration', '_t0')
+
+    def __init__(self, run_id: int, kind: str):
+        self.run_id = run_id
+        self.kind = kind
+        self.started_at = time.time()
+        self.events = []  # (смещение от начала, действие, детали или None)
+        self.strategy = None
+        self.waited = 0.0
+        self.outcome = None
+        self.error = None
+        self.duration = None
+        self._t0 = time.perf_counter()
+
+    def event(self, action: str, **detail):
+        if detail and not SECRET_FIELDS.isdisjoint(detail):
+            for key in SECRET_FIELDS.intersection(detail):
+                detail[key] = redact(key, detail[key])
+        self.events.append((time.perf_counter() - self._t0, action, detail or None))
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.run_id,
+            'kind': self.kind,
+            'started': datetime.fromtimestamp(self.started_at).strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'waited_ms': round(self.waited * 1000, 1),
+            'strategy': self.strategy,
+            'outcome': self.outcome,
+            'error': self.error,
+            'events': [
+                {'at_ms': round(offset * 1000, 1), 'action': action, **(detail or {})}
+                for offset, action, detail in self.events
+            ],
+        }
+
+
+class FlightRecorder:
+    """Кольцевой буфер последних прогонов"""
+
+    def __init__(self, capacity: int = FLIGHT_RECORDER_SIZE):
+        self._runs = deque(maxlen=capacity)
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def current(self) -> Optional[RunTrace]:
+        """Прогон, идущий в текущем потоке"""
+        return getattr(self._local, 'trace', None)
+
+    # --- Запись ---
+
+    def traced(self, kind: Optional[str] = None, nested_only: bool = False):
+        """
+        Декоратор метода автоматизации
+
+        Вызов вне прогона начинает новый прогон (итог - по возвращенному bool),
+        вызов внутри прогона записывается как событие. nested_only=True - метод
+        сам прогон не начинает (поиск окна из фонового прогрева, опрос статуса веб-приложением).
+        """
+        def decorator(method):
+            name = kind or method.__name__
+
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                trace = self.current()
+                if trace is not None:
+                    trace.event('call', name=name)
+                    return method(*args, **kwargs)
+                if nested_only:
+                    return method(*args, **kwargs)
+                trace = self._local.trace = RunTrace(next(self._ids), name)
+                try:
+                    result = method(*args, **kwargs)
+                    trace.outcome = 'ok' if result else 'fail'
+                    return result
+                except BaseException as e:
+                    trace.outcome = 'error'
+                    trace.error = f'{type(e).__name__}: {e}'
+                    raise
+                finally:
+                    trace.duration = time.perf_counter() - trace._t0
+                    self._local.trace = None
+                    self._runs.append(trace)
+            return wrapper
+        return decorator
+
+    def event(self, action: str, **detail):
+        """Событие текущего прогона (вне прогона ничего не делает)"""
+        trace = self.current()
+        if trace is not None:
+            trace.event(action, **detail)
+
+    def strategy(self, name: str):
+        """Отмечает выбранную стратегию ввода"""
+        trace = self.current()
+        if trace is not None:
+            trace.strategy = name
+            trace.event('strategy', name=name)
+
+    def wait(self, seconds: float, sleep=time.sleep):
+        """Пауза (по умолчанию time.sleep) с записью в прогон"""
+        sleep(seconds)
+        trace = self.current()
+        if trace is not None:
+            trace.waited += seconds
+            trace.event('wait', seconds=seconds)
+
+    def instrument(self, module, actions=PYAUTOGUI_ACTIONS, secret_actions=PYAUTOGUI_SECRET_ACTIONS):
+        """Обертка модуля (pyautogui): перечисленные функции записываются в текущий прогон"""
+        return _Instrumented(module, self, actions, secret_actions)
+
+    # --- Чтение ---
+
+    def runs(self) -> List[RunTrace]:
+        return list(self._runs)
+
+    def snapshot(self, slowest: int = 3) -> dict:
+        """Прогоны от новых к старым; самые медленные помечены slow=True"""
+        runs = [trace.to_dict() for trace in reversed(list(self._runs))]  # копия: буфер пополняется из других потоков
+        return {'capacity': self._runs.maxlen, 'runs': mark_slowest(runs, slowest)}
+
+
+def mark_slowest(runs: List[dict], count: int = 3) -> List[dict]:
+    """Помечает count самых долгих прогонов (slow=True)"""
+    ranked = sorted((run for run in runs if run.get('duration_ms') is not None),
+                    key=lambda run: run['duration_ms'], reverse=True)
+    slow = {id(run) for run in ranked[:count]}
+    for run in runs:
+        run['slow'] = id(run) in slow
+    return runs
+
+
+def runs_route(query: str):
+    """Маршрут /runs для служебного HTTP-сервера (metrics.add_route)"""
+    body = json.dumps(RECORDER.snapshot(), ensure_ascii=False).encode('utf-8')
+    return 200, 'application/json', body
+
+
+class _Instrumented:
+    """Прокси модуля: действия из списка пишутся в прогон, остальное отдается как есть"""
+
+    def __init__(self, module, recorder: FlightRecorder, actions, secret_actions):
+        self._module = module
+        self._recorder = recorder
+        self._actions = actions
+        self._secret_actions = secret_actions
+
+    def __getattr__(self, name):
+        attr = getattr(self._module, name)
+        if name not in self._actions:
+            return attr
+        recorder = self._recorder
+        secret = name in self._secret_actions
+        action_name = f'{getattr(self._module, "__name__", "module")}.{name}'
+
+        @functools.wraps(attr)
+        def action(*args, **kwargs):
+            trace = recorder.current()
+            if trace is not None:
+                if secret:
+                    trace.event(action_name, text=args[0] if args else kwargs.get('message'))
+                else:
+                    trace.event(action_name, args=list(args))
+            return attr(*args, **kwargs)
+
+        # Следующие обращения не проходят через __getattr__
+        setattr(self, name, action)
+        return action
+
+
+RECORDER = FlightRecorder()
@@ -0,0 +1,267 @@
+"""
+Пакетный ввод для резервного пути pyautogui: последовательность действий одной отправкой.
+
+Резервный ввод номера был десятком отдельных вызовов pyautogui: клик, Ctrl+A, Delete,
+write по символу, Enter, Tab... Каждый вызов - свой вызов ОС на каждое событие, после
+него глобальная пауза pyautogui.PAUSE (0.2-0.5 с), а потом еще self.wait. Здесь
+последовательность собирается заранее (InputSequence) и отправляется кусками между явными
+паузами (wait) - паузы ставятся только там, где окну нужно время: открыть список стран,
+перевести фокус. Кусок отправляет:
+
+- SendInputSender (Windows): все события куска - один массив INPUT в один вызов
+  user32.SendInput; текст идет символами Unicode (KEYEVENTF_UNICODE), без раскладки;
+  перед каждым куском - проверка FAILSAFE pyautogui (мышь в углу экрана);
+- PyAutoGuiSender (не Windows, имитация, INPUT_SENDINPUT=0): те же вызовы pyautogui,
+  но без паузы PAUSE после каждого (_pause=False) и без интервала между символами.
+
+Замер ввода номера прежним и пакетным путем: benchmarks/phone_entry_input.py.
+"""
+import ctypes
+import logging
+import os
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 0 - не отправлять через SendInput, даже на Windows (пакет уйдет вызовами pyautogui без пауз)
+INPUT_SENDINPUT = os.getenv('INPUT_SENDINPUT', '1').lower() in ('1', 'true', 'yes')
+
+INPUT_BATCH_SECONDS = REGISTRY.histogram(
+    'input_batch_seconds', 'Отправка куска пакетного ввода (sender: sendinput, pyautogui)',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+# Действие: ('click', x, y), ('hotkey', (клавиши,)), ('press', клавиша), ('write', текст)
+Action = Tuple
+
+
+class InputSequence:
+    """Последовательность действий ввода с явными паузами"""
+
+    def __init__(self):
+        self.steps: List[Action] = []
+
+    def click(self, x: int, y: int) -> 'InputSequence':
+        self.steps.append(('click', int(x), int(y)))
+        return self
+
+    def hotkey(self, *keys: str) -> 'InputSequence':
+        self.steps.append(('hotkey', keys))
+        return self
+
+    def press(self, key: str) -> 'InputSequence':
+        self.steps.append(('press', key))
+        return self
+
+    def write(self, text: str) -> 'InputSequence':
+        if text:
+            self.steps.append(('write', text))
+        return self
+
+    def wait(self, seconds: float) -> 'InputSequence':
+        """Пауза: окну нужно время, прежде чем принимать следующие события"""
+        self.steps.append(('wait', seconds))
+        return self
+
+    def segments(self) -> List[Tuple[List[Action], float]]:
+        """Куски между паузами: (действия, пауза после них)"""
+        segments = []
+        actions = []
+        for step in self.steps:
+            if step[0] == 'wait':
+                segments.append((actions, step[1]))
+                actions = []
+            else:
+                actions.append(step)
+        if actions:
+            segments.append((actions, 0.0))
+        return segments
+
+
+def send(sequence: InputSequence, sender, wait: Callable[[float], None], on_segment=None):
+    """
+    Отправляет последовательность: кусок - одним вызовом sender.send, паузы - через wait
+
+    Args:
+        sequence: Последовательность действий
+        sender: SendInputSender или PyAutoGuiSender
+        wait: Пауза (TelegramAutomation.wait - с учетом в прогоне и бюджете входа)
+        on_segment: Вызывается с действиями куска перед отправкой (запись в самописец)
+    """
+    for actions, pause in sequence.segments():
+        if actions:
+            if on_segment is not None:
+                on_segment(actions)
+            started = time.perf_counter()
+            sender.send(actions)
+            INPUT_BATCH_SECONDS.observe(time.perf_counter() - started, sender=sender.name)
+        if pause:
+            wait(pause)
+
+
+class PyAutoGuiSender:
+    """Кусок - вызовами pyautogui, но без паузы PAUSE после каждого"""
+
+    name = 'pyautogui'
+
+    def __init__(self, pyautogui):
+        self.pyautogui = pyautogui
+
+    def send(self, actions: List[Action]):
+        pyautogui = self.pyautogui
+        for action in actions:
+            kind = action[0]
+            if kind == 'click':
+                pyautogui.click(action[1], action[2], _pause=False)
+            elif kind == 'hotkey':
+                pyautogui.hotkey(*action[1], _pause=False)
+            elif kind == 'press':
+                pyautogui.press(action[1], _pause=False)
+            elif kind == 'write':
+                pyautogui.write(action[1], _pause=False)
+
+
+# --- SendInput (Windows) ---
+
+INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
+KEYEVENTF_EXTENDEDKEY = 0x0001
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+MOUSEEVENTF_MOVE = 0x0001
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_ABSOLUTE = 0x8000
+SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+
+# Виртуальные коды клавиш (имена - как у pyautogui)
+VK_CODES = {
+    'enter': 0x0D, 'return': 0x0D, 'tab': 0x09, 'backspace': 0x08, 'esc': 0x1B, 'escape': 0x1B,
+    'space': 0x20, 'delete': 0x2E, 'del': 0x2E, 'home': 0x24, 'end': 0x23,
+    'left': 0x25, 'up': 0x26, 'right': 0x27, 'down': 0x28,
+    'ctrl': 0x11, 'ctrlleft': 0xA2, 'alt': 0x12, 'altleft': 0xA4, 'shift': 0x10, 'shiftleft': 0xA0,
+}
+# Клавиши расширенного блока: без флага Delete и стрелки приходят как клавиши цифрового блока
+EXTENDED_KEYS = frozenset({0x2E, 0x24, 0x23, 0x25, 0x26, 0x27, 0x28})
+
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [('dx', ctypes.c_long), ('dy', ctypes.c_long), ('mouseData', ctypes.c_ulong),
+                ('dwFlags', ctypes.c_ulong), ('time', ctypes.c_ulong), ('dwExtraInfo', ctypes.c_size_t)]
+
+
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = [('wVk', ctypes.c_ushort), ('wScan', ctypes.c_ushort), ('dwFlags', ctypes.c_ulong),
+                ('time', ctypes.c_ulong), ('dwExtraInfo', ctypes.c_size_t)]
+
+
+class HARDWAREINPUT(ctypes.Structure):
+    _fields_ = [('uMsg', ctypes.c_ulong), ('wParamL', ctypes.c_ushort), ('wParamH', ctypes.c_ushort)]
+
+
+class _InputUnion(ctypes.Union):
+    _fields_ = [('mi', MOUSEINPUT), ('ki', KEYBDINPUT), ('hi', HARDWAREINPUT)]
+
+
+class INPUT(ctypes.Structure):
+    _fields_ = [('type', ctypes.c_ulong), ('u', _InputUnion)]
+
+
+def _vk(key: str) -> int:
+    key = key.lower()
+    if key in VK_CODES:
+        return VK_CODES[key]
+    if len(key) == 1 and key.isalnum() and key.isascii():
+        return ord(key.upper())
+    raise ValueError(f"Неизвестная клавиша для SendInput: {key}")
+
+
+def _key(vk: int, up: bool) -> INPUT:
+    flags = (KEYEVENTF_KEYUP if up else 0) | (KEYEVENTF_EXTENDEDKEY if vk in EXTENDED_KEYS else 0)
+    return INPUT(type=INPUT_KEYBOARD, u=_InputUnion(ki=KEYBDINPUT(wVk=vk, wScan=0, dwFlags=flags)))
+
+
+def _unit(code: int, up: bool) -> INPUT:
+    flags = KEYEVENTF_UNICODE | (KEYEVENTF_KEYUP if up else 0)
+    return INPUT(type=INPUT_KEYBOARD, u=_InputUnion(ki=KEYBDINPUT(wVk=0, wScan=code, dwFlags=flags)))
+
+
+def _mouse(dx: int, dy: int, flags: int) -> INPUT:
+    return INPUT(type=INPUT_MOUSE, u=_InputUnion(mi=MOUSEINPUT(dx=dx, dy=dy, dwFlags=flags)))
+
+
+class SendInputSender:
+    """Кусок - одним массивом INPUT в один вызов user32.SendInput"""
+
+    name = 'sendinput'
+
+    def __init__(self, user32, failsafe: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            user32: ctypes.WinDLL('user32')
+            failsafe: Проверка перед отправкой (pyautogui.failSafeCheck)
+        """
+        self.user32 = user32
+        self.failsafe = failsafe
+
+    def _desktop(self) -> Tuple[int, int, int, int]:
+        metrics = self.user32.GetSystemMetrics
+        return (metrics(SM_XVIRTUALSCREEN), metrics(SM_YVIRTUALSCREEN),
+                metrics(SM_CXVIRTUALSCREEN), metrics(SM_CYVIRTUALSCREEN))
+
+    def events(self, actions: List[Action], desktop: Tuple[int, int, int, int] = (0, 0, 1920, 1080)) -> List[INPUT]:
+        """События INPUT куска; desktop - (left, top, width, height) виртуального экрана"""
+        left, top, width, height = desktop
+        events = []
+        for action in actions:
+            kind = action[0]
+            if kind == 'click':
+                # Абсолютные координаты SendInput - доли 0..65535 виртуального экрана
+                dx = (action[1] - left) * 65535 // max(1, width - 1)
+                dy = (action[2] - top) * 65535 // max(1, height - 1)
+                absolute = MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK
+                events.append(_mouse(dx, dy, MOUSEEVENTF_MOVE | absolute))
+                events.append(_mouse(dx, dy, MOUSEEVENTF_LEFTDOWN | absolute))
+                events.append(_mouse(dx, dy, MOUSEEVENTF_LEFTUP | absolute))
+            elif kind == 'hotkey':
+                codes = [_vk(key) for key in action[1]]
+                events.extend(_key(vk, False) for vk in codes)
+                events.extend(_key(vk, True) for vk in reversed(codes))
+            elif kind == 'press':
+                vk = _vk(action[1])
+                events.extend((_key(vk, False), _key(vk, True)))
+            elif kind == 'write':
+                # UTF-16: символы вне BMP - двумя суррогатами
+                data = action[1].encode('utf-16-le')
+                for index in range(0, len(data), 2):
+                    code = data[index] | (data[index + 1] << 8)
+                    events.extend((_unit(code, False), _unit(code, True)))
+        return events
+
+    def send(self, actions: List[Action]):
+        if self.failsafe is not None:
+            self.failsafe()
+        events = self.events(actions, self._desktop())
+        array = (INPUT * len(events))(*events)
+        sent = self.user32.SendInput(len(events), array, ctypes.sizeof(INPUT))
+        if sent != len(events):
+            # Ввод заблокирован (UIPI: окно запущено от администратора) или прерван
+            raise OSError(ctypes.get_last_error(), f"SendInput отправил {sent} из {len(events)} событий")
+
+
+def native_sender(failsafe: Optional[Callable[[], None]] = None) -> Optional[SendInputSender]:
+    """SendInputSender на Windows (если не выключен INPUT_SENDINPUT=0), иначе None"""
+    if not INPUT_SENDINPUT or sys.platform != 'win32':
+        return None
+    try:
+        user32 = ctypes.WinDLL('user32', use_last_error=True)
+    except (AttributeError, OSError) as e:
+        logger.warning("SendInput недоступен, пакетный ввод пойдет через pyautogui: %s", e)
+        return None
+    user32.SendInput.argtypes = (ctypes.c_uint, ctypes.POINTER(INPUT), ctypes.c_int)
+    user32.SendInput.restype = ctypes.c_uint
+    return SendInputSender(user32, failsafe)
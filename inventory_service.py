@@ -0,0 +1,359 @@
+"""
+Общая служба инвентаризации окон Telegram для бота и веб-приложения.
+
+bot.py и web_app.py - отдельные процессы, и каждый сам перебирал процессы Telegram и
+подключался к их окнам: на одном рабочем столе UI опрашивался вдвое чаще нужного.
+Служба владеет обнаружением: держит по TelegramAutomation на процесс (окно и элементы
+экрана входа переиспользуются между проходами), раз в INVENTORY_INTERVAL обновляет
+снимок сессий и раздает его по локальному сокету. Окна при этом опрашиваются лениво:
+проба экрана входа и номера повторяется не чаще раза в INVENTORY_PROBE_TTL секунд.
+
+Протокол - JSON-строки по TCP (только localhost). Запрос - одна строка {"op": ...}:
+  snapshot  - текущий снимок: {"version", "resources_version", "sessions", "status"};
+              version растет при изменении сессий, resources_version - при новом замере ресурсов
+  refresh   - пройти по окнам сейчас и вернуть снимок
+  subscribe - снимок сразу и затем новый снимок при каждом изменении (соединение не закрывается)
+  stats     - счетчики обращений к UI и ресурсы процессов Telegram
+
+Запуск: python inventory_service.py (адрес - INVENTORY_ADDR, по умолчанию 127.0.0.1:8765).
+Бот и веб-приложение переходят на службу, если у них задан INVENTORY_ADDR.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+from metrics import REGISTRY
+from resource_sampler import RESOURCE_SAMPLE_INTERVAL, ResourceSampler
+from session_snapshot import SessionSnapshot
+from ui_locator import UI_CALLS
+
+logger = logging.getLogger(__name__)
+
+# Адрес службы host:port; пусто - каждый процесс опрашивает окна сам
+INVENTORY_ADDR = os.getenv('INVENTORY_ADDR', '')
+DEFAULT_ADDR = '127.0.0.1:8765'
+# Период обхода окон (секунды)
+INVENTORY_INTERVAL = float(os.getenv('INVENTORY_INTERVAL', '5'))
+# Сколько секунд проба окна (экран входа, номер) считается свежей; обход списка процессов - чаще
+INVENTORY_PROBE_TTL = float(os.getenv('INVENTORY_PROBE_TTL', '15'))
+
+
+# Метрики ресурсов процессов в ответе stats
+RESOURCE_METRICS = ('telegram_process_cpu_percent', 'telegram_process_rss_bytes',
+                    'telegram_process_threads', 'telegram_process_handles')
+
+
+def parse_addr(addr: str) -> Tuple[str, int]:
+    host, _, port = (addr or DEFAULT_ADDR).rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+# --- Обнаружение (общее с веб-приложением без службы) ---
+
+def list_telegram_processes() -> List[dict]:
+    """Процессы Telegram: pid, имя, время запуска"""
+    processes = []
+    for proc in psutil.process_iter(['pid', 'name', 'create_time']):
+        try:
+            proc_name = proc.info.get('name', '').lower() if proc.info.get('name') else ''
+            if 'telegram' in proc_name:
+                processes.append({
+                    'pid': proc.info['pid'],
+                    'name': proc.info['name'],
+                    'started': datetime.fromtimestamp(proc.info['create_time']).strftime('%Y-%m-%d %H:%M:%S')
+                })
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+    return processes
+
+
+# Дорогие поля сессии, когда окно процесса не найдено или проверка упала
+NO_WINDOW_FIELDS = {'authorized': False, 'phone': 'Окно не найдено', 'status': 'Окно не найдено'}
+ERROR_FIELDS = {'authorized': False, 'phone': 'Ошибка проверки', 'status': 'Ошибка проверки'}
+
+
+def authorization_fields(automation) -> dict:
+    """Поля authorized и status: проверка экрана входа в окне"""
+    is_authorized = automation.check_if_authorized()
+    return {'authorized': is_authorized, 'status': 'Авторизован' if is_authorized else 'Требуется вход'}
+
+
+def window_phone(window) -> str:
+    """Номер из текста окна ("Неизвестно", если не найден)"""
+    try:
+        UI_CALLS.inc(kind='window_text')
+        phone_match = re.search(r'\+?\d{10,15}', window.window_text())
+        if phone_match:
+            return phone_match.group()
+    except Exception:
+        pass
+    return "Неизвестно"
+
+
+def describe_session(proc_info: dict, automation) -> dict:
+    """Сессия для списка: статус авторизации и номер из заголовка окна"""
+    base = {'pid': proc_info['pid'], 'name': proc_info['name'], 'started': proc_info['started']}
+    if not automation.telegram_window:
+        # Процесс есть, но окно не найдено
+        return dict(base, **NO_WINDOW_FIELDS)
+    authorization = authorization_fields(automation)
+    # Пробуем найти номер в тексте окна
+    return dict(base, authorized=authorization['authorized'], phone=window_phone(automation.telegram_window),
+                status=authorization['status'])
+
+
+def error_session(proc_info: dict) -> dict:
+    return dict({'pid': proc_info['pid'], 'name': proc_info['name'], 'started': proc_info['started']},
+                **ERROR_FIELDS)
+
+
+class Inventory:
+    """
+    Окна Telegram по процессам для снимка службы
+
+    Список процессов читается на каждом проходе, а пробы окон (экран входа, номер) - через
+    SessionProber (session_probe.py): не чаще раза в INVENTORY_PROBE_TTL секунд на сессию,
+    с подключением к окну, которое живет между проходами. Запрос refresh повторяет пробы сразу.
+    """
+
+    def __init__(self, automation_factory: Optional[Callable] = None, probe_ttl: Optional[float] = None):
+        from session_probe import PROBES, SessionProber
+        self.prober = SessionProber(ttl=INVENTORY_PROBE_TTL if probe_ttl is None else probe_ttl,
+                                    automation_factory=automation_factory)
+        self._probes = set(PROBES)
+        self._since = None  # Пробы раньше этого момента (monotonic) устарели независимо от TTL
+
+    def invalidate(self):
+        """Следующий проход повторит пробы всех окон"""
+        self._since = time.monotonic()
+
+    def scan(self) -> List[dict]:
+        sessions = []
+        for session in self.prober.sessions():
+            values = self.prober.probe(session, self._probes, self._since)
+            sessions.append(dict(session, **values) if values else session)
+        return sessions
+
+
+# --- Служба ---
+
+class InventoryService:
+    """Периодический обход окон и раздача снимков по сокету"""
+
+    def __init__(self, addr: str = INVENTORY_ADDR, interval: float = INVENTORY_INTERVAL,
+                 inventory: Optional[Inventory] = None, sample_interval: float = RESOURCE_SAMPLE_INTERVAL):
+        self.host, self.port = parse_addr(addr)
+        self.interval = interval
+        self.inventory = inventory or Inventory()
+        self.snapshot = SessionSnapshot(self.inventory.scan, ttl=interval)
+        # Ресурсы процессов замеряются со своим периодом и попадают в тот же снимок
+        self.sampler = ResourceSampler(sample_interval) if sample_interval > 0 else None
+        if self.sampler is not None:
+            self.sampler.subscribe(self._apply_resources)
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._server = None
+
+    def message(self) -> dict:
+        with self._changed:
+            return {
+                'version': self.snapshot.version,
+                'resources_version': self.snapshot.resources_version,
+                'sessions': self.snapshot.session_list(),
+                'status': self.snapshot.status(),
+            }
+
+    def refresh(self, probe: bool = False):
+        """Проход по окнам; probe - повторить и свежие пробы окон (запрос refresh)"""
+        if probe:
+            self.inventory.invalidate()
+        version = self.snapshot.revision
+        self.snapshot.ensure_fresh(force=True)
+        if self.snapshot.revision != version:
+            with self._changed:
+                self._changed.notify_all()
+
+    def _apply_resources(self, resources: Dict[int, dict]):
+        if self.snapshot.set_resources(resources):
+            with self._changed:
+                self._changed.notify_all()
+
+    def _scan_loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Ошибка обхода окон: %s", e)
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def wait_for_change(self, message: dict, timeout: float) -> bool:
+        """Ждет, пока снимок (сессии или ресурсы) станет новее отправленного message"""
+        sent = (message['version'], message['resources_version'])
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: (self.snapshot.version, self.snapshot.resources_version) != sent or self._stop.is_set(),
+                timeout=timeout)
+
+    def start(self) -> 'InventoryService':
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        op = json.loads(line.decode('utf-8')).get('op')
+                    except ValueError:
+                        self._send({'error': 'bad request'})
+                        continue
+                    if op == 'subscribe':
+                        self._stream()
+                        return
+                    if op == 'refresh':
+                        service.refresh(probe=True)
+                    if op == 'stats':
+                        metrics = REGISTRY.snapshot()
+                        self._send({'metrics': metrics.get('ui_calls_total'),
+                                    'resources': {name: metrics.get(name) for name in RESOURCE_METRICS}})
+                    elif op in ('snapshot', 'refresh'):
+                        self._send(service.message())
+                    else:
+                        self._send({'error': f'unknown op {op}'})
+
+            def _stream(self):
+                message = service.message()
+                self._send(message)
+                while not service._stop.is_set():
+                    if service.wait_for_change(message, timeout=30):
+                        message = service.message()
+                    # Раз в 30 секунд без изменений - тот же снимок, чтобы клиент видел живое соединение
+                    self._send(message)
+
+            def _send(self, payload: dict):
+                self.wfile.write(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='inventory-server', daemon=True).start()
+        threading.Thread(target=self._scan_loop, name='inventory-scan', daemon=True).start()
+        if self.sampler is not None:
+            self.sampler.start()
+        logger.info("Служба инвентаризации слушает %s:%s (обход каждые %s с)", self.host, self.port, self.interval)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.sampler is not None:
+            self.sampler.stop()
+        with self._changed:
+            self._changed.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# --- Клиент ---
+
+class InventoryClient:
+    """Клиент службы для бота и веб-приложения"""
+
+    def __init__(self, addr: str = INVENTORY_ADDR, timeout: float = 5.0):
+        self.host, self.port = parse_addr(addr)
+        self.timeout = timeout
+
+    def request(self, op: str) -> dict:
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            sock.sendall(json.dumps({'op': op}).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as stream:
+                line = stream.readline()
+        if not line:
+            raise ConnectionError("служба инвентаризации закрыла соединение")
+        return json.loads(line.decode('utf-8'))
+
+    def sessions(self) -> List[dict]:
+        return self.request('snapshot')['sessions']
+
+    def authorization(self) -> Dict[int, Optional[bool]]:
+        """
+        Авторизация по PID процессов Telegram
+
+        Returns:
+            {pid: True/False} по проверке экрана входа; None - окно не найдено, проверка
+            не удалась или еще не выполнялась
+        """
+        unknown = (NO_WINDOW_FIELDS['status'], ERROR_FIELDS['status'])
+        return {session['pid']: (session['authorized'] if 'authorized' in session
+                                 and session.get('status') not in unknown else None)
+                for session in self.sessions()}
+
+    def subscribe(self, callback: Callable[[dict], None], stop: Optional[threading.Event] = None,
+                  resources: bool = True) -> threading.Thread:
+        """
+        Фоновый поток: callback(снимок) при подключении и при каждом изменении; переподключается сам
+
+        Args:
+            resources: Вызывать callback и на новый замер ресурсов (False - только при изменении сессий)
+        """
+        stop = stop or threading.Event()
+
+        def run():
+            version = None
+            while not stop.is_set():
+                try:
+                    with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+                        sock.settimeout(60)  # служба присылает снимок не реже раза в 30 секунд
+                        sock.sendall(b'{"op": "subscribe"}\n')
+                        with sock.makefile('rb') as stream:
+                            for line in stream:
+                                message = json.loads(line.decode('utf-8'))
+                                seen = (message.get('version'),
+                                        message.get('resources_version') if resources else None)
+                                if seen != version:
+                                    version = seen
+                                    callback(message)
+                                if stop.is_set():
+                                    return
+                except (OSError, ValueError) as e:
+                    logger.debug("Подписка на службу инвентаризации прервана: %s", e)
+                version = None
+                stop.wait(1.0)
+
+        thread = threading.Thread(target=run, name='inventory-subscribe', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    from logging_setup import setup_logging
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    setup_logging()
+    service = InventoryService(os.getenv('INVENTORY_ADDR', DEFAULT_ADDR),
+                               float(os.getenv('INVENTORY_INTERVAL', str(INVENTORY_INTERVAL)))).start()
+    print(f"🗂️ Служба инвентаризации запущена на {service.host}:{service.port}. Ctrl+C для остановки.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == '__main__':
+    main()
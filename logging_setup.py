@@ -0,0 +1,117 @@
+"""
+Настройка логирования для bot.py и web_app.py.
+
+По умолчанию - как раньше: синхронный вывод в консоль.
+LOG_QUEUE=1 переносит форматирование и запись в отдельный поток (QueueHandler + QueueListener),
+чтобы вывод в консоль и на диск не выполнялся в цикле событий бота и в потоках запросов Flask.
+LOG_JSON_FILE=путь добавляет JSON-lines файл с ротацией по размеру.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() собирает сообщение сразу (ради pickle для межпроцессных очередей).
+    Очередь здесь внутрипроцессная, поэтому запись уходит как есть, а msg % args
+    выполняется уже в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _build_handlers():
+    handlers = []
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers.append(console)
+    json_file = os.getenv('LOG_JSON_FILE')
+    if json_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            json_file,
+            maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),  # Размер файла до ротации
+            backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),  # Сколько старых файлов хранить
+            encoding='utf-8',
+            delay=True,
+        )
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+    return handlers
+
+
+def setup_logging(level: Optional[str] = None, use_queue: Optional[bool] = None) -> Optional[logging.handlers.QueueListener]:
+    """
+    Настраивает корневой логгер
+
+    Переменные окружения читаются при вызове, поэтому .env должен быть загружен раньше.
+
+    Args:
+        level: Уровень логирования (по умолчанию LOG_LEVEL или INFO)
+        use_queue: Писать через фоновый поток (по умолчанию LOG_QUEUE)
+
+    Returns:
+        QueueListener, если включена очередь, иначе None
+    """
+    global _listener
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    if use_queue is None:
+        use_queue = os.getenv('LOG_QUEUE', '0').lower() in ('1', 'true', 'yes')
+
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+
+    handlers = _build_handlers()
+    if not use_queue:
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописывает очередь и останавливает фоновый поток (вызывается и при выходе)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
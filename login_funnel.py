@@ -0,0 +1,293 @@
+"""
+Воронка входа: где пользователи ждут и где бросают диалог /start -> номер -> код -> пароль.
+
+Обработчики бота отмечают вызовы (LoginFunnel.begin / end, в bot.py - декоратор funnel_step).
+На каждый диалог (чат и пользователь) хранится только текущее состояние и накопленное в нем
+время, поэтому память не растет с числом вызовов:
+
+- время в состоянии (от входа до перехода) делится на части: user - пользователь думает
+  (от ответа бота до следующего сообщения), automation - работа с окном Telegram,
+  delay - искусственные паузы (human_delay, password_wait), bot - остальное (ответы
+  через очередь отправки); части берутся из шагов бюджета входа (deadline.py);
+- повторы: обработчик остался в том же состоянии из-за ошибки ("Не удалось выполнить",
+  исключение, неверный формат, лимит) - retry(reason);
+- переходы между состояниями и выходы (logged_in, authorized, cancelled, abandoned ...)
+  считаются счетчиками, из них - конверсия по состояниям.
+
+Диалог без новых сообщений дольше LOGIN_FUNNEL_IDLE секунд закрывается как abandoned в своем
+состоянии (ConversationHandler бота не ограничивает время диалога). Все агрегаты - метрики
+REGISTRY с фиксированными корзинами: /metrics и сводка /funnel служебного сервера бота,
+панель веб-приложения (/api/funnel).
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import deadline
+from metrics import REGISTRY
+
+# Сколько секунд без сообщений диалог считается живым
+LOGIN_FUNNEL_IDLE = float(os.getenv('LOGIN_FUNNEL_IDLE', '900'))
+# Сколько открытых диалогов держать; самые давние сверх предела закрываются как abandoned
+LOGIN_FUNNEL_MAX_OPEN = int(os.getenv('LOGIN_FUNNEL_MAX_OPEN', '10000'))
+
+# Состояния воронки по порядку и переходы, которые считаются продвижением
+STATES = ('start', 'phone', 'code', 'password')
+FORWARD = {
+    'start': ('phone',),
+    'phone': ('code',),
+    'code': ('password', 'logged_in'),
+    'password': ('logged_in',),
+}
+# Выходы, которые считаются потерей пользователя
+DROPPED = ('cancelled', 'rate_limited', 'abandoned', 'restarted')
+PARTS = ('user', 'automation', 'delay', 'bot')
+# Шаги бюджета - искусственные паузы; остальные шаги верхнего уровня - работа с окном
+DELAY_STEPS = frozenset({'human_delay', 'password_wait'})
+
+FUNNEL_ENTERED = REGISTRY.counter('login_funnel_entered_total', 'Входы диалогов в состояние воронки')
+FUNNEL_EXITS = REGISTRY.counter('login_funnel_exits_total', 'Выходы из состояния воронки (to - куда)')
+FUNNEL_RETRIES = REGISTRY.counter(
+    'login_funnel_retries_total', 'Повторы в состоянии воронки (reason: automation, error, invalid, rate_limit ...)')
+FUNNEL_OPEN = REGISTRY.gauge('login_funnel_open', 'Открытые диалоги по состояниям воронки')
+FUNNEL_STATE_SECONDS = REGISTRY.histogram(
+    'login_funnel_state_seconds', 'Время в состоянии воронки (part: total, user, automation, delay, bot)',
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0))
+FUNNEL_VISIT_RETRIES = REGISTRY.histogram(
+    'login_funnel_visit_retries', 'Повторов за диалог (exit - чем диалог закончился)',
+    buckets=(0, 1, 2, 3, 5, 10))
+
+_current = contextvars.ContextVar('login_funnel_call', default=None)
+
+
+class _Visit:
+    """Открытый диалог: текущее состояние и накопленное в нем время"""
+
+    __slots__ = ('state', 'entered', 'last', 'parts', 'retries')
+
+    def __init__(self, state: str, now: float):
+        self.state = state
+        self.entered = now
+        self.last = None  # Когда бот закончил последний обработчик (None - еще не отвечал)
+        self.parts = dict.fromkeys(PARTS, 0.0)
+        self.retries = 0
+
+
+class Call:
+    """Вызов обработчика: диалог, начало и бюджет, по шагам которого делится время"""
+
+    __slots__ = ('key', 'state', 'started', 'budget', 'retry', 'exit')
+
+    def __init__(self, key: Hashable, state: Optional[str], started: float, budget):
+        self.key = key
+        self.state = state
+        self.started = started
+        self.budget = budget
+        self.retry = None
+        self.exit = None
+
+
+def split(budget) -> Dict[str, float]:
+    """automation и delay по шагам верхнего уровня бюджета"""
+    now = budget.clock.monotonic()
+    parts = {'automation': 0.0, 'delay': 0.0}
+    for path, start, end, _ in budget.steps:
+        if '/' not in path:
+            part = 'delay' if path in DELAY_STEPS else 'automation'
+            parts[part] += (end if end is not None else now) - start
+    return parts
+
+
+def _bound(value: Optional[float]) -> Optional[float]:
+    """Квантиль по корзинам для JSON: выше последней корзины - None"""
+    return None if value is None or value == float('inf') else value
+
+
+class LoginFunnel:
+    """Воронка входа по диалогам бота"""
+
+    def __init__(self, idle: float = LOGIN_FUNNEL_IDLE, max_open: int = LOGIN_FUNNEL_MAX_OPEN):
+        self.idle = idle
+        self.max_open = max_open
+        self._visits: 'OrderedDict[Hashable, _Visit]' = OrderedDict()  # От давних к недавним
+        self._open = dict.fromkeys(STATES, 0)
+        self._lock = threading.Lock()
+
+    # --- Учет ---
+
+    def _count(self, state: str, delta: int):
+        self._open[state] += delta
+        FUNNEL_OPEN.set(self._open[state], state=state)
+
+    def _leave(self, visit: _Visit, to: str, now: float):
+        """Закрывает состояние диалога: время по частям и выход"""
+        state = visit.state
+        FUNNEL_STATE_SECONDS.observe(max(0.0, now - visit.entered), state=state, part='total')
+        for part, seconds in visit.parts.items():
+            FUNNEL_STATE_SECONDS.observe(seconds, state=state, part=part)
+        FUNNEL_EXITS.inc(state=state, to=to)
+        self._count(state, -1)
+
+    def _close(self, key: Hashable, to: str, now: float):
+        visit = self._visits.pop(key)
+        self._leave(visit, to, now)
+        FUNNEL_VISIT_RETRIES.observe(visit.retries, exit=to)
+
+    def _expire(self, now: float):
+        """Закрывает брошенные диалоги (самые давние - в начале) и оставляет место для нового"""
+        while self._visits:
+            key, visit = next(iter(self._visits.items()))
+            last = visit.last if visit.last is not None else visit.entered
+            if now - last <= self.idle and len(self._visits) < self.max_open:
+                break
+            self._close(key, 'abandoned', last)
+
+    def begin(self, key: Hashable, state: Optional[str], now: float, budget) -> Call:
+        """
+        Начало обработчика
+
+        Args:
+            key: Диалог (чат и пользователь)
+            state: Состояние, которое обрабатывает обработчик ('start' - новый диалог;
+                None - текущее состояние диалога, например /cancel)
+            budget: Бюджет обработчика (deadline.Budget), по шагам которого делится время
+        """
+        with self._lock:
+            self._expire(now)
+            visit = self._visits.get(key)
+            if state == 'start':
+                if visit is not None:
+                    self._close(key, 'restarted', now)
+                visit = self._visits[key] = _Visit('start', now)
+                FUNNEL_ENTERED.inc(state='start')
+                self._count('start', 1)
+            elif visit is None:
+                if state is None:
+                    return Call(key, None, now, budget)  # Диалог уже закрыт как брошенный
+                # Диалог вернулся после LOGIN_FUNNEL_IDLE: учитываем с текущего состояния без входа
+                visit = self._visits[key] = _Visit(state, now)
+                self._count(state, 1)
+            else:
+                self._visits.move_to_end(key)
+                if visit.last is not None:
+                    visit.parts['user'] += max(0.0, now - visit.last)
+            return Call(key, visit.state, now, budget)
+
+    def end(self, call: Call, to: str, now: float):
+        """
+        Конец обработчика
+
+        Args:
+            to: Следующее состояние (из STATES) или выход диалога (logged_in, cancelled ...);
+                выход, отмеченный обработчиком (ended), важнее
+        """
+        if call.state is None:
+            return
+        if call.exit is not None and to not in STATES:
+            to = call.exit
+        parts = split(call.budget)
+        parts['bot'] = max(0.0, now - call.started - parts['automation'] - parts['delay'])
+        with self._lock:
+            visit = self._visits.get(call.key)
+            if visit is None:
+                return  # Закрыт, пока обработчик работал (предел открытых диалогов)
+            for part, seconds in parts.items():
+                visit.parts[part] += seconds
+            visit.last = now
+            if call.retry is not None:
+                visit.retries += 1
+                FUNNEL_RETRIES.inc(state=visit.state, reason=call.retry)
+            if to == visit.state:
+                return
+            if to in STATES:
+                self._leave(visit, to, now)
+                visit.state = to
+                visit.entered = now
+                visit.parts = dict.fromkeys(PARTS, 0.0)
+                FUNNEL_ENTERED.inc(state=to)
+                self._count(to, 1)
+            else:
+                self._close(call.key, to, now)
+
+    @contextlib.contextmanager
+    def use(self, call: Call):
+        """Делает вызов текущим (для retry) и его бюджет - учетом шагов обработчика"""
+        token = _current.set(call)
+        try:
+            if deadline.current() is call.budget:
+                yield call
+            else:
+                with call.budget.use():
+                    yield call
+        finally:
+            _current.reset(token)
+
+    # --- Сводка ---
+
+    def summary(self, now: Optional[float] = None) -> dict:
+        """Конверсия, выходы, повторы и время по частям для каждого состояния"""
+        with self._lock:
+            if now is not None:
+                self._expire(now)
+            open_now = dict(self._open)
+        states = []
+        for state in STATES:
+            entered = FUNNEL_ENTERED.value(state=state)
+            exits = {dict(key)['to']: int(value) for _, key, value in FUNNEL_EXITS.samples()
+                     if dict(key)['state'] == state}
+            retries = {dict(key)['reason']: int(value) for _, key, value in FUNNEL_RETRIES.samples()
+                       if dict(key)['state'] == state}
+            left = sum(exits.values())
+            forward = sum(exits.get(to, 0) for to in FORWARD[state])
+            dropped = sum(exits.get(to, 0) for to in DROPPED)
+            states.append({
+                'state': state,
+                'entered': int(entered),
+                'open': open_now[state],
+                'exits': exits,
+                'conversion': round(forward / left, 3) if left else None,
+                'dropped': round(dropped / left, 3) if left else None,
+                'retries': retries,
+                'seconds': {
+                    part: {
+                        'mean': FUNNEL_STATE_SECONDS.mean(state=state, part=part),
+                        'p50': _bound(FUNNEL_STATE_SECONDS.quantile(0.5, state=state, part=part)),
+                        'p95': _bound(FUNNEL_STATE_SECONDS.quantile(0.95, state=state, part=part)),
+                    }
+                    for part in ('total',) + PARTS
+                },
+            })
+        started = FUNNEL_ENTERED.value(state='start')
+        logged_in = sum(value for _, key, value in FUNNEL_EXITS.samples() if dict(key)['to'] == 'logged_in')
+        return {
+            'states': states,
+            'started': int(started),
+            'logged_in': int(logged_in),
+            'conversion': round(logged_in / started, 3) if started else None,
+        }
+
+    def route(self, clock=None):
+        """Маршрут /funnel для служебного HTTP-сервера (metrics.add_route)"""
+        def handler(query: str):
+            now = clock.monotonic() if clock is not None else None
+            body = json.dumps(self.summary(now), ensure_ascii=False).encode('utf-8')
+            return 200, 'application/json', body
+        return handler
+
+
+def retry(reason: str):
+    """Обработчик остается в том же состоянии из-за ошибки (reason: automation, error, invalid ...)"""
+    call = _current.get()
+    if call is not None:
+        call.retry = reason
+
+
+def ended(reason: str):
+    """Обработчик завершает диалог не так, как обычно (например, rate_limited вместо authorized)"""
+    call = _current.get()
+    if call is not None:
+        call.exit = reason
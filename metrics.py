@@ -0,0 +1,230 @@
+"""
+Метрики процесса в памяти: счетчики, значения и гистограммы с фиксированными корзинами.
+
+Каждый процесс (бот, веб-приложение) ведет свой REGISTRY. Бот отдает его через
+небольшой служебный HTTP-сервер (serve_metrics, METRICS_PORT), веб-приложение - через свои маршруты.
+Формат /metrics - текстовый формат Prometheus, /metrics.json - то же в JSON.
+"""
+import bisect
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Корзины по умолчанию (секунды): от миллисекунд до минуты
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, object]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_text(key: Tuple[Tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def remove(self, **labels):
+        """Убирает серию (например, значения завершившегося процесса)"""
+        with self._lock:
+            self._values.pop(_label_key(labels), None)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Текущее значение"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: память не растет с числом наблюдений"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [counts по корзинам + inf, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def mean(self, **labels) -> Optional[float]:
+        series = self._series.get(_label_key(labels))
+        return series[1] / series[2] if series and series[2] else None
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        series = self._series.get(_label_key(labels))
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), series[0]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                result.append((f'{self.name}_bucket', key, cumulative, f'le="{le}"'))
+            result.append((f'{self.name}_sum', key, total))
+            result.append((f'{self.name}_count', key, count))
+        return result
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str = '') -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = '') -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат Prometheus"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if metric.help:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else ''
+                lines.append(f'{name}{_label_text(key, extra)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """Все метрики в виде словаря для JSON"""
+        result = {}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            series = []
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                labels = dict(key)
+                if len(sample) > 3:
+                    labels['le'] = sample[3].split('"')[1]
+                series.append({'name': name, 'labels': labels, 'value': value})
+            result[metric.name] = {'type': metric.kind, 'help': metric.help, 'series': series}
+        return result
+
+
+REGISTRY = MetricsRegistry()
+
+# Маршруты служебного HTTP-сервера: путь -> функция(query) -> (статус, content-type, тело)
+ROUTES: Dict[str, Callable[[str], Tuple[int, str, bytes]]] = {
+    '/metrics': lambda query: (200, 'text/plain; version=0.0.4; charset=utf-8',
+                               REGISTRY.render_prometheus().encode('utf-8')),
+    '/metrics.json': lambda query: (200, 'application/json',
+                                    json.dumps(REGISTRY.snapshot(), ensure_ascii=False).encode('utf-8')),
+}
+
+
+def add_route(path: str, handler: Callable[[str], Tuple[int, str, bytes]]):
+    """Добавляет маршрут в служебный HTTP-сервер"""
+    ROUTES[path] = handler
+
+
+def serve_metrics(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Запускает служебный HTTP-сервер метрик в фоновом потоке"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            handler = ROUTES.get(path)
+            if handler is None:
+                status, content_type, body = 404, 'text/plain', b'not found'
+            else:
+                try:
+                    status, content_type, body = handler(query)
+                except Exception as e:
+                    logger.error("Ошибка служебного маршрута %s: %s", path, e)
+                    status, content_type, body = 500, 'text/plain', b'error'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("metrics: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, server.server_address[1])
+    return server
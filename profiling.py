@@ -0,0 +1,374 @@
+"""
+Профилирование по запросу: обработчики бота, маршруты веб-приложения и память процесса.
+
+Включается переменной PROFILING=1. Выключено - декоратор profiled() возвращает функцию
+без изменений, накладных расходов нет. Включено - обертка проверяет, "взведена" ли цель,
+и если да, следующие N вызовов снимаются:
+
+- cprofile: cProfile + dump_stats (.prof) и текстовый отчет pstats (.txt);
+- sampling: фоновый поток раз в PROFILE_SAMPLE_INTERVAL снимает стек потока вызова
+  (sys._current_frames) - стеки в формате flamegraph (.folded) и самые частые строки (.txt).
+
+Для async-обработчиков снимок включает и другие задачи, которые event loop выполнял, пока
+обработчик ждал await. Работа, которую обработчик отправил в пул потоков (bot.in_thread -
+автоматизация окна), снимается через follow(): contextvars копируются в поток, и профиль
+(cProfile потока, добавленный к профилю вызова, или стеки потока в семплировании) попадает
+в тот же результат. tracemalloc_snapshot() сохраняет снимок памяти и разницу с
+предыдущим. Результаты - файлы в PROFILE_DIR; веб-приложение отдает их по токену PROFILE_TOKEN.
+
+Переменные читаются при вызове: bot.py загружает .env уже после импорта модулей.
+"""
+import cProfile
+import contextlib
+import contextvars
+import functools
+import hmac
+import inspect
+import io
+import linecache
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sampling')
+
+# Снимаемый вызов: виден в потоках, куда он отправил работу с копией контекста
+_session = contextvars.ContextVar('profile_session', default=None)
+
+
+def enabled() -> bool:
+    return os.getenv('PROFILING', '0').lower() in ('1', 'true', 'yes')
+
+
+def profile_dir() -> str:
+    return os.getenv('PROFILE_DIR', 'profiles')
+
+
+def check_token(token: Optional[str]) -> bool:
+    """Токен для служебных маршрутов профилирования (без PROFILE_TOKEN доступ закрыт)"""
+    expected = os.getenv('PROFILE_TOKEN', '')
+    return bool(expected) and bool(token) and hmac.compare_digest(token, expected)
+
+
+class _Sampler(threading.Thread):
+    """Снимает стеки потока вызова (и потоков, куда он отправил работу) с заданным интервалом"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.followed: Dict[int, str] = {}  # Другие потоки: id -> имя (корень их стеков)
+        self.interval = interval
+        self.stacks = Counter()
+        self.lines = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            threads = [(self.thread_id, None)] + list(self.followed.items())
+            for thread_id, name in threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                if name is not None:
+                    stack.append(f'[{name}]')
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.lines[stack[0]] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """Взведенные цели и снятие профилей"""
+
+    def __init__(self):
+        self._armed: Dict[str, list] = {}  # цель -> [осталось вызовов, режим]
+        self._lock = threading.Lock()
+        self._cprofile_busy = threading.Lock()  # cProfile одновременно может работать только один
+        self._last_snapshot = None
+
+    # --- Управление ---
+
+    def arm(self, target: str, count: int = 1, mode: str = 'cprofile'):
+        """Снять следующие count вызовов цели (имя обработчика или путь маршрута)"""
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        with self._lock:
+            if count > 0:
+                self._armed[target] = [count, mode]
+            else:
+                self._armed.pop(target, None)
+        logger.info("Профилирование %s: следующие %s вызовов (%s)", target, count, mode)
+
+    def armed(self) -> Dict[str, dict]:
+        with self._lock:
+            return {target: {'remaining': left, 'mode': mode} for target, (left, mode) in self._armed.items()}
+
+    def _take(self, target: str) -> Optional[str]:
+        with self._lock:
+            entry = self._armed.get(target)
+            if entry is None:
+                return None
+            entry[0] -= 1
+            if entry[0] <= 0:
+                del self._armed[target]
+            return entry[1]
+
+    # --- Обертки ---
+
+    def wrap(self, target: str, func):
+        """Обертка функции (синхронной или async): взведенные вызовы снимаются"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                mode = self._take(target) if self._armed else None
+                if mode is None:
+                    return await func(*args, **kwargs)
+                session = self._start(target, mode)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._finish(session)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            mode = self._take(target) if self._armed else None
+            if mode is None:
+                return func(*args, **kwargs)
+            session = self._start(target, mode)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._finish(session)
+        return wrapper
+
+    def _start(self, target: str, mode: str) -> dict:
+        session = {'target': target, 'mode': mode, 'started': time.perf_counter(), 'profile': None, 'sampler': None,
+                   'threads': [], 'lock': threading.Lock(), 'token': None}
+        if mode == 'cprofile':
+            if not self._cprofile_busy.acquire(blocking=False):
+                logger.warning("cProfile уже занят, вызов %s снимается семплированием", target)
+                mode = session['mode'] = 'sampling'
+            else:
+                session['profile'] = cProfile.Profile()
+                session['profile'].enable()
+        if mode == 'sampling':
+            interval = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+            session['sampler'] = _Sampler(threading.get_ident(), interval)
+            session['sampler'].start()
+        session['token'] = _session.set(session)
+        return session
+
+    @contextlib.contextmanager
+    def follow(self, session: dict):
+        """Снимает текущий поток в профиль вызова session (работа, отправленная вызовом в пул потоков)"""
+        if session['sampler'] is not None:
+            thread_id = threading.get_ident()
+            session['sampler'].followed[thread_id] = threading.current_thread().name
+            try:
+                yield
+            finally:
+                session['sampler'].followed.pop(thread_id, None)
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: профиль один на интерпретатор и уже видит все потоки
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with session['lock']:
+                session['threads'].append(profile)
+
+    def _finish(self, session: dict):
+        _session.reset(session['token'])
+        elapsed = time.perf_counter() - session['started']
+        base = self._result_path(session['target'], session['mode'])
+        header = f"# {session['target']} ({session['mode']}), {elapsed * 1000:.1f} мс\n"
+        try:
+            if session['profile'] is not None:
+                session['profile'].disable()
+                self._cprofile_busy.release()
+                report = io.StringIO()
+                stats = pstats.Stats(session['profile'], stream=report)
+                with session['lock']:
+                    for profile in session['threads']:
+                        stats.add(profile)
+                stats.dump_stats(base + '.prof')
+                stats.sort_stats('cumulative').print_stats(40)
+                self._write(base + '.txt', header + report.getvalue())
+            else:
+                sampler = session['sampler']
+                sampler.stop()
+                self._write(base + '.folded', ''.join(f'{stack} {count}\n' for stack, count in sampler.stacks.items()))
+                total = sum(sampler.lines.values()) or 1
+                top = ''.join(f'{count * 100 / total:6.1f}%  {line}\n' for line, count in sampler.lines.most_common(40))
+                self._write(base + '.txt', header + f"# выборок: {sum(sampler.lines.values())}\n" + top)
+            logger.info("Профиль %s сохранен: %s", session['target'], base)
+        except Exception as e:
+            logger.warning("Не удалось сохранить профиль %s: %s", session['target'], e)
+
+    @staticmethod
+    def _result_path(target: str, label: str) -> str:
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        safe = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in target.strip('/')) or 'root'
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return os.path.join(directory, f'{os.getpid()}-{safe}-{label}-{stamp}')
+
+    @staticmethod
+    def _write(path: str, text: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    # --- Память ---
+
+    def tracemalloc_snapshot(self, top: int = 25) -> str:
+        """
+        Снимок tracemalloc и разница с предыдущим. Первый вызов только включает трассировку
+
+        Returns:
+            Текстовый отчет (он же сохраняется в PROFILE_DIR)
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.getenv('TRACEMALLOC_FRAMES', '10')))
+            self._last_snapshot = tracemalloc.take_snapshot()
+            return "tracemalloc включен, следующий снимок покажет разницу\n"
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"# tracemalloc: сейчас {current / 1024:.0f} КБ, пик {peak / 1024:.0f} КБ"]
+        lines.append("# Рост с предыдущего снимка:")
+        for stat in snapshot.compare_to(self._last_snapshot, 'lineno')[:top]:
+            lines.append(str(stat))
+        lines.append("# Больше всего памяти сейчас:")
+        for stat in snapshot.statistics('lineno')[:top]:
+            lines.append(str(stat))
+        report = '\n'.join(lines) + '\n'
+        base = self._result_path('tracemalloc', 'memory')
+        snapshot.dump(base + '.tracemalloc')
+        self._write(base + '.txt', report)
+        self._last_snapshot = snapshot
+        return report
+
+    def tracemalloc_stop(self):
+        tracemalloc.stop()
+        self._last_snapshot = None
+
+    # --- Результаты ---
+
+    @staticmethod
+    def results() -> List[dict]:
+        """Файлы результатов (новые первыми)"""
+        directory = profile_dir()
+        if not os.path.isdir(directory):
+            return []
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append({
+                    'name': name,
+                    'size': stat.st_size,
+                    'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                })
+        return sorted(files, key=lambda item: item['modified'], reverse=True)
+
+    @staticmethod
+    def result_path(name: str) -> Optional[str]:
+        """Путь к файлу результата по имени (только файлы из PROFILE_DIR)"""
+        if not name or os.path.basename(name) != name:
+            return None
+        path = os.path.join(profile_dir(), name)
+        return path if os.path.isfile(path) else None
+
+
+PROFILER = Profiler()
+
+
+def profiled(target: Optional[str] = None):
+    """Декоратор: при PROFILING=1 функцию можно взвести по имени (по умолчанию имя функции)"""
+    def decorator(func):
+        if not enabled():
+            return func
+        return PROFILER.wrap(target or func.__name__, func)
+    return decorator
+
+
+def follow(func):
+    """
+    func для другого потока (run_in_executor): если текущий вызов снимается, поток снимается
+    в тот же профиль; иначе func без изменений. Вызывать в потоке, который отправляет работу
+    """
+    session = _session.get()
+    if session is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with PROFILER.follow(session):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def arm_from_env():
+    """Взводит цели из PROFILE_TARGETS="handle_code_button:5:sampling,/api/sessions:10" """
+    for item in filter(None, (part.strip() for part in os.getenv('PROFILE_TARGETS', '').split(','))):
+        target, _, rest = item.partition(':')
+        count, _, mode = rest.partition(':')
+        PROFILER.arm(target, int(count or 1), mode or 'cprofile')
+
+
+def instrument_flask(app):
+    """Оборачивает все маршруты Flask (цель - правило маршрута, например /api/sessions)"""
+    if not enabled():
+        return
+    for rule in app.url_map.iter_rules():
+        view = app.view_functions.get(rule.endpoint)
+        if view is not None and rule.endpoint != 'static':
+            app.view_functions[rule.endpoint] = PROFILER.wrap(rule.rule, view)
+    arm_from_env()
+
+
+def debug_route(path: str, query: str):
+    """
+    Служебные маршруты для metrics.add_route в процессе бота:
+    /debug/profile/arm?target=...&count=...&mode=...&token=... и /debug/tracemalloc?token=...
+    """
+    import json
+    from urllib.parse import parse_qs
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    if not check_token(params.get('token')):
+        return 403, 'text/plain', b'forbidden'
+    if path == '/debug/tracemalloc':
+        return 200, 'text/plain; charset=utf-8', PROFILER.tracemalloc_snapshot().encode('utf-8')
+    try:
+        PROFILER.arm(params['target'], int(params.get('count', '1')), params.get('mode', 'cprofile'))
+    except (KeyError, ValueError) as e:
+        return 400, 'text/plain; charset=utf-8', str(e).encode('utf-8')
+    body = json.dumps({'armed': PROFILER.armed()}, ensure_ascii=False).encode('utf-8')
+    return 200, 'application/json', body
@@ -0,0 +1,197 @@
+"""
+Снимок состояния лимитов бота на диске: блокировки и суточные лимиты входа переживают перезапуск.
+
+check_rate_limit держит все в словарях bot.py (user_requests, user_blocked,
+user_daily_logins, user_last_login_date), и раньше перезапуск бота снимал блокировки и
+обнулял счетчики входов за день. Теперь состояние пишется в SQLite в режиме WAL:
+
+- строка на пользователя: конец блокировки, входы за день, день последнего входа
+  (порядковый номер даты), время последнего запроса и времена запросов за последний
+  час одним BLOB (array 'd');
+- check_rate_limit отмечает пользователя (mark), и снимок раз в
+  RATE_LIMIT_SNAPSHOT_INTERVAL секунд пишет только отмеченных - одной транзакцией;
+- в цикле бота только копируются строки отмеченных пользователей, запись на диск идет в
+  пуле потоков; обрыв процесса посреди записи откатывает транзакцию, прежний снимок цел;
+- при запуске блокировки и входы за день выбираются прямо в словари, времена запросов
+  читаются курсором подряд; истекшие блокировки, запросы старше часа и входы прошлых
+  дней отбрасываются запросом SQLite (их check_rate_limit все равно сбросил бы).
+
+Между снимками теряется не больше RATE_LIMIT_SNAPSHOT_INTERVAL секунд истории; при
+остановке бота снимок пишется последний раз. Замер: benchmarks/rate_limit_restart.py.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Версия формата (PRAGMA user_version): снимок другой версии не читается
+FORMAT_VERSION = 1
+
+SNAPSHOT_SECONDS = REGISTRY.histogram(
+    'rate_limit_snapshot_seconds', 'Снимок лимитов (part: collect - в цикле бота, write - запись в пуле)',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+SNAPSHOT_ROWS = REGISTRY.counter('rate_limit_snapshot_rows_total', 'Строки снимка лимитов (op: upsert, delete)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    user_id INTEGER PRIMARY KEY,
+    blocked_until REAL,
+    logins INTEGER NOT NULL,
+    login_day INTEGER,
+    last_request REAL,
+    requests BLOB NOT NULL
+)
+"""
+
+Row = Tuple[int, Optional[float], int, Optional[int], Optional[float], bytes]
+
+
+class RateLimitStore:
+    """Снимок словарей лимитов в SQLite (WAL) с записью только измененных пользователей"""
+
+    def __init__(self, path: str, requests: Dict[int, list], blocked: Dict[int, float],
+                 daily_logins: Dict[int, int], last_login_date: Dict[int, date]):
+        """
+        Args:
+            path: Файл базы
+            requests, blocked, daily_logins, last_login_date: Словари лимитов бота
+                (заполняются при load и читаются при снимке)
+        """
+        self.path = path
+        self.requests = requests
+        self.blocked = blocked
+        self.daily_logins = daily_logins
+        self.last_login_date = last_login_date
+        self._dirty: Set[int] = set()
+        self._conn = None
+        self._write_lock = threading.Lock()  # Последний снимок при остановке и снимок из фоновой задачи
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # В WAL с NORMAL обрыв процесса не теряет закоммиченных снимков (сбой питания - последний)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, FORMAT_VERSION):
+                logger.warning("Снимок лимитов %s другой версии (%s) - начинаем с пустого", self.path, version)
+                conn.execute('DROP TABLE IF EXISTS rate_limits')
+            conn.execute(SCHEMA)
+            conn.execute(f'PRAGMA user_version={FORMAT_VERSION}')
+            self._conn = conn
+        return self._conn
+
+    def mark(self, user_id: int):
+        """Состояние пользователя изменилось - попадет в следующий снимок"""
+        self._dirty.add(user_id)
+
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    # --- Загрузка ---
+
+    def load(self, now: float, today: date, window: float = 3600) -> int:
+        """
+        Заполняет словари из снимка, отбрасывая устаревшее
+
+        Args:
+            now: Текущее время (clock.time())
+            today: Текущая дата (clock.now().date())
+            window: Запросы старше стольких секунд не нужны лимитам
+
+        Returns:
+            Сколько пользователей загружено
+        """
+        conn = self._connect()
+        since = now - window
+        day = today.toordinal()
+        # Строки, в которых ничего не осталось, удаляются сразу
+        conn.execute('DELETE FROM rate_limits WHERE NOT (blocked_until > ? OR login_day = ? OR last_request > ?)',
+                     (now, day, since))
+        # Блокировки и входы за день - выборкой прямо в словари, без разбора по строкам
+        self.blocked.update(conn.execute(
+            'SELECT user_id, blocked_until FROM rate_limits WHERE blocked_until > ?', (now,)))
+        logins = conn.execute('SELECT user_id, logins FROM rate_limits WHERE login_day = ?', (day,)).fetchall()
+        self.daily_logins.update(logins)
+        self.last_login_date.update((user_id, today) for user_id, _ in logins)
+        for user_id, packed in conn.execute(
+                'SELECT user_id, requests FROM rate_limits WHERE last_request > ?', (since,)):
+            times = array('d')
+            times.frombytes(packed)
+            # Обычно check_rate_limit уже отбросил запросы старше часа - тогда без фильтра
+            self.requests[user_id] = times.tolist() if times[0] > since else [t for t in times if t > since]
+        return conn.execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+
+    # --- Снимок ---
+
+    def collect(self) -> Tuple[List[Row], List[int]]:
+        """Строки отмеченных пользователей (в цикле бота); отметки снимаются"""
+        started = time.perf_counter()
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        deleted = []
+        for user_id in dirty:
+            times = self.requests.get(user_id)
+            blocked_until = self.blocked.get(user_id)
+            logins = self.daily_logins.get(user_id, 0)
+            login_date = self.last_login_date.get(user_id)
+            if not times and blocked_until is None and not logins and login_date is None:
+                deleted.append(user_id)
+                continue
+            rows.append((user_id, blocked_until, logins, login_date.toordinal() if login_date else None,
+                         max(times) if times else None, array('d', times or ()).tobytes()))
+        SNAPSHOT_SECONDS.observe(time.perf_counter() - started, part='collect')
+        return rows, deleted
+
+    def write(self, rows: List[Row], deleted: List[int]):
+        """Записывает строки одной транзакцией (в пуле потоков)"""
+        if not rows and not deleted:
+            return
+        started = time.perf_counter()
+        with self._write_lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                conn.executemany('INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?, ?)', rows)
+                conn.executemany('DELETE FROM rate_limits WHERE user_id = ?', [(user_id,) for user_id in deleted])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        SNAPSHOT_SECONDS.observe(time.perf_counter() - started, part='write')
+        SNAPSHOT_ROWS.inc(len(rows), op='upsert')
+        SNAPSHOT_ROWS.inc(len(deleted), op='delete')
+
+    async def save(self):
+        """Снимок: строки собираются в цикле, пишутся в пуле потоков"""
+        rows, deleted = self.collect()
+        if not rows and not deleted:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, rows, deleted)
+        except sqlite3.Error as e:
+            # Не записали - вернем отметки, чтобы попробовать в следующий раз
+            self._dirty.update(row[0] for row in rows)
+            self._dirty.update(deleted)
+            logger.error("Не удалось записать снимок лимитов %s: %s", self.path, e)
+
+    async def run(self, interval: float):
+        """Фоновая задача: снимок раз в interval секунд"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    def close(self):
+        with self._write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
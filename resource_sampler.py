@@ -0,0 +1,140 @@
+"""
+Потребление ресурсов процессами Telegram: CPU%, память, потоки и дескрипторы.
+
+Список сессий знал только pid, имя и время запуска, и по панели нельзя было понять,
+какой экземпляр Telegram нагружает компьютер. Отдельный вызов psutil на каждое значение
+каждого процесса в каждом запросе - лишние системные вызовы, поэтому:
+
+- значения процесса читаются одним проходом Process.oneshot();
+- CPU% считается по разнице процессорного времени с предыдущим замером (доля всех
+  ядер, как в диспетчере задач) - без блокирующего cpu_percent(interval);
+- замеры идут в фоновом потоке раз в RESOURCE_SAMPLE_INTERVAL секунд, независимо
+  от HTTP-запросов; слушатели (снимок сессий) получают готовый словарь pid -> значения.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Период замера (секунды); 0 - не замерять
+RESOURCE_SAMPLE_INTERVAL = float(os.getenv('RESOURCE_SAMPLE_INTERVAL', '5'))
+
+PROCESS_CPU = REGISTRY.gauge('telegram_process_cpu_percent', 'CPU процесса Telegram, % всех ядер')
+PROCESS_RSS = REGISTRY.gauge('telegram_process_rss_bytes', 'Резидентная память процесса Telegram')
+PROCESS_THREADS = REGISTRY.gauge('telegram_process_threads', 'Потоков в процессе Telegram')
+PROCESS_HANDLES = REGISTRY.gauge('telegram_process_handles', 'Дескрипторов процесса Telegram (handles в Windows, fd в POSIX)')
+SAMPLE_SECONDS = REGISTRY.histogram(
+    'telegram_resource_sample_seconds', 'Длительность замера ресурсов всех процессов Telegram',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+_GAUGES = (PROCESS_CPU, PROCESS_RSS, PROCESS_THREADS, PROCESS_HANDLES)
+
+
+def _handles(proc: psutil.Process) -> Optional[int]:
+    try:
+        return proc.num_handles() if os.name == 'nt' else proc.num_fds()
+    except (psutil.AccessDenied, AttributeError):
+        return None
+
+
+class ResourceSampler:
+    """Периодический замер ресурсов процессов Telegram"""
+
+    def __init__(self, interval: float = RESOURCE_SAMPLE_INTERVAL,
+                 match: Callable[[str], bool] = lambda name: 'telegram' in name.lower()):
+        """
+        Args:
+            interval: Период замера (секунды)
+            match: Отбор процессов по имени исполняемого файла
+        """
+        self.interval = interval
+        self.match = match
+        self.latest: Dict[int, dict] = {}  # pid -> значения последнего замера
+        self._previous: Dict[Tuple[int, float], Tuple[float, float]] = {}  # (pid, запуск) -> (CPU-время, момент)
+        self._cpu_count = psutil.cpu_count() or 1
+        self._listeners: List[Callable[[Dict[int, dict]], None]] = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback: Callable[[Dict[int, dict]], None]):
+        """callback(pid -> значения) после каждого замера"""
+        self._listeners.append(callback)
+
+    def sample(self) -> Dict[int, dict]:
+        """Один замер всех процессов Telegram"""
+        started = time.monotonic()
+        resources = {}
+        previous = {}
+        for proc in psutil.process_iter(['name']):
+            try:
+                if not proc.info['name'] or not self.match(proc.info['name']):
+                    continue
+                with proc.oneshot():
+                    created = proc.create_time()
+                    cpu = proc.cpu_times()
+                    memory = proc.memory_info()
+                    threads = proc.num_threads()
+                    handles = _handles(proc)
+                now = time.monotonic()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            # Ключ с временем запуска: PID завершившегося процесса может достаться новому
+            key = (proc.pid, created)
+            cpu_seconds = cpu.user + cpu.system
+            cpu_percent = None
+            if key in self._previous:
+                last_cpu, last_at = self._previous[key]
+                if now > last_at:
+                    cpu_percent = round(100.0 * (cpu_seconds - last_cpu) / (now - last_at) / self._cpu_count, 1)
+            previous[key] = (cpu_seconds, now)
+            resources[proc.pid] = {
+                'cpu_percent': cpu_percent,
+                'rss_mb': round(memory.rss / 1024 / 1024, 1),
+                'threads': threads,
+                'handles': handles,
+            }
+            if cpu_percent is not None:
+                PROCESS_CPU.set(cpu_percent, pid=proc.pid)
+            PROCESS_RSS.set(memory.rss, pid=proc.pid)
+            PROCESS_THREADS.set(threads, pid=proc.pid)
+            if handles is not None:
+                PROCESS_HANDLES.set(handles, pid=proc.pid)
+
+        for pid in set(self.latest) - set(resources):
+            for gauge in _GAUGES:
+                gauge.remove(pid=pid)
+        self._previous = previous
+        self.latest = resources
+        SAMPLE_SECONDS.observe(time.monotonic() - started)
+        for callback in self._listeners:
+            try:
+                callback(resources)
+            except Exception as e:
+                logger.error("Ошибка обработчика замера ресурсов: %s", e)
+        return resources
+
+    # --- Фоновый поток ---
+
+    def start(self) -> 'ResourceSampler':
+        self._thread = threading.Thread(target=self._loop, name='resource-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error("Ошибка замера ресурсов: %s", e)
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,120 @@
+"""
+Дешевое обнаружение смены экрана по перцептивному хэшу (резервный путь pyautogui).
+
+Когда pywinauto не видит элементов, ввод номера, кода и нажатие "Продолжить" идут
+вслепую: клик, Enter и фиксированная пауза 0.3-1 с, после которой шаг считается успешным.
+Здесь окно снимается в уменьшенном сером виде и сводится к разностному хэшу (dHash):
+256 битов "левее ярче правого" на сетке 17x16. Смена экрана меняет много битов, мигающий
+курсор или шум сжатия - почти ни одного. Классическая сетка 9x8 (64 бита) для окна
+Telegram не годится: экран почти весь белый, и переход с номера на код меняет в ней
+3-4 бита - столько же, сколько мигание курсора. После действия опрос идет каждые
+SCREEN_POLL_INTERVAL секунд: хэш отошел от исходного больше чем на SCREEN_CHANGE_BITS
+битов - экран сменился; дальше ждем, пока анимация перехода успокоится (три снимка
+подряд почти одинаковы). Нет смены за SCREEN_CHANGE_TIMEOUT - шаг не удался.
+
+Только Pillow (ImageGrab); замер на снимках - benchmarks/screen_change_frames.py.
+"""
+import logging
+import os
+from typing import Callable, Optional, Tuple
+
+from clock import SYSTEM_CLOCK
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Сколько битов из 256 должно измениться, чтобы считать экран новым
+SCREEN_CHANGE_BITS = int(os.getenv('SCREEN_CHANGE_BITS', '8'))
+# Период опроса и предел ожидания смены экрана (секунды)
+SCREEN_POLL_INTERVAL = float(os.getenv('SCREEN_POLL_INTERVAL', '0.05'))
+SCREEN_CHANGE_TIMEOUT = float(os.getenv('SCREEN_CHANGE_TIMEOUT', '3'))
+# Снимки, отличающиеся не больше чем на столько битов, считаются одинаковыми; экран успокоился,
+# когда столько опросов подряд одинаковы (медленная анимация меняет за опрос 1-2 бита)
+SETTLED_BITS = 2
+SETTLED_POLLS = 2
+
+HASH_SIZE = 16
+
+SCREEN_CHANGE_SECONDS = REGISTRY.histogram(
+    'screen_change_seconds', 'Ожидание смены экрана после действия pyautogui (changed, timeout)',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0))
+
+Bbox = Tuple[int, int, int, int]
+
+
+def dhash(image, size: int = HASH_SIZE) -> int:
+    """Разностный хэш: size x size битов, бит - пиксель ярче соседа справа"""
+    from PIL import Image
+    small = image.convert('L').resize((size + 1, size), Image.BILINEAR, reducing_gap=2.0)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def distance(a: int, b: int) -> int:
+    """Сколько битов различается"""
+    return bin(a ^ b).count('1')
+
+
+def grab(bbox: Optional[Bbox]):
+    """Снимок области экрана (None - весь экран)"""
+    from PIL import ImageGrab
+    return ImageGrab.grab(bbox=bbox)
+
+
+class ScreenChangeDetector:
+    """Ждет, пока снимок области заметно изменится и успокоится"""
+
+    def __init__(self, capture: Callable[[Optional[Bbox]], object] = grab, clock=None,
+                 threshold: int = SCREEN_CHANGE_BITS, poll: float = SCREEN_POLL_INTERVAL):
+        """
+        Args:
+            capture: Функция bbox -> PIL.Image (по умолчанию ImageGrab.grab)
+            clock: Часы для пауз опроса
+            threshold: Битов отличия для "экран сменился"
+            poll: Период опроса (секунды)
+        """
+        self.capture = capture
+        self.clock = clock or SYSTEM_CLOCK
+        self.threshold = threshold
+        self.poll = poll
+
+    def hash(self, bbox: Optional[Bbox]) -> Optional[int]:
+        """Хэш области или None, если снять экран не удалось (нет дисплея, нет Pillow)"""
+        try:
+            return dhash(self.capture(bbox))
+        except Exception as e:
+            logger.debug("Не удалось снять экран для хэша: %s", e)
+            return None
+
+    def wait_change(self, bbox: Optional[Bbox], before: int, timeout: float = SCREEN_CHANGE_TIMEOUT) -> bool:
+        """
+        Ждет смены экрана относительно хэша before
+
+        Returns:
+            True - экран сменился (и анимация закончилась), False - за timeout ничего не произошло
+        """
+        started = self.clock.monotonic()
+        deadline = started + timeout
+        changed = None
+        steady = 0
+        while True:
+            current = self.hash(bbox)
+            now = self.clock.monotonic()
+            if current is not None:
+                if changed is not None:
+                    steady = steady + 1 if distance(current, changed) <= SETTLED_BITS else 0
+                    if steady >= SETTLED_POLLS:
+                        SCREEN_CHANGE_SECONDS.observe(now - started, outcome='changed')
+                        return True
+                if changed is not None or distance(current, before) > self.threshold:
+                    changed = current  # Экран уже другой - ждем, пока перестанет меняться
+            if now >= deadline:
+                # Сменился, но еще анимируется - все равно успех
+                SCREEN_CHANGE_SECONDS.observe(now - started, outcome='changed' if changed is not None else 'timeout')
+                return changed is not None
+            self.clock.sleep(self.poll)
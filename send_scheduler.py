@@ -0,0 +1,302 @@
+"""
+Планировщик исходящих вызовов Bot API (sendMessage, editMessageText).
+
+Раньше обработчики вызывали reply_text/edit_message_text напрямую: при ответе 429
+(RetryAfter) сообщение терялось, а при наплыве нажатий бот сам упирался в лимиты Telegram.
+Здесь все отправки идут через одну очередь:
+
+- ведра токенов: общее на бота (около 30 сообщений в секунду) и по одному на чат
+  (около 1 сообщения в секунду, короткие всплески допустимы);
+- RetryAfter приостанавливает все отправки на указанное Telegram время, вызов повторяется;
+- TimedOut/NetworkError повторяются с экспоненциальной задержкой и случайным разбросом;
+- в одном чате вызовы уходят строго по очереди, между чатами первыми идут
+  интерактивные правки (клавиатура ввода кода);
+- правка того же сообщения, еще не ушедшая в Bot API, заменяется новой (key):
+  пользователь увидит последнее состояние клавиатуры, промежуточные не отправляются.
+
+Очередь живет в event loop бота; фоновая задача создается при первой отправке.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from clock import SYSTEM_CLOCK
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+
+# Верхняя граница задержки между повторами при сетевых ошибках (секунды)
+MAX_BACKOFF = 30.0
+
+SEND_QUEUE_SECONDS = REGISTRY.histogram(
+    'bot_send_queue_seconds', 'Ожидание исходящего вызова Bot API в очереди',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+SEND_TOTAL = REGISTRY.counter('bot_send_total', 'Исходящие вызовы Bot API по итогу (sent, failed, coalesced)')
+SEND_RETRIES = REGISTRY.counter('bot_send_retries_total', 'Повторы исходящих вызовов Bot API по причине')
+SEND_QUEUE_DEPTH = REGISTRY.gauge('bot_send_queue_depth', 'Вызовов Bot API в очереди')
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst сразу"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет токен (0 - есть сейчас)"""
+        self._refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ('seq', 'chat_id', 'call', 'priority', 'key', 'max_retries', 'attempts',
+                 'queued', 'not_before', 'future')
+
+    def __init__(self, seq, chat_id, call, priority, key, max_retries, queued, future):
+        self.seq = seq
+        self.chat_id = chat_id
+        self.call = call
+        self.priority = priority
+        self.key = key
+        self.max_retries = max_retries
+        self.attempts = 0
+        self.queued = queued
+        self.not_before = 0.0
+        self.future = future
+
+
+def _seconds(retry_after) -> float:
+    """RetryAfter.retry_after - целые секунды (в новых версиях PTB - timedelta)"""
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+
+class SendScheduler:
+    """Очередь исходящих вызовов Bot API с лимитами Telegram"""
+
+    def __init__(self, global_rate: float = 25.0, global_burst: float = 5, chat_rate: float = 1.0,
+                 chat_burst: float = 3, backoff: float = 0.5, max_wait: float = 120.0, clock=None):
+        """
+        Args:
+            global_rate: Вызовов в секунду на весь бот
+            global_burst: Сколько вызовов можно отправить подряд сверх общего темпа
+            chat_rate: Вызовов в секунду в один чат
+            chat_burst: Всплеск в один чат
+            backoff: Первая задержка повтора при сетевой ошибке (секунды), дальше удваивается
+            max_wait: Сколько вызов может ждать из-за RetryAfter, прежде чем считаться неудачным
+            clock: Часы для лимитов и пауз (по умолчанию настоящие)
+        """
+        self.clock = clock or SYSTEM_CLOCK
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        self._queue: List[_Job] = []
+        self._keyed: Dict[Hashable, _Job] = {}
+        self._busy = set()  # Чаты с вызовом в полете
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._loop = None
+        self._wakeup = None
+        self._worker = None
+
+    # --- Отправка ---
+
+    async def send(self, chat_id, call: Callable[[], Awaitable], priority: int = PRIORITY_NORMAL,
+                   key: Optional[Hashable] = None, max_retries: int = 3, wait: bool = True):
+        """
+        Ставит вызов в очередь
+
+        Args:
+            chat_id: Чат (для лимита на чат и порядка внутри чата)
+            call: Функция без аргументов, возвращающая корутину вызова Bot API
+            priority: PRIORITY_INTERACTIVE или PRIORITY_NORMAL
+            key: Ключ сообщения для правок: неотправленная правка с тем же ключом заменяется
+            max_retries: Попыток при TimedOut/NetworkError
+            wait: False - не ждать отправки (ошибка попадет только в лог)
+
+        Returns:
+            Результат вызова (при wait=True); исключение вызова пробрасывается
+        """
+        self._ensure_worker()
+        job = self._keyed.get(key) if key is not None else None
+        if job is not None:
+            # Предыдущая правка еще в очереди - отправится только новая
+            job.call = call
+            job.priority = min(job.priority, priority)
+            SEND_TOTAL.inc(outcome='coalesced')
+        else:
+            job = _Job(next(self._seq), chat_id, call, priority, key, max_retries,
+                       self.clock.monotonic(), self._loop.create_future())
+            if not wait:
+                job.future.add_done_callback(_log_failure)
+            self._queue.append(job)
+            if key is not None:
+                self._keyed[key] = job
+            SEND_QUEUE_DEPTH.set(len(self._queue))
+            self._wakeup.set()
+        if wait:
+            return await asyncio.shield(job.future)
+        return None
+
+    async def drain(self, timeout: float = 5.0) -> bool:
+        """Ждет, пока очередь опустеет (при остановке бота). True - все отправлено"""
+        # Ждем ответов Bot API, а не пауз бота - по настоящим часам и с виртуальными
+        deadline = time.monotonic() + timeout
+        while (self._queue or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not (self._queue or self._busy)
+
+    def pending(self) -> int:
+        return len(self._queue) + len(self._busy)
+
+    # --- Очередь ---
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        # Новый event loop (перезапуск приложения) - очередь прежнего не переносится
+        self._loop = loop
+        self._queue.clear()
+        self._keyed.clear()
+        self._busy.clear()
+        self._wakeup = asyncio.Event()
+        self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch()
+            await self.clock.wait_event(self._wakeup, delay)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _dispatch(self) -> Optional[float]:
+        """Запускает все вызовы, которые можно отправить сейчас. Возвращает, через сколько проверить снова"""
+        now = self.clock.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        # Кандидаты - первый вызов каждого свободного чата (порядок внутри чата сохраняется)
+        heads = {}
+        for job in sorted(self._queue, key=lambda job: job.seq):
+            if job.chat_id not in heads and job.chat_id not in self._busy:
+                heads[job.chat_id] = job
+
+        delay = None
+        for job in sorted(heads.values(), key=lambda job: (job.priority, job.seq)):
+            wait = max(job.not_before - now, self._chat_bucket(job.chat_id).wait_time(now))
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                # Общий лимит исчерпан - остальные чаты тоже ждут
+                return wait if delay is None else min(delay, wait)
+            self._global.take(now)
+            self._chat_bucket(job.chat_id).take(now)
+            self._queue.remove(job)
+            if job.key is not None:
+                self._keyed.pop(job.key, None)
+            self._busy.add(job.chat_id)
+            SEND_QUEUE_SECONDS.observe(now - job.queued)
+            self._loop.create_task(self._execute(job))
+        SEND_QUEUE_DEPTH.set(len(self._queue))
+        return delay
+
+    async def _execute(self, job: _Job):
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            pause = _seconds(e.retry_after)
+            now = self.clock.monotonic()
+            self._paused_until = max(self._paused_until, now + pause)
+            SEND_RETRIES.inc(reason='retry_after')
+            if now + pause - job.queued > self.max_wait:
+                self._fail(job, e)
+            else:
+                logger.warning("Telegram просит подождать %s с, вызов повторится", pause)
+                self._requeue(job)
+        except (TimedOut, NetworkError) as e:
+            job.attempts += 1
+            if job.attempts >= job.max_retries:
+                logger.error("Не удалось отправить сообщение после %s попыток: %s", job.attempts, e)
+                self._fail(job, e)
+            else:
+                delay = min(MAX_BACKOFF, self.backoff * 2 ** (job.attempts - 1)) * random.uniform(0.5, 1.5)
+                logger.warning("Сетевая ошибка при отправке (попытка %s/%s), повтор через %.1f с",
+                               job.attempts, job.max_retries, delay)
+                SEND_RETRIES.inc(reason='network')
+                job.not_before = self.clock.monotonic() + delay
+                self._requeue(job)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            SEND_TOTAL.inc(outcome='sent')
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._busy.discard(job.chat_id)
+            self._wakeup.set()
+
+    def _requeue(self, job: _Job):
+        newer = self._keyed.get(job.key) if job.key is not None else None
+        if newer is not None:
+            # Пока вызов был в полете, в очередь встала более новая правка того же сообщения
+            SEND_TOTAL.inc(outcome='coalesced')
+            newer.future.add_done_callback(lambda done: _copy_outcome(done, job.future))
+            return
+        # Тот же seq: вызов остается первым в своем чате
+        self._queue.append(job)
+        if job.key is not None:
+            self._keyed[job.key] = job
+
+    @staticmethod
+    def _fail(job: _Job, error: BaseException):
+        SEND_TOTAL.inc(outcome='failed')
+        if not job.future.done():
+            job.future.set_exception(error)
+
+
+def _copy_outcome(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled() or source.exception() is None:
+        target.set_result(None if source.cancelled() else source.result())
+    else:
+        target.set_exception(source.exception())
+
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Ошибка при отправке сообщения: %s", future.exception())
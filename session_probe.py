@@ -0,0 +1,174 @@
+"""
+Выборка полей /api/sessions и ленивый опрос окон только под нужные поля.
+
+Раньше каждый опрос сессий для каждого процесса подключался к окну, проверял экран входа
+и читал текст окна ради номера - даже когда вызывающему нужны только счетчики
+(/api/status) или pid/имя. Теперь поля делятся по цене:
+
+- pid, name, started - из списка процессов (psutil), resources - из замера ресурсов;
+  окна не трогаются;
+- authorized, status - проверка экрана входа (проба auth);
+- phone - текст окна и поиск номера (проба phone).
+
+/api/sessions?fields=pid,name,status запускает только пробы выбранных полей, и только для
+сессий, у которых результат старше SESSION_PROBE_TTL секунд (или при ?refresh=1).
+Результаты хранятся на сессию (pid и время запуска процесса) вместе с ее TelegramAutomation,
+поэтому подключение к окну переиспользуется между пробами. Список процессов для снимка
+(SessionProber.sessions) окна не трогает, а уже известные дорогие поля подставляет из кэша:
+/api/status и легкие выборки обходятся без обращений к UI, authorized_sessions в них -
+по последней проверке (None, пока не проверены все окна).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from inventory_service import (ERROR_FIELDS, NO_WINDOW_FIELDS, authorization_fields, list_telegram_processes,
+                               window_phone)
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд результат пробы окна считается свежим
+SESSION_PROBE_TTL = float(os.getenv('SESSION_PROBE_TTL', '15'))
+
+# Поля сессии в порядке ответа; дорогим полям нужна проба окна (остальным окно не нужно)
+FIELDS = ('pid', 'name', 'started', 'authorized', 'phone', 'status', 'resources')
+FIELD_PROBES = {'authorized': 'auth', 'status': 'auth', 'phone': 'phone'}
+PROBES = ('auth', 'phone')
+
+SESSION_PROBES = REGISTRY.counter('web_session_probes_total', 'Пробы окон для полей сессий (probe: auth, phone)')
+
+
+def parse_fields(value: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Поля из ?fields=a,b,c в порядке FIELDS (pid - всегда); пусто - None (все поля)
+
+    Raises:
+        ValueError: неизвестное поле
+    """
+    if not value:
+        return None
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}. Доступны: {', '.join(FIELDS)}")
+    requested.add('pid')
+    return tuple(field for field in FIELDS if field in requested)
+
+
+def probes_for(fields: Optional[Tuple[str, ...]]) -> Set[str]:
+    """Пробы окон, нужные для полей (None - все поля)"""
+    if fields is None:
+        return set(PROBES)
+    return {FIELD_PROBES[field] for field in fields if field in FIELD_PROBES}
+
+
+class _Entry:
+    """Кэш сессии: автоматизация с подключенным окном и результаты проб"""
+
+    def __init__(self, started: str, automation):
+        self.started = started
+        self.automation = automation
+        self.values: Dict[str, object] = {}
+        self.checked: Dict[str, float] = {}  # проба -> когда выполнена (monotonic)
+
+
+class SessionProber:
+    """Дорогие поля сессий - по запросу и с кэшем на сессию"""
+
+    def __init__(self, ttl: float = SESSION_PROBE_TTL, automation_factory: Optional[Callable] = None):
+        if automation_factory is None:
+            from telegram_automation import TelegramAutomation
+            automation_factory = TelegramAutomation
+        self.ttl = ttl
+        self._factory = automation_factory
+        self._entries: Dict[int, _Entry] = {}
+        self._lock = threading.Lock()  # Кэш сессий (короткие проверки и записи)
+        self._probe_lock = threading.Lock()  # Пробы идут по одной; ждавший запрос видит уже свежий результат
+
+    def sessions(self) -> List[dict]:
+        """Процессы Telegram с известными дорогими полями (загрузчик снимка; окна не трогает)"""
+        processes = list_telegram_processes()
+        with self._lock:
+            alive = {proc_info['pid']: proc_info['started'] for proc_info in processes}
+            for pid in list(self._entries):
+                if alive.get(pid) != self._entries[pid].started:
+                    del self._entries[pid]  # Процесс завершился (или pid занял другой)
+            return [dict(proc_info, **self._entries[proc_info['pid']].values) if proc_info['pid'] in self._entries
+                    else proc_info for proc_info in processes]
+
+    def _stale(self, pid: int, started: str, probes: Set[str], now: float, since: Optional[float] = None) -> Set[str]:
+        """Пробы старше ttl (или выполненные раньше since)"""
+        entry = self._entries.get(pid)
+        if entry is None or entry.started != started:
+            return set(probes)
+        oldest = now - self.ttl if since is None else max(now - self.ttl, since)
+        return {probe for probe in probes if entry.checked.get(probe, float('-inf')) < oldest}
+
+    def needs_probe(self, sessions: List[dict], probes: Set[str]) -> bool:
+        """Есть ли у сессий устаревшие пробы (без обращений к окнам)"""
+        if not probes:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            return any(self._stale(session['pid'], session['started'], probes, now) for session in sessions)
+
+    def probe(self, session: dict, probes: Set[str], since: Optional[float] = None) -> Optional[dict]:
+        """
+        Выполняет устаревшие пробы сессии
+
+        Args:
+            since: Пробы, выполненные раньше этого момента (monotonic), тоже повторяются (?refresh=1)
+
+        Returns:
+            Новые значения полей или None, если пробы свежие
+        """
+        pid = session['pid']
+        started = session['started']
+        with self._lock:
+            if not self._stale(pid, started, probes, time.monotonic(), since):
+                return None  # Свежие пробы не ждут чужих проб окон
+        with self._probe_lock:
+            with self._lock:
+                # Параллельный запрос мог уже выполнить пробы, пока этот ждал
+                missing = self._stale(pid, started, probes, time.monotonic(), since)
+                if not missing:
+                    return None
+                entry = self._entries.get(pid)
+                if entry is None or entry.started != started:
+                    entry = self._entries[pid] = _Entry(started, self._factory())
+            automation = entry.automation
+            try:
+                automation.attach_to_process(pid, session['name'])
+                if not automation.telegram_window:
+                    values = dict(NO_WINDOW_FIELDS)
+                    missing = set(PROBES)  # Без окна известны все дорогие поля
+                else:
+                    values = {}
+                    if 'auth' in missing:
+                        values.update(authorization_fields(automation))
+                    if 'phone' in missing:
+                        values['phone'] = window_phone(automation.telegram_window)
+            except Exception as e:
+                logger.error("Ошибка при проверке процесса %s: %s", pid, e)
+                values = dict(ERROR_FIELDS)
+                missing = set(PROBES)
+            now = time.monotonic()
+            with self._lock:
+                for probe in missing:
+                    entry.checked[probe] = now
+                    SESSION_PROBES.inc(probe=probe)
+                entry.values.update(values)
+            return values
+
+    def ensure(self, snapshot, probes: Set[str], force: bool = False):
+        """Досчитывает пробы для всех сессий снимка и дополняет ими снимок"""
+        if not probes:
+            return
+        since = time.monotonic() if force else None
+        for session in list(snapshot.sessions.values()):
+            values = self.probe(session, probes, since)
+            if values:
+                snapshot.update(session['pid'], values)
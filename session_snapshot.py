@@ -0,0 +1,239 @@
+"""
+Версионированный снимок сессий Telegram для веб-приложения.
+
+Снимок хранит последний список сессий, ресурсы их процессов (resource_sampler.py),
+дорогие поля, досчитанные по запросу (session_probe.py), счетчики (всего / авторизовано / активно),
+которые обновляются при изменениях, а не пересчитываются на каждый запрос, и готовые
+JSON-ответы для текущей версии. Версия растет только когда что-то изменилось -
+по ней строится ETag для условных запросов (If-None-Match -> 304).
+
+У ресурсов своя версия: замер приходит каждые несколько секунд, и если бы он менял общую
+версию, ETag /api/status и /api/sessions?fields=... без resources менялся бы на каждом замере.
+Версия ресурсов входит только в ETag ответов 'sessions' с полем resources, а значения
+сравниваются огрубленными (RESOURCE_PRECISION), чтобы дрожание CPU и памяти не сбрасывало 304.
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Точность сравнения замеров ресурсов: изменения мельче не меняют версию ресурсов
+RESOURCE_PRECISION = {
+    'cpu_percent': float(os.getenv('RESOURCE_CPU_PRECISION', '1')),  # проценты
+    'rss_mb': float(os.getenv('RESOURCE_RSS_PRECISION', '1')),  # МБ
+}
+
+
+def _coarse(resources: Dict[int, dict]) -> Dict[int, dict]:
+    """Замер с округлением до RESOURCE_PRECISION - для сравнения с предыдущим"""
+    coarse = {}
+    for pid, values in resources.items():
+        values = dict(values)
+        for name, step in RESOURCE_PRECISION.items():
+            if values.get(name) is not None and step > 0:
+                values[name] = round(values[name] / step)
+        coarse[pid] = values
+    return coarse
+
+
+class SessionSnapshot:
+    """Снимок списка сессий с инкрементальными счетчиками"""
+
+    def __init__(self, loader: Callable[[], List[dict]], ttl: float = 5.0):
+        """
+        Args:
+            loader: Функция, возвращающая актуальный список сессий (дорогой опрос процессов и окон)
+            ttl: Сколько секунд снимок считается свежим
+        """
+        self._loader = loader
+        self.ttl = ttl
+        self.version = 0
+        self.resources_version = 0
+        self.sessions: Dict[int, dict] = {}  # pid -> сессия, в порядке обнаружения
+        self.active: Dict[int, dict] = {}  # pid -> данные подключения
+        self.resources: Dict[int, dict] = {}  # pid -> CPU, память, потоки, дескрипторы
+        self.total_count = 0
+        self.authorized_count = 0
+        self.unchecked_count = 0  # Сессии, окна которых еще не проверялись (нет поля authorized)
+        self.loaded_at = 0.0
+        self._epoch = os.urandom(4).hex()  # ETag не должен совпасть после перезапуска
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._bodies: Dict[str, bytes] = {}
+        self._coarse_resources: Dict[int, dict] = {}
+
+    # --- Обновление ---
+
+    def is_fresh(self) -> bool:
+        return bool(self.loaded_at) and time.monotonic() - self.loaded_at < self.ttl
+
+    def ensure_fresh(self, force: bool = False):
+        """Перечитывает сессии, если снимок устарел. Параллельные запросы ждут один общий опрос"""
+        if not force and self.is_fresh():
+            return
+        started = time.monotonic()
+        with self._refresh_lock:
+            # Пока ждали, снимок мог обновить другой поток
+            if self.loaded_at >= started or (not force and self.is_fresh()):
+                return
+            sessions = self._loader()
+            self.apply(sessions)
+
+    def apply(self, sessions: List[dict]) -> bool:
+        """Применяет новый список сессий. Возвращает True, если что-то изменилось"""
+        incoming = {session['pid']: session for session in sessions}
+        with self._lock:
+            changed = list(incoming) != list(self.sessions)
+            for pid, old in list(self.sessions.items()):
+                if pid not in incoming:
+                    self.total_count -= 1
+                    self._count(old, -1)
+            for pid, new in incoming.items():
+                old = self.sessions.get(pid)
+                if old is None:
+                    self.total_count += 1
+                    self._count(new, 1)
+                elif old != new:
+                    changed = True
+                    self._count(old, -1)
+                    self._count(new, 1)
+            self.sessions = incoming
+            self.loaded_at = time.monotonic()
+            if changed:
+                self._bump()
+            return changed
+
+    def update(self, pid: int, values: dict) -> bool:
+        """Дополняет сессию полями (дорогие поля, вычисленные по запросу). Возвращает True, если что-то изменилось"""
+        with self._lock:
+            old = self.sessions.get(pid)
+            if old is None:
+                return False
+            new = dict(old, **values)
+            if new == old:
+                return False
+            self.sessions[pid] = new
+            self._count(old, -1)
+            self._count(new, 1)
+            self._bump()
+            return True
+
+    def set_resources(self, resources: Dict[int, dict]) -> bool:
+        """
+        Применяет замер ресурсов процессов. Возвращает True, если что-то изменилось с точностью
+        RESOURCE_PRECISION; иначе замер отбрасывается, чтобы тот же ETag отдавал тот же ответ
+        """
+        coarse = _coarse(resources)
+        with self._lock:
+            if coarse == self._coarse_resources:
+                return False
+            self.resources = resources
+            self._coarse_resources = coarse
+            self.resources_version += 1
+            # Счетчики /api/status от ресурсов не зависят - сбрасываются только списки сессий
+            self._bodies = {key: body for key, body in self._bodies.items() if not self._with_resources(key)}
+            return True
+
+    def connect(self, pid: int, info: dict):
+        """Отмечает сессию как подключенную"""
+        with self._lock:
+            if self.active.get(pid) != info:
+                self.active[pid] = info
+                self._bump()
+
+    def disconnect(self, pid: int):
+        """Снимает отметку о подключении"""
+        with self._lock:
+            if self.active.pop(pid, None) is not None:
+                self._bump()
+
+    def _count(self, session: dict, delta: int):
+        """Учитывает сессию (delta=1) или снимает ее учет (delta=-1) в счетчиках авторизации"""
+        if 'authorized' not in session:
+            self.unchecked_count += delta
+        elif session['authorized']:
+            self.authorized_count += delta
+
+    def _bump(self):
+        self.version += 1
+        self._bodies = {}
+
+    # --- Ответы ---
+
+    @property
+    def etag(self) -> str:
+        """ETag ответов без ресурсов (/api/status, сессии без поля resources)"""
+        return f'{self._epoch}-{self.version}'
+
+    @property
+    def revision(self) -> str:
+        """Версия всего снимка вместе с ресурсами (для подписчиков службы инвентаризации)"""
+        return f'{self.version}.{self.resources_version}'
+
+    @staticmethod
+    def _with_resources(key: str) -> bool:
+        """Есть ли в ответе с ключом кэша поле resources"""
+        if key == 'sessions':
+            return True
+        kind, _, fields = key.partition(':')
+        return kind == 'sessions' and 'resources' in fields.split(',')
+
+    def session_list(self, fields: Optional[Tuple[str, ...]] = None) -> List[dict]:
+        """
+        Сессии с последним замером ресурсов (поле resources, если процесс уже замерен)
+
+        Args:
+            fields: Только эти поля (None - все); поля, которых у сессии нет, пропускаются
+        """
+        sessions = [dict(session, resources=self.resources[pid]) if pid in self.resources else session
+                    for pid, session in self.sessions.items()]
+        if fields is None:
+            return sessions
+        return [{field: session[field] for field in fields if field in session} for session in sessions]
+
+    def status(self) -> dict:
+        """
+        Счетчики для /api/status
+
+        authorized_sessions - None, пока окна части сессий не проверялись (после запуска пробы
+        ленивые): "неизвестно" не выдается за "не авторизован"; сколько таких - unchecked_sessions
+        """
+        return {
+            'active_sessions': len(self.active),
+            'total_sessions': self.total_count,
+            'authorized_sessions': None if self.unchecked_count else self.authorized_count,
+            'unchecked_sessions': self.unchecked_count,
+        }
+
+    def current(self, kind: str, fields: Optional[Tuple[str, ...]] = None) -> Tuple[str, bytes]:
+        """
+        ETag и JSON-ответ ('sessions' или 'status') текущей версии; JSON сериализуется один раз
+        на версию и набор полей (fields - только для 'sessions', None - все поля)
+        """
+        key = kind if fields is None or kind != 'sessions' else f"{kind}:{','.join(fields)}"
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is None:
+                if kind == 'sessions':
+                    sessions = self.session_list(fields)
+                    payload = {'sessions': sessions, 'count': len(sessions)}
+                else:
+                    payload = self.status()
+                cached = self._bodies[key] = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            if self._with_resources(key):
+                return f'{self.etag}.{self.resources_version}', cached
+            return self.etag, cached
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], etag: str) -> bool:
+        """Совпадает ли If-None-Match с ETag"""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag.strip('"') in (etag, '*'):
+                return True
+        return False
@@ -0,0 +1,366 @@
+"""
+Имитация рабочего стола с окнами Telegram для проверок без Windows.
+
+SimulatedDesktop подменяет pywinauto.Application и pyautogui (через загрузчики
+telegram_automation), окна отвечают на те же вызовы, что и обертки pywinauto:
+connect/top_window/windows, descendants, window_text, is_enabled, set_focus, type_keys...
+Каждый вызов окна стоит заданную задержку (как межпроцессный вызов UIA), backend "uia"
+можно сделать медленным или зависающим. Окно проходит экраны входа: номер -> код ->
+облачный пароль (если включен) -> чаты; Enter (pyautogui.press) отправляет текущий экран.
+ReplayWindow вместо самодельных экранов воспроизводит запись настоящего окна (ui_recorder.py).
+Процессы Telegram настоящие - их запускает spawn_processes().
+
+Используется в benchmarks/ (inventory_uia.py и др.), в боевом коде не импортируется.
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class SimulatedRect:
+    def __init__(self, left=100, top=100, width=800, height=600):
+        self.left, self.top = left, top
+        self.right, self.bottom = left + width, top + height
+
+    def width(self):
+        return self.right - self.left
+
+    def height(self):
+        return self.bottom - self.top
+
+
+class SimulatedControl:
+    """Элемент окна (Edit, ComboBox, Button)"""
+
+    def __init__(self, window: 'SimulatedWindow', control_type: str, text: str = '', enabled: bool = True):
+        self.window = window
+        self.control_type = control_type
+        self.text = text
+        self.enabled = enabled
+        self.typed = []
+
+    def _call(self):
+        self.window.desktop.pay()
+
+    def window_text(self):
+        self._call()
+        return self.text
+
+    def friendly_class_name(self):
+        return self.control_type
+
+    def is_enabled(self):
+        self._call()
+        return self.enabled
+
+    def is_visible(self):
+        self._call()
+        return True
+
+    def set_focus(self):
+        self._call()
+        self.window.desktop.focus(self.window, self)
+
+    def set_text(self, text):
+        self._call()
+        self.text = text
+
+    def type_keys(self, keys, with_spaces=False):
+        self._call()
+        self.typed.append(keys)
+        self.text += keys
+
+    def click(self):
+        self._call()
+        self.window.clicks.append(self.text)
+
+    def rectangle(self):
+        return self.window.rect
+
+
+class SimulatedWindow:
+    """Окно Telegram: экран входа или список чатов"""
+
+    def __init__(self, desktop: 'SimulatedDesktop', pid: int, authorized: bool = False, title: str = 'Telegram',
+                 cloud_password: bool = False):
+        self.desktop = desktop
+        self.pid = pid
+        self.title = title
+        self.handle = pid
+        self.rect = SimulatedRect()
+        self.closed = False
+        self.clicks = []
+        self.cloud_password = cloud_password
+        self.entered: Dict[str, str] = {}  # Экран -> что было отправлено Enter
+        self.controls: List[SimulatedControl] = []
+        self.set_authorized(authorized)
+
+    def set_authorized(self, authorized: bool):
+        self.set_screen('chats' if authorized else 'phone')
+
+    def set_screen(self, screen: str):
+        """phone, code, password или chats"""
+        self.screen = screen
+        self.authorized = screen == 'chats'
+        if screen == 'chats':
+            self.controls = [SimulatedControl(self, 'Edit', 'Search'), SimulatedControl(self, 'Button', 'Menu')]
+        elif screen == 'phone':
+            self.controls = [
+                SimulatedControl(self, 'Edit', ''), SimulatedControl(self, 'Edit', ''),
+                SimulatedControl(self, 'ComboBox', 'Russia'),
+                SimulatedControl(self, 'Button', 'Start Messaging'), SimulatedControl(self, 'Button', 'Next'),
+            ]
+        else:
+            self.controls = [SimulatedControl(self, 'Edit', ''), SimulatedControl(self, 'Button', 'Next')]
+
+    def submit(self):
+        """Enter на текущем экране: запоминает введенное и переходит к следующему экрану"""
+        edits = [control.text for control in self.controls if control.control_type == 'Edit']
+        if self.screen == 'phone':
+            self.entered['phone'] = ''.join(edits)
+            self.set_screen('code')
+        elif self.screen == 'code':
+            self.entered['code'] = edits[0]
+            self.set_screen('password' if self.cloud_password else 'chats')
+        elif self.screen == 'password':
+            self.entered['password'] = edits[0]
+            self.set_screen('chats')
+
+    def _call(self):
+        self.desktop.pay()
+        if self.closed:
+            raise RuntimeError("окно закрыто")
+
+    # Методы обертки pywinauto
+
+    def wrapper_object(self):
+        return self
+
+    def is_enabled(self):
+        self._call()
+        return True
+
+    def is_visible(self):
+        self._call()
+        return True
+
+    def window_text(self):
+        self._call()
+        return self.title
+
+    def process_id(self):
+        return self.pid
+
+    def rectangle(self):
+        self._call()
+        return self.rect
+
+    def set_focus(self):
+        self._call()
+        self.desktop.focus(self)
+
+    def descendants(self, control_type=None, depth=None):
+        self._call()
+        return [control for control in self.controls if control_type is None or control.control_type == control_type]
+
+
+class ReplayWindow(SimulatedWindow):
+    """
+    Окно из записи ui_recorder: экраны и элементы - как у настоящего Telegram Desktop
+
+    Enter переводит окно по записанным действиям по порядку: на экран "после" ближайшего
+    следующего действия ввода (input), которое начиналось с текущего экрана. Новый экран
+    появляется через записанную задержку по часам clock (с VirtualClock - детерминированно).
+    """
+
+    def __init__(self, desktop: 'SimulatedDesktop', pid: int, recording, clock=None):
+        from clock import SYSTEM_CLOCK
+        self.recording = recording
+        self.clock = clock or SYSTEM_CLOCK
+        self._cursor = 0
+        self._pending = None  # (момент, экран)
+        super().__init__(desktop, pid)
+
+    def set_authorized(self, authorized: bool):
+        self.set_screen(self.recording.start)
+
+    def set_screen(self, screen: str):
+        tree = self.recording.screens[screen]
+        self.screen = screen
+        self.authorized = False
+        self.title = tree['title']
+        self.rect = SimulatedRect(*tree['rect'])
+        self.controls = [SimulatedControl(self, kind, name, enabled) for kind, name, enabled in tree['controls']]
+
+    def submit(self):
+        actions = self.recording.actions
+        for index in range(self._cursor, len(actions)):
+            action = actions[index]
+            if action.get('input') and action['before'] == self.screen and action['after'] is not None:
+                self._cursor = index + 1
+                edits = [control.text for control in self.controls if control.control_type == 'Edit']
+                self.entered[action['name']] = ''.join(edits)
+                self._pending = (self.clock.monotonic() + (action['delay'] or 0.0), action['after'])
+                self._advance()
+                return
+
+    def _advance(self):
+        if self._pending is not None and self.clock.monotonic() >= self._pending[0]:
+            screen, self._pending = self._pending[1], None
+            self.set_screen(screen)
+
+    def _call(self):
+        super()._call()
+        self._advance()
+
+
+class SimulatedDesktop:
+    """Набор окон и фабрика подмены pywinauto.Application"""
+
+    def __init__(self, call_latency: float = 0.002, uia_delay: float = 0.0):
+        """
+        Args:
+            call_latency: Задержка каждого вызова окна (секунды)
+            uia_delay: Дополнительная задержка connect через backend "uia" (медленный/зависший UIA)
+        """
+        self.call_latency = call_latency
+        self.uia_delay = uia_delay
+        self.windows: Dict[int, SimulatedWindow] = {}
+        self.calls = 0
+        self.focused: Optional[SimulatedWindow] = None
+        self.focused_control: Optional[SimulatedControl] = None
+        self.pyautogui = SimulatedPyAutoGui(self)
+        self._lock = threading.Lock()
+
+    def pay(self):
+        with self._lock:
+            self.calls += 1
+        if self.call_latency:
+            time.sleep(self.call_latency)
+
+    def add_window(self, pid: int, authorized: bool = False, title: str = 'Telegram',
+                   cloud_password: bool = False) -> SimulatedWindow:
+        window = self.windows[pid] = SimulatedWindow(self, pid, authorized, title, cloud_password)
+        return window
+
+    def add_replay_window(self, pid: int, recording, clock=None) -> ReplayWindow:
+        """Окно из записи ui_recorder (Recording)"""
+        window = self.windows[pid] = ReplayWindow(self, pid, recording, clock)
+        return window
+
+    def focus(self, window: SimulatedWindow, control: Optional[SimulatedControl] = None):
+        self.focused, self.focused_control = window, control
+
+    def application_class(self):
+        desktop = self
+
+        class SimulatedApplication:
+            def __init__(self, backend='win32'):
+                self.backend = backend
+                self.found = None
+
+            def connect(self, process=None, title_re=None, handle=None, **kwargs):
+                if handle is not None:
+                    # По дескриптору окно не ищется (pywinauto берет PID из дескриптора) - без задержки
+                    self.found = next((window for window in desktop.windows.values()
+                                       if window.handle == handle and not window.closed), None)
+                    if self.found is None:
+                        raise RuntimeError("окно не найдено")
+                    return self
+                desktop.pay()
+                if self.backend == 'uia' and desktop.uia_delay:
+                    time.sleep(desktop.uia_delay)
+                if process is not None:
+                    self.found = desktop.windows.get(process)
+                else:
+                    self.found = next((window for window in desktop.windows.values()
+                                       if re.match(title_re, window.title)), None)
+                if self.found is None or self.found.closed:
+                    raise RuntimeError("окно не найдено")
+                return self
+
+            def top_window(self):
+                return self.found
+
+            def window(self, handle=None, **kwargs):
+                return self.found if handle is None or self.found.handle == handle else None
+
+            def windows(self):
+                return [self.found]
+
+        return SimulatedApplication
+
+    def install(self):
+        """Подменяет pywinauto.Application и pyautogui в telegram_automation"""
+        import telegram_automation
+        from flight_recorder import RECORDER
+        from input_batch import PyAutoGuiSender
+        telegram_automation._Application = self.application_class()
+        telegram_automation._pyautogui = RECORDER.instrument(self.pyautogui)
+        # Пакетный ввод - вызовами подмененного pyautogui, а не настоящим SendInput
+        telegram_automation._input_sender = PyAutoGuiSender(telegram_automation._pyautogui)
+        return self
+
+
+class SimulatedPyAutoGui:
+    """pyautogui поверх SimulatedDesktop: Enter отправляет экран окна в фокусе"""
+
+    __name__ = 'pyautogui'
+
+    def __init__(self, desktop: SimulatedDesktop):
+        self.desktop = desktop
+        self.actions = []
+
+    def press(self, key, **kwargs):
+        self.actions.append(('press', key))
+        control = self.desktop.focused_control
+        # Enter в списке стран только выбирает страну
+        if key == 'enter' and self.desktop.focused is not None and not (
+                control is not None and control.control_type == 'ComboBox'):
+            self.desktop.focused.submit()
+
+    def hotkey(self, *keys, **kwargs):
+        self.actions.append(('hotkey', keys))
+
+    def click(self, *args, **kwargs):
+        self.actions.append(('click', args))
+
+    def moveTo(self, *args, **kwargs):
+        self.actions.append(('moveTo', args))
+
+    def write(self, text, interval=0.0, **kwargs):
+        self.actions.append(('write', text))
+        if self.desktop.focused_control is not None:
+            self.desktop.focused_control.text += text
+
+    typewrite = write
+
+    def size(self):
+        return 1920, 1080
+
+
+def spawn_processes(count: int, name: str = 'Telegram') -> List[subprocess.Popen]:
+    """Запускает count спящих процессов с именем исполняемого файла name (для psutil)"""
+    directory = tempfile.mkdtemp(prefix='tg-sim-')
+    executable = os.path.join(directory, name + ('.exe' if os.name == 'nt' else ''))
+    try:
+        os.symlink(sys.executable, executable)
+    except (OSError, NotImplementedError):
+        shutil.copy(sys.executable, executable)
+    return [subprocess.Popen([executable, '-c', 'import time; time.sleep(3600)']) for _ in range(count)]
+
+
+def stop_processes(processes: List[subprocess.Popen], timeout: Optional[float] = 5):
+    for proc in processes:
+        proc.terminate()
+    for proc in processes:
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
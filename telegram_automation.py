@@ -1,116 +1,410 @@
-import pyautogui
-import pywinauto
-import time
 import logging
+import random
+import functools
+import threading
 import psutil
-from pywinauto import Application
+from typing import Optional
+from ui_locator import UI_CALLS, UiLocator
+from window_attach import attach
+from visual_locator import VisualLocator
+from flight_recorder import RECORDER
+from clock import SYSTEM_CLOCK
+from window_breaker import WindowBreaker
+from ui_recorder import UiTreeRecorder
+from screen_change import SCREEN_CHANGE_TIMEOUT, ScreenChangeDetector
+from input_batch import InputSequence, PyAutoGuiSender, native_sender, send as send_input
+import deadline
 
 logger = logging.getLogger(__name__)
 
-# Настройка pyautogui с защитой от блокировки
-import random
-pyautogui.PAUSE = random.uniform(0.2, 0.5)  # Случайная пауза для имитации человеческого поведения
-pyautogui.FAILSAFE = True  # Безопасность: перемещение мыши в угол экрана прервет выполнение
+# pyautogui и pywinauto тянут за собой весь стек GUI-автоматизации (comtypes, win32, Pillow),
+# поэтому импортируются при первом действии с UI, а не при импорте модуля
+_pyautogui = None
+_Application = None
+_input_sender = None
+
+
+def load_pyautogui():
+    """Импортирует и настраивает pyautogui при первом обращении"""
+    global _pyautogui
+    if _pyautogui is None:
+        import pyautogui
+        # Настройка pyautogui с защитой от блокировки
+        pyautogui.PAUSE = random.uniform(0.2, 0.5)  # Случайная пауза для имитации человеческого поведения
+        pyautogui.FAILSAFE = True  # Безопасность: перемещение мыши в угол экрана прервет выполнение
+        # Клики и нажатия попадают в бортовой самописец (текст маскируется)
+        _pyautogui = RECORDER.instrument(pyautogui)
+    return _pyautogui
+
+
+def load_input_sender():
+    """Отправитель пакетного ввода (input_batch.py): SendInput на Windows, иначе pyautogui без пауз"""
+    global _input_sender
+    if _input_sender is None:
+        pyautogui = load_pyautogui()
+        _input_sender = native_sender(failsafe=pyautogui.failSafeCheck) or PyAutoGuiSender(pyautogui)
+    return _input_sender
+
+
+def load_application():
+    """Импортирует pywinauto.Application при первом обращении"""
+    global _Application
+    if _Application is None:
+        from pywinauto import Application
+        _Application = Application
+    return _Application
+
+
+# Сколько секунд кэш элементов экрана входа считается свежим
+LOGIN_CONTROLS_TTL = 60.0
+
+# Подписи кнопки продолжения на экранах входа
+CONTINUE_BUTTON_NAMES = ["продолжить", "continue", "next", "далее"]
+
+# Сколько примерно идет резервный путь pyautogui (паузы и ожидание смены экрана) и Alt+Tab с повторным
+# поиском окна: при меньшем остатке бюджета входа (deadline.py) они пропускаются
+PYAUTOGUI_FALLBACK_SECONDS = 5.0
+ALT_TAB_SECONDS = 2.0
+
+# Признаки экрана входа в названиях кнопок и надписей
+LOGIN_SCREEN_KEYWORDS = ["start messaging", "начать общение", "log in", "войти", "phone number", "номер телефона", "qr"]
+
+
+def _exclusive(method):
+    """Не дает фоновому прогреву и действию пользователя работать с окном одновременно"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._ui_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _captured(settle: bool):
+    """С UI_RECORD_DIR снимает дерево окна до и после действия (ui_recorder.py)"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            recorder = self.tree_recorder
+            if recorder is None:
+                return method(self, *args, **kwargs)
+            if self.telegram_window is None:
+                self.find_telegram_window()  # Иначе экран до первого действия не попадет в запись
+            before = recorder.screen(self.telegram_window)
+            started = recorder.clock.monotonic()
+            result = method(self, *args, **kwargs)
+            recorder.action(method.__name__, self.telegram_window, before, started, result, settle)
+            return result
+        return wrapper
+    return decorator
+
+
+# Возможные имена процессов Telegram
+TELEGRAM_PROCESS_NAMES = ("Telegram.exe", "Telegram", "telegram")
+
+
+def _telegram_processes():
+    """(pid, имя) процессов Telegram в порядке, в котором find_telegram_window пробует подключиться"""
+    for proc_name in TELEGRAM_PROCESS_NAMES:
+        try:
+            for proc in psutil.process_iter(['pid', 'name']):
+                try:
+                    if proc.info['name'] and proc_name.lower() in proc.info['name'].lower():
+                        yield proc.info['pid'], proc.info['name']
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+        except Exception as e:
+            logger.debug("Ошибка при поиске процесса %s: %s", proc_name, e)
 
 
 class TelegramAutomation:
     """Класс для автоматизации ввода в Telegram Desktop/Portable"""
     
-    def __init__(self):
+    def __init__(self, clock=None):
+        self.clock = clock or SYSTEM_CLOCK  # Паузы и возраст кэша; в проверках - VirtualClock
         self.telegram_window = None
         self.is_authorized = None  # Кэш статуса авторизации
-        # Не ищем окно при инициализации, будем искать когда нужно
+        self.login_controls = None  # Кэш элементов экрана входа: {control_type: [элементы]}
+        self.login_controls_window = None  # Окно, для которого собран кэш
+        self.login_controls_at = 0.0
+        self._ui_lock = threading.RLock()
+        self.locator = UiLocator()  # Поиск элементов условиями UIA, с замером времени
+        self.visual = VisualLocator()  # Поиск по шаблонам для резервного пути pyautogui
+        self.breaker = WindowBreaker()  # Без Telegram поиск окна не повторяется на каждый вызов
+        self.tree_recorder = UiTreeRecorder.from_env(self.clock)  # Запись деревьев UI (UI_RECORD_DIR)
+        self.screen_change = ScreenChangeDetector(clock=self.clock)  # Сменился ли экран после pyautogui
+        # Не ищем окно при инициализации, будем искать когда нужно (или в фоне через warm_up)
     
+    @deadline.stepped('find_window')
+    @_exclusive
+    @RECORDER.traced(nested_only=True)
     def find_telegram_window(self):
-        """Поиск окна Telegram Desktop/Portable"""
+        """Поиск окна Telegram Desktop/Portable (сразу False, пока предохранитель разомкнут)"""
+        if not self.breaker.allow():
+            return False
+        found = self._find_telegram_window()
+        if found:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return found
+    
+    def _find_telegram_window(self) -> bool:
         try:
-            # Список возможных имен процессов Telegram
-            telegram_processes = ["Telegram.exe", "Telegram", "telegram"]
+            self.login_controls = None
             
             # Сначала ищем по процессу
-            for proc_name in telegram_processes:
-                try:
-                    # Ищем процесс
-                    for proc in psutil.process_iter(['pid', 'name']):
-                        try:
-                            if proc.info['name'] and proc_name.lower() in proc.info['name'].lower():
-                                pid = proc.info['pid']
-                                logger.info(f"Найден процесс Telegram: {proc.info['name']} (PID: {pid})")
-                                
-                                # Пробуем подключиться через uia
-                                try:
-                                    app = Application(backend="uia").connect(process=pid)
-                                    self.telegram_window = app.top_window()
-                                    logger.info("Окно Telegram найдено по PID (uia)")
-                                    return True
-                                except Exception as e:
-                                    logger.debug(f"Не удалось подключиться через uia (PID {pid}): {e}")
-                                
-                                # Пробуем через win32
-                                try:
-                                    app = Application(backend="win32").connect(process=pid)
-                                    self.telegram_window = app.top_window()
-                                    logger.info("Окно Telegram найдено по PID (win32)")
-                                    return True
-                                except Exception as e:
-                                    logger.debug(f"Не удалось подключиться через win32 (PID {pid}): {e}")
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            continue
-                except Exception as e:
-                    logger.debug(f"Ошибка при поиске процесса {proc_name}: {e}")
+            for pid, name in _telegram_processes():
+                logger.info("Найден процесс Telegram: %s (PID: %s)", name, pid)
+                
+                # uia и win32 подключаются параллельно, побеждает первый
+                window, backend = attach(process=pid, exe=name)
+                if window is not None:
+                    self.telegram_window = window
+                    logger.info("Окно Telegram найдено по PID (%s)", backend)
+                    return True
             
             # Пробуем найти по заголовку окна (разные варианты)
             title_patterns = [".*Telegram.*", "Telegram", "Telegram Desktop"]
             
-            for pattern in title_patterns:
-                try:
-                    app = Application(backend="uia").connect(title_re=pattern)
-                    windows = app.windows()
-                    if windows:
-                        # Берем первое видимое окно
-                        for win in windows:
-                            try:
-                                if win.is_visible():
-                                    self.telegram_window = win
-                                    logger.info(f"Окно Telegram найдено по заголовку '{pattern}' (uia)")
-                                    return True
-                            except:
-                                continue
-                except Exception as e:
-                    logger.debug(f"Не удалось найти через uia с паттерном '{pattern}': {e}")
-                
-                try:
-                    app = Application(backend="win32").connect(title_re=pattern)
-                    windows = app.windows()
-                    if windows:
-                        for win in windows:
-                            try:
-                                if win.is_visible():
-                                    self.telegram_window = win
-                                    logger.info(f"Окно Telegram найдено по заголовку '{pattern}' (win32)")
-                                    return True
-                            except:
-                                continue
-                except Exception as e:
-                    logger.debug(f"Не удалось найти через win32 с паттерном '{pattern}': {e}")
+            window, backend = attach(title_patterns=title_patterns)
+            if window is not None:
+                self.telegram_window = window
+                logger.info("Окно Telegram найдено по заголовку (%s)", backend)
+                return True
             
             logger.warning("Не удалось найти окно Telegram. Убедитесь, что Telegram Desktop/Portable запущен и видим.")
             return False
         except Exception as e:
-            logger.warning(f"Ошибка при поиске окна Telegram: {e}")
+            logger.warning("Ошибка при поиске окна Telegram: %s", e)
+            return False
+    
+    def target_pid(self) -> Optional[int]:
+        """
+        PID процесса, с окном которого работает автоматизация
+
+        Найденное окно - его процесс; иначе процесс, к которому find_telegram_window
+        подключится первым (без обращений к UI). None - Telegram не запущен.
+        """
+        if self.telegram_window is not None:
+            try:
+                return self.telegram_window.process_id()
+            except Exception:
+                pass
+        return next((pid for pid, _ in _telegram_processes()), None)
+    
+    def window_unavailable(self) -> bool:
+        """Окна нет и предохранитель разомкнут: действие с окном бессмысленно, лучше сразу отказать"""
+        # Сначала дешевая проверка предохранителя: обращение к окну - только когда он разомкнут
+        if not self.breaker.is_open or self._window_alive():
+            return False
+        logger.warning("%s, действие пропущено", self.breaker.status())
+        RECORDER.event('window_unavailable')
+        return True
+    
+    def wait(self, seconds: float):
+        """Пауза по часам автоматизации (записывается в прогон и в бюджет входа)"""
+        RECORDER.wait(seconds, sleep=self.clock.sleep)
+        deadline.waited(seconds)
+    
+    def _strategy(self, name: str):
+        """Выбранная стратегия ввода: в прогон и отдельной частью бюджета входа"""
+        RECORDER.strategy(name)
+        deadline.mark(name)
+    
+    def _window_alive(self) -> bool:
+        """Проверяет, что найденное ранее окно еще существует"""
+        if not self.telegram_window:
+            return False
+        try:
+            UI_CALLS.inc(kind='alive')
+            self.telegram_window.is_enabled()
+            return True
+        except Exception:
+            return False
+    
+    @_exclusive
+    def attach_to_process(self, pid: int, exe: str = None) -> bool:
+        """Подключается к окну конкретного процесса, если найденное ранее окно уже закрыто"""
+        if self._window_alive():
+            return True
+        self.telegram_window, _ = attach(process=pid, exe=exe)
+        self.login_controls = None
+        if self.telegram_window is not None:
+            self.breaker.record_success()
+        return self.telegram_window is not None
+    
+    def _visual_point(self, target: str):
+        """Точка элемента по шаблону (из кэша координат, если окно уже встречалось) или None"""
+        if not self.telegram_window:
+            return None
+        try:
+            point = self.visual.locate(target, self.telegram_window)
+            RECORDER.event('visual_point', target=target, found=point is not None)
+            return point
+        except Exception as e:
+            logger.debug("Поиск %s по шаблону не удался: %s", target, e)
+            return None
+    
+    def _forget_points(self, *targets: str):
+        """Удаляет из кэша координат точки, клик по которым не сменил экран"""
+        if not self.telegram_window:
+            return
+        for target in targets:
+            try:
+                self.visual.forget(self.telegram_window, target)
+                RECORDER.event('visual_forget', target=target)
+                logger.info("Точка %s удалена из кэша координат: экран не сменился", target)
+            except Exception as e:
+                logger.debug("Не удалось удалить точку %s из кэша: %s", target, e)
+    
+    def _send_input(self, sequence: InputSequence):
+        """Пакетный ввод: кусок между паузами - одна отправка, паузы - через self.wait"""
+        sender = load_input_sender()
+        send_input(sequence, sender, self.wait,
+                   on_segment=lambda actions: RECORDER.event(
+                       'input_batch', sender=sender.name, actions=[action[0] for action in actions]))
+    
+    def _fallback_in_budget(self) -> bool:
+        """Хватает ли остатка бюджета входа на резервный путь pyautogui"""
+        if not deadline.low(PYAUTOGUI_FALLBACK_SECONDS):
+            return True
+        deadline.shortcut('pyautogui')
+        RECORDER.event('budget_shortcut', step='pyautogui')
+        logger.warning("Бюджет входа почти исчерпан: резервный путь pyautogui пропущен")
+        return False
+    
+    def _screen_bbox(self):
+        """Область окна для хэша экрана (None - весь экран)"""
+        if not self.telegram_window:
+            return None
+        try:
+            rect = self.telegram_window.rectangle()
+            return rect.left, rect.top, rect.right, rect.bottom
+        except Exception:
+            return None
+    
+    def _screen_hash(self):
+        return self.screen_change.hash(self._screen_bbox())
+    
+    def _await_screen(self, before, fallback: float):
+        """
+        После действия pyautogui ждет смены экрана вместо фиксированной паузы
+        
+        Returns:
+            True/False - сменился ли экран; None - снять экран нельзя, выждана пауза fallback
+        """
+        if before is None:
+            self.wait(fallback)
+            return None
+        timeout = deadline.clamp(SCREEN_CHANGE_TIMEOUT, what='screen_change')
+        changed = self.screen_change.wait_change(self._screen_bbox(), before, timeout)
+        RECORDER.event('screen_change', changed=changed)
+        return changed
+    
+    def _resolve_login_controls(self):
+        """Собирает элементы экрана входа одним проходом по дереву UIA и кэширует их"""
+        controls = {}
+        for control_type in ("Edit", "ComboBox", "Button"):
+            try:
+                UI_CALLS.inc(kind='descendants')
+                controls[control_type] = self.telegram_window.descendants(control_type=control_type)
+            except Exception as e:
+                logger.debug("Не удалось получить элементы %s: %s", control_type, e)
+                controls[control_type] = []
+        self.login_controls = controls
+        self.login_controls_window = self.telegram_window
+        self.login_controls_at = self.clock.monotonic()
+        return controls
+    
+    def _login_controls(self, control_type: str) -> list:
+        """Элементы экрана входа из кэша (если он свежий и собран для текущего окна) или из дерева UIA"""
+        fresh = (
+            self.login_controls is not None
+            and self.login_controls_window is self.telegram_window
+            and self.clock.monotonic() - self.login_controls_at < LOGIN_CONTROLS_TTL
+        )
+        if not fresh:
+            self._resolve_login_controls()
+        return self.login_controls.get(control_type, [])
+    
+    def warm_up(self) -> bool:
+        """
+        Фоновый прогрев: заранее находит окно Telegram и элементы экрана входа
+        
+        Если окно сейчас занято действием пользователя, проход пропускается.
+        
+        Returns:
+            True если окно найдено и элементы закэшированы
+        """
+        if not self._ui_lock.acquire(blocking=False):
+            return self.telegram_window is not None
+        try:
+            if not self._window_alive():
+                self.telegram_window = None
+                if not self.find_telegram_window():
+                    return False
+            self._resolve_login_controls()
+            return True
+        except Exception as e:
+            logger.debug("Ошибка при прогреве окна: %s", e)
+            return False
+        finally:
+            self._ui_lock.release()
+    
+    @_exclusive
+    @_captured(settle=False)
+    @RECORDER.traced(nested_only=True)
+    def check_if_authorized(self) -> bool:
+        """
+        Проверяет, авторизован ли Telegram Desktop (окно найдено и это не экран входа)
+        
+        Returns:
+            True если авторизован, False если виден экран входа или окно не найдено
+        """
+        try:
+            if not self._window_alive() and not self.find_telegram_window():
+                self.is_authorized = None
+                return False
+            
+            for control in self._login_controls("Button"):
+                try:
+                    UI_CALLS.inc(kind='window_text')
+                    name = control.window_text().lower()
+                except Exception:
+                    continue
+                if any(keyword in name for keyword in LOGIN_SCREEN_KEYWORDS):
+                    self.is_authorized = False
+                    return False
+            
+            # Поля ввода номера есть только на экране входа (поиск в чатах появляется позже)
+            self.is_authorized = len(self._login_controls("Edit")) < 2
+            return self.is_authorized
+        except Exception as e:
+            logger.debug("Ошибка при проверке авторизации: %s", e)
+            self.is_authorized = None
             return False
     
+    @deadline.stepped()
+    @_exclusive
+    @RECORDER.traced(nested_only=True)
     def activate_window(self):
         """Активация окна Telegram"""
         try:
             # Если окно не найдено, пробуем найти
             if not self.telegram_window:
                 if not self.find_telegram_window():
+                    if self.breaker.is_open:
+                        # Telegram не запущен - Alt+Tab и повторный поиск не помогут
+                        return False
+                    if deadline.low(ALT_TAB_SECONDS):
+                        deadline.shortcut('alt_tab')
+                        return False
                     # Если не удалось найти через pywinauto, пробуем активировать через Alt+Tab
                     logger.info("Пробуем активировать Telegram через Alt+Tab...")
                     try:
+                        pyautogui = load_pyautogui()
                         pyautogui.hotkey('alt', 'tab')
-                        time.sleep(0.5)
+                        self.wait(0.5)
                         # Пробуем найти окно еще раз после переключения
                         if self.find_telegram_window():
                             return True
@@ -118,21 +412,21 @@ class TelegramAutomation:
                         logger.info("Переключение выполнено, продолжаем без pywinauto")
                         return True
                     except Exception as e:
-                        logger.warning(f"Не удалось переключиться через Alt+Tab: {e}")
+                        logger.warning("Не удалось переключиться через Alt+Tab: %s", e)
                     return False
             
             if self.telegram_window:
                 try:
                     self.telegram_window.set_focus()
-                    time.sleep(0.5)
+                    self.wait(0.5)
                     return True
                 except Exception as e:
-                    logger.warning(f"Не удалось активировать окно, пробуем найти заново: {e}")
+                    logger.warning("Не удалось активировать окно, пробуем найти заново: %s", e)
                     # Пробуем найти окно заново
                     if self.find_telegram_window():
                         try:
                             self.telegram_window.set_focus()
-                            time.sleep(0.5)
+                            self.wait(0.5)
                             return True
                         except:
                             # Если не удалось активировать, но окно найдено - продолжаем
@@ -140,9 +434,13 @@ class TelegramAutomation:
                             return True
             return False
         except Exception as e:
-            logger.error(f"Ошибка при активации окна: {e}")
+            logger.error("Ошибка при активации окна: %s", e)
             return False
     
+    @deadline.stepped()
+    @_exclusive
+    @_captured(settle=True)
+    @RECORDER.traced()
     def enter_phone_number(self, phone: str) -> bool:
         """
         Ввод номера телефона в Telegram Desktop/Portable
@@ -153,7 +451,12 @@ class TelegramAutomation:
         Returns:
             True если успешно, False в противном случае
         """
+        if self.window_unavailable():
+            return False
+        
         try:
+            pyautogui = load_pyautogui()
+            
             # Парсим номер: извлекаем код страны и сам номер
             # Формат: +79991234567 -> код: +7, номер: 9991234567
             if not phone.startswith('+'):
@@ -193,91 +496,104 @@ class TelegramAutomation:
                         logger.error("Не удалось определить код страны")
                         return False
             
-            logger.info(f"Код страны: {country_code}, Номер: {phone_number}")
+            logger.info("Код страны: %s, Номер: %s", country_code, phone_number)
             
             # Пробуем активировать окно (но продолжаем даже если не удалось)
             self.activate_window()
             
-            time.sleep(1)  # Даем время окну активироваться
+            self.wait(1)  # Даем время окну активироваться
             
             # Пробуем найти поля ввода через pywinauto
             try:
                 if self.telegram_window:
-                    # Ищем все поля ввода (Edit controls)
-                    edit_controls = self.telegram_window.descendants(control_type="Edit")
+                    # Ищем все поля ввода (Edit controls) - из кэша прогрева, если он свежий
+                    edit_controls = self._login_controls("Edit")
                     
                     # Также ищем ComboBox для выбора страны
-                    combobox_controls = self.telegram_window.descendants(control_type="ComboBox")
+                    combobox_controls = self._login_controls("ComboBox")
                     
                     if len(edit_controls) >= 2:
+                        self._strategy('pywinauto')
                         # Первое поле - код страны, второе - номер
                         country_field = edit_controls[0]
                         phone_field = edit_controls[1]
                         
                         # Сначала работаем с полем кода страны
                         country_field.set_focus()
-                        time.sleep(0.5)
+                        self.wait(0.5)
                         
                         # Очищаем поле кода страны
                         country_field.set_text("")
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         
                         # Вводим код страны (только цифры, без +)
                         country_code_digits = country_code.replace('+', '')
                         country_field.type_keys(country_code_digits, with_spaces=False)
-                        time.sleep(0.5)
+                        self.wait(0.5)
                         
                         # Если есть ComboBox, пробуем выбрать страну
                         if combobox_controls:
                             try:
                                 combobox = combobox_controls[0]
                                 combobox.set_focus()
-                                time.sleep(0.3)
+                                self.wait(0.3)
                                 # Пробуем ввести код страны для поиска
                                 combobox.type_keys(country_code_digits, with_spaces=False)
-                                time.sleep(0.5)
+                                self.wait(0.5)
                                 # Нажимаем Enter для выбора
                                 pyautogui.press('enter')
-                                time.sleep(0.3)
+                                self.wait(0.3)
                             except Exception as e:
-                                logger.debug(f"Не удалось использовать ComboBox: {e}")
+                                logger.debug("Не удалось использовать ComboBox: %s", e)
                         
                         # Переходим в поле номера (Tab или клик)
                         phone_field.set_focus()
-                        time.sleep(0.5)
+                        self.wait(0.5)
                         
                         # Очищаем поле номера
                         phone_field.set_text("")
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         
                         # Вводим номер
+                        RECORDER.event('type_keys', field='phone_field', phone=phone_number)
                         phone_field.type_keys(phone_number, with_spaces=False)
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         
                         # Нажимаем Enter для подтверждения
                         pyautogui.press('enter')
-                        time.sleep(0.5)
+                        self.wait(0.5)
                         
-                        logger.info(f"Номер {phone} введен через pywinauto (код: {country_code}, номер: {phone_number})")
+                        logger.info("Номер %s введен через pywinauto (код: %s, номер: %s)", phone, country_code, phone_number)
+                        self.login_controls = None  # Экран сменился
                         return True
                     elif len(edit_controls) == 1:
                         # Только одно поле - пробуем ввести весь номер
+                        self._strategy('pywinauto')
                         phone_field = edit_controls[0]
                         phone_field.set_focus()
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         phone_field.set_text("")
-                        time.sleep(0.2)
+                        self.wait(0.2)
+                        RECORDER.event('type_keys', field='phone_field', phone=phone)
                         phone_field.type_keys(phone, with_spaces=False)
-                        logger.info(f"Номер {phone} введен через pywinauto (одно поле)")
+                        logger.info("Номер %s введен через pywinauto (одно поле)", phone)
+                        self.login_controls = None  # Экран сменился
                         return True
             except Exception as e:
-                logger.warning(f"Не удалось ввести через pywinauto: {e}")
+                logger.warning("Не удалось ввести через pywinauto: %s", e)
             
             # Альтернативный способ через pyautogui
             # В Telegram Desktop есть два поля: код страны и номер
+            if not self._fallback_in_budget():
+                return False
             try:
-                # Если окно найдено, используем его координаты
-                if self.telegram_window:
+                self._strategy('pyautogui')
+                # Сначала ищем поля по шаблонам, затем - прежние доли окна
+                country_point = self._visual_point("country_field")
+                phone_point = self._visual_point("phone_field")
+                if country_point:
+                    country_x, country_y = country_point
+                elif self.telegram_window:
                     try:
                         window_rect = self.telegram_window.rectangle()
                         # Поле кода страны обычно слева, выше (примерно 1/4 ширины, 1/3 высоты)
@@ -301,94 +617,88 @@ class TelegramAutomation:
                     phone_x = screen_width // 2
                     phone_y = screen_height // 3 + 30
                 
-                # Шаг 1: Кликаем в поле кода страны (или выпадающий список)
-                pyautogui.click(country_x, country_y, duration=0.1)  # Быстрый клик
-                time.sleep(0.4)  # Уменьшенная задержка
-                
-                # Очищаем поле кода страны
-                pyautogui.hotkey('ctrl', 'a')
-                time.sleep(0.1)
-                pyautogui.press('delete')
-                time.sleep(0.1)
-                
-                # Вводим код страны (только цифры, без +)
-                country_code_digits = country_code.replace('+', '')
-                pyautogui.write(country_code_digits, interval=0.05)  # Быстрее
-                time.sleep(0.3)
-                
-                # Если открылся выпадающий список, нажимаем Enter для выбора
-                pyautogui.press('enter')
-                time.sleep(0.3)
-                
-                # Шаг 2: Переходим в поле номера (Tab или клик)
-                # Сначала пробуем Tab (быстрее чем клик)
-                pyautogui.press('tab')
-                time.sleep(0.2)
-                
-                # Очищаем поле номера
-                pyautogui.hotkey('ctrl', 'a')
-                time.sleep(0.1)
-                pyautogui.press('delete')
-                time.sleep(0.1)
-                
-                # Вводим номер (без кода страны)
-                pyautogui.write(phone_number, interval=0.05)  # Быстрее
-                time.sleep(0.3)
+                # Весь ввод - тремя отправками (input_batch.py); паузы только там, где окну нужно время
+                sequence = InputSequence()
+                # Шаг 1: Кликаем в поле кода страны (или выпадающий список) - ждем фокус
+                sequence.click(country_x, country_y).wait(0.4)
+                # Очищаем поле и вводим код страны (только цифры, без +); Enter выбирает страну
+                # в выпадающем списке - ждем, пока список закроется
+                sequence.hotkey('ctrl', 'a').press('delete').write(country_code.replace('+', ''))
+                sequence.press('enter').wait(0.3)
+                # Шаг 2: Переходим в поле номера - клик, если поле найдено по шаблону, иначе Tab
+                if phone_point:
+                    sequence.click(phone_point[0], phone_point[1])
+                else:
+                    sequence.press('tab')
+                # Очищаем поле номера и вводим номер (без кода страны)
+                sequence.hotkey('ctrl', 'a').press('delete').write(phone_number)
+                self._send_input(sequence)
                 
                 # Нажимаем Enter для подтверждения и получения кода
-                pyautogui.press('enter')
-                time.sleep(0.5)
+                before = self._screen_hash()
+                self._send_input(InputSequence().press('enter'))
+                if self._await_screen(before, 0.5) is False:
+                    logger.warning("После ввода номера через pyautogui экран не сменился")
+                    used = {"country_field": country_point, "phone_field": phone_point}
+                    self._forget_points(*[target for target, point in used.items() if point])
+                    return False
                 
-                logger.info(f"Номер {phone} введен через pyautogui (код: {country_code}, номер: {phone_number})")
+                logger.info("Номер %s введен через pyautogui (код: %s, номер: %s)", phone, country_code, phone_number)
                 return True
                 
             except Exception as e:
-                logger.error(f"Ошибка при вводе через pyautogui: {e}")
+                logger.error("Ошибка при вводе через pyautogui: %s", e)
                 return False
                 
         except Exception as e:
-            logger.error(f"Ошибка при вводе номера: {e}")
+            logger.error("Ошибка при вводе номера: %s", e)
             return False
     
+    @deadline.stepped()
+    @_exclusive
+    @RECORDER.traced('click_continue_button')
     def _click_continue_button(self):
         """Поиск и нажатие кнопки 'Продолжить' в Telegram Desktop"""
         try:
-            time.sleep(0.5)  # Даем время для появления кнопки
+            pyautogui = load_pyautogui()
+            self.wait(0.5)  # Даем время для появления кнопки
             
             # Пробуем найти кнопку через pywinauto
             if self.telegram_window:
                 try:
-                    # Ищем кнопку по тексту
-                    buttons = self.telegram_window.descendants(control_type="Button")
-                    for button in buttons:
-                        try:
-                            button_text = button.window_text().lower()
-                            # Ищем кнопку с текстом "продолжить", "continue", "next" и т.д.
-                            if any(word in button_text for word in ["продолжить", "continue", "next", "далее"]):
-                                button.click()
-                                logger.info("Кнопка 'Продолжить' нажата через pywinauto")
-                                time.sleep(1)
-                                return True
-                        except:
-                            continue
+                    # Ищем активную кнопку с текстом "продолжить", "continue", "next" и т.д. одним запросом к UIA
+                    button = self.locator.find_first(
+                        self.telegram_window, "Button", names=CONTINUE_BUTTON_NAMES, enabled=True,
+                        lookup="continue_button")
+                    if button is not None:
+                        self._strategy('pywinauto')
+                        RECORDER.event('click', target='button')
+                        button.click()
+                        logger.info("Кнопка 'Продолжить' нажата через pywinauto")
+                        self.wait(deadline.clamp(1, what='continue_pause'))
+                        return True
                     
                     # Если не нашли по тексту, пробуем найти синюю кнопку (обычно это кнопка продолжения)
                     # Или просто первую активную кнопку
-                    for button in buttons:
-                        try:
-                            if button.is_enabled():
-                                button.click()
-                                logger.info("Кнопка продолжения нажата (первая активная)")
-                                time.sleep(1)
-                                return True
-                        except:
-                            continue
+                    button = self.locator.find_first(
+                        self.telegram_window, "Button", enabled=True, lookup="first_enabled_button")
+                    if button is not None:
+                        self._strategy('pywinauto')
+                        RECORDER.event('click', target='button')
+                        button.click()
+                        logger.info("Кнопка продолжения нажата (первая активная)")
+                        self.wait(deadline.clamp(1, what='continue_pause'))
+                        return True
                 except Exception as e:
-                    logger.debug(f"Не удалось найти кнопку через pywinauto: {e}")
+                    logger.debug("Не удалось найти кнопку через pywinauto: %s", e)
             
             # Альтернативный способ через pyautogui - ищем кнопку внизу окна
             try:
-                if self.telegram_window:
+                self._strategy('pyautogui')
+                button_point = self._visual_point("continue_button")
+                if button_point:
+                    button_x, button_y = button_point
+                elif self.telegram_window:
                     try:
                         window_rect = self.telegram_window.rectangle()
                         # Кнопка обычно внизу по центру окна
@@ -404,26 +714,35 @@ class TelegramAutomation:
                     button_y = screen_height - 150
                 
                 # Кликаем в область кнопки
+                before = self._screen_hash()
                 pyautogui.click(button_x, button_y)
+                if self._await_screen(before, 1) is False:
+                    logger.warning("После нажатия 'Продолжить' через pyautogui экран не сменился")
+                    if button_point:
+                        self._forget_points("continue_button")
+                    return False
                 logger.info("Кнопка 'Продолжить' нажата через pyautogui")
-                time.sleep(1)
                 return True
             except Exception as e:
-                logger.warning(f"Не удалось нажать кнопку через pyautogui: {e}")
+                logger.warning("Не удалось нажать кнопку через pyautogui: %s", e)
                 # Пробуем просто нажать Enter (часто работает)
                 try:
                     pyautogui.press('enter')
                     logger.info("Нажат Enter для продолжения")
-                    time.sleep(1)
+                    self.wait(deadline.clamp(1, what='continue_pause'))
                     return True
                 except:
                     pass
             
             return False
         except Exception as e:
-            logger.warning(f"Ошибка при нажатии кнопки 'Продолжить': {e}")
+            logger.warning("Ошибка при нажатии кнопки 'Продолжить': %s", e)
             return False
     
+    @deadline.stepped()
+    @_exclusive
+    @_captured(settle=True)
+    @RECORDER.traced()
     def enter_code(self, code: str) -> bool:
         """
         Ввод кода подтверждения в Telegram Desktop/Portable
@@ -434,37 +753,49 @@ class TelegramAutomation:
         Returns:
             True если успешно, False в противном случае
         """
+        if self.window_unavailable():
+            return False
+        
         try:
+            pyautogui = load_pyautogui()
+            
             # Пробуем активировать окно (но продолжаем даже если не удалось)
             self.activate_window()
             
-            time.sleep(1)  # Даем время окну активироваться
+            self.wait(1)  # Даем время окну активироваться
             
             # Пробуем найти поле ввода кода через pywinauto
             try:
                 if self.telegram_window:
                     # Ищем поле ввода кода
-                    edit_controls = self.telegram_window.descendants(control_type="Edit")
-                    if edit_controls:
-                        code_field = edit_controls[0]
+                    code_field = self.locator.find_first(self.telegram_window, "Edit", lookup="code_field")
+                    if code_field is not None:
+                        self._strategy('pywinauto')
                         code_field.set_focus()
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         # Очищаем поле и вводим код
                         code_field.set_text("")
-                        time.sleep(0.2)
+                        self.wait(0.2)
+                        RECORDER.event('type_keys', field='code_field', code=code)
                         code_field.type_keys(code, with_spaces=False)
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         # Автоматически нажимаем Enter или кнопку подтверждения
                         pyautogui.press('enter')
-                        logger.info(f"Код {code} введен через pywinauto")
+                        logger.info("Код %s введен через pywinauto", code)
                         return True
             except Exception as e:
-                logger.warning(f"Не удалось ввести код через pywinauto: {e}")
+                logger.warning("Не удалось ввести код через pywinauto: %s", e)
             
             # Альтернативный способ через pyautogui
+            if not self._fallback_in_budget():
+                return False
             try:
-                # Если окно найдено, используем его координаты
-                if self.telegram_window:
+                self._strategy('pyautogui')
+                # Сначала ищем поле по шаблону, затем - центр окна
+                code_point = self._visual_point("code_field")
+                if code_point:
+                    center_x, center_y = code_point
+                elif self.telegram_window:
                     try:
                         window_rect = self.telegram_window.rectangle()
                         center_x = window_rect.left + (window_rect.width() // 2)
@@ -480,33 +811,33 @@ class TelegramAutomation:
                     center_x = screen_width // 2
                     center_y = screen_height // 2
                 
-                # Кликаем в область поля ввода кода
-                pyautogui.click(center_x, center_y)
-                time.sleep(0.5)
-                
-                # Очищаем поле
-                pyautogui.hotkey('ctrl', 'a')
-                time.sleep(0.3)
-                pyautogui.press('delete')
-                time.sleep(0.3)
+                # Хэш до ввода: Telegram может сам перейти дальше, как только введена последняя цифра
+                before = self._screen_hash()
                 
-                # Вводим код
-                pyautogui.write(code, interval=0.05)  # Быстрее
-                time.sleep(0.3)
-                
-                # Автоматически нажимаем Enter для подтверждения
-                pyautogui.press('enter')
-                logger.info(f"Код {code} введен через pyautogui")
+                # Кликаем в область поля ввода кода (ждем фокус), очищаем поле, вводим код и
+                # подтверждаем Enter - двумя отправками (input_batch.py)
+                self._send_input(InputSequence().click(center_x, center_y).wait(0.5)
+                                 .hotkey('ctrl', 'a').press('delete').write(code).press('enter'))
+                if self._await_screen(before, 0) is False:
+                    logger.warning("После ввода кода через pyautogui экран не сменился")
+                    if code_point:
+                        self._forget_points("code_field")
+                    return False
+                logger.info("Код %s введен через pyautogui", code)
                 return True
                 
             except Exception as e:
-                logger.error(f"Ошибка при вводе кода через pyautogui: {e}")
+                logger.error("Ошибка при вводе кода через pyautogui: %s", e)
                 return False
                 
         except Exception as e:
-            logger.error(f"Ошибка при вводе кода: {e}")
+            logger.error("Ошибка при вводе кода: %s", e)
             return False
     
+    @deadline.stepped()
+    @_exclusive
+    @_captured(settle=False)
+    @RECORDER.traced()
     def check_cloud_password_needed(self) -> bool:
         """
         Проверяет, требуется ли ввод облачного пароля
@@ -514,10 +845,13 @@ class TelegramAutomation:
         Returns:
             True если требуется пароль, False в противном случае
         """
+        if self.window_unavailable():
+            return False
+        
         try:
             # Пробуем активировать окно
             self.activate_window()
-            time.sleep(0.5)
+            self.wait(0.5)
             
             # Ищем текст "облачный пароль", "cloud password" или поле ввода пароля
             if self.telegram_window:
@@ -530,26 +864,26 @@ class TelegramAutomation:
                         logger.info("Обнаружен запрос облачного пароля")
                         return True
                     
-                    # Ищем поле ввода пароля (обычно это PasswordEdit или Edit с типом password)
-                    edit_controls = self.telegram_window.descendants(control_type="Edit")
-                    if edit_controls:
-                        # Проверяем, есть ли поле пароля (обычно оно пустое и активно)
-                        for edit in edit_controls:
-                            try:
-                                if edit.is_visible() and edit.is_enabled():
-                                    # Если поле активно и видимо, возможно это запрос пароля
-                                    logger.info("Обнаружено поле ввода (возможно пароль)")
-                                    return True
-                            except:
-                                continue
+                    # Ищем поле ввода пароля (обычно это PasswordEdit или Edit с типом password):
+                    # видимое и активное поле, проверки выполняет UIA
+                    edit = self.locator.find_first(
+                        self.telegram_window, "Edit", enabled=True, visible=True, lookup="password_field")
+                    if edit is not None:
+                        # Если поле активно и видимо, возможно это запрос пароля
+                        logger.info("Обнаружено поле ввода (возможно пароль)")
+                        return True
                 except Exception as e:
-                    logger.debug(f"Ошибка при проверке пароля: {e}")
+                    logger.debug("Ошибка при проверке пароля: %s", e)
             
             return False
         except Exception as e:
-            logger.warning(f"Ошибка при проверке необходимости пароля: {e}")
+            logger.warning("Ошибка при проверке необходимости пароля: %s", e)
             return False
     
+    @deadline.stepped()
+    @_exclusive
+    @_captured(settle=True)
+    @RECORDER.traced()
     def enter_cloud_password(self, password: str) -> bool:
         """
         Ввод облачного пароля в Telegram Desktop/Portable
@@ -560,37 +894,49 @@ class TelegramAutomation:
         Returns:
             True если успешно, False в противном случае
         """
+        if self.window_unavailable():
+            return False
+        
         try:
+            pyautogui = load_pyautogui()
+            
             # Пробуем активировать окно
             self.activate_window()
             
-            time.sleep(1)  # Даем время окну активироваться
+            self.wait(1)  # Даем время окну активироваться
             
             # Пробуем найти поле ввода пароля через pywinauto
             try:
                 if self.telegram_window:
                     # Ищем поле ввода пароля
-                    edit_controls = self.telegram_window.descendants(control_type="Edit")
-                    if edit_controls:
-                        password_field = edit_controls[0]
+                    password_field = self.locator.find_first(self.telegram_window, "Edit", lookup="password_input")
+                    if password_field is not None:
+                        self._strategy('pywinauto')
                         password_field.set_focus()
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         # Очищаем поле и вводим пароль
                         password_field.set_text("")
-                        time.sleep(0.2)
+                        self.wait(0.2)
+                        RECORDER.event('type_keys', field='password_field', password=password)
                         password_field.type_keys(password, with_spaces=False)
-                        time.sleep(0.3)
+                        self.wait(0.3)
                         # Нажимаем Enter для подтверждения
                         pyautogui.press('enter')
                         logger.info("Облачный пароль введен через pywinauto")
                         return True
             except Exception as e:
-                logger.warning(f"Не удалось ввести пароль через pywinauto: {e}")
+                logger.warning("Не удалось ввести пароль через pywinauto: %s", e)
             
             # Альтернативный способ через pyautogui
+            if not self._fallback_in_budget():
+                return False
             try:
-                # Если окно найдено, используем его координаты
-                if self.telegram_window:
+                self._strategy('pyautogui')
+                # Сначала ищем поле по шаблону, затем - центр окна
+                password_point = self._visual_point("password_field")
+                if password_point:
+                    center_x, center_y = password_point
+                elif self.telegram_window:
                     try:
                         window_rect = self.telegram_window.rectangle()
                         center_x = window_rect.left + (window_rect.width() // 2)
@@ -604,30 +950,18 @@ class TelegramAutomation:
                     center_x = screen_width // 2
                     center_y = screen_height // 2
                 
-                # Кликаем в область поля ввода пароля
-                pyautogui.click(center_x, center_y)
-                time.sleep(0.5)
-                
-                # Очищаем поле
-                pyautogui.hotkey('ctrl', 'a')
-                time.sleep(0.3)
-                pyautogui.press('delete')
-                time.sleep(0.3)
-                
-                # Вводим пароль
-                pyautogui.write(password, interval=0.05)
-                time.sleep(0.3)
-                
-                # Нажимаем Enter для подтверждения
-                pyautogui.press('enter')
+                # Кликаем в область поля ввода пароля (ждем фокус), очищаем поле, вводим пароль и
+                # подтверждаем Enter - двумя отправками (input_batch.py; текст не попадает в самописец)
+                self._send_input(InputSequence().click(center_x, center_y).wait(0.5)
+                                 .hotkey('ctrl', 'a').press('delete').write(password).press('enter'))
                 logger.info("Облачный пароль введен через pyautogui")
                 return True
                 
             except Exception as e:
-                logger.error(f"Ошибка при вводе пароля через pyautogui: {e}")
+                logger.error("Ошибка при вводе пароля через pyautogui: %s", e)
                 return False
                 
         except Exception as e:
-            logger.error(f"Ошибка при вводе облачного пароля: {e}")
+            logger.error("Ошибка при вводе облачного пароля: %s", e)
             return False
 
@@ -0,0 +1,245 @@
+"""
+Поиск элементов окна Telegram через условия UI Automation.
+
+Вместо того чтобы получить все Button/Edit окна и проверять window_text(), is_enabled()
+и is_visible() каждого элемента в Python (по межпроцессному вызову на проверку),
+условие "тип И имя И доступность" собирается в IUIAutomationCondition и выполняется
+одним FindFirst/FindAll внутри UIA. Через границу процесса передаются только
+подходящие элементы.
+
+Если поставщик UIA не умеет искать подстроку имени (Windows до 10 1809) - отказ при создании
+условия или уже в FindFirst/FindAll, - имя проверяется на стороне клиента по найденным
+элементам нужного типа, и этот выбор запоминается для следующих поисков.
+
+Для backend="win32" (или если UIA недоступен) используется прежний перебор в Python.
+Каждый поиск замеряется: UiLocator.stats() и метрика ui_lookup_seconds.
+"""
+import logging
+import time
+from typing import Dict, List, Optional, Sequence
+
+from metrics import REGISTRY
+from flight_recorder import RECORDER
+
+logger = logging.getLogger(__name__)
+
+# Флаги CreatePropertyConditionEx
+PROPERTY_CONDITION_IGNORE_CASE = 1
+PROPERTY_CONDITION_MATCH_SUBSTRING = 2  # Windows 10 1809+
+
+# Области поиска UIA
+TREE_SCOPE_CHILDREN = 2
+TREE_SCOPE_DESCENDANTS = 4
+
+# Все обращения к дереву окна (подключение, проверка окна, поиски) - для сравнения нагрузки на UI
+UI_CALLS = REGISTRY.counter('ui_calls_total', 'Обращения к окну Telegram через UI Automation / win32')
+
+LOOKUP_SECONDS = REGISTRY.histogram(
+    'ui_lookup_seconds', 'Время поиска элемента окна Telegram',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+_uia = None
+
+
+def _load_uia():
+    """IUIAutomation и константы pywinauto (импорт при первом поиске)"""
+    global _uia
+    if _uia is None:
+        from pywinauto.uia_defines import IUIA
+        from pywinauto.uia_element_info import UIAElementInfo
+        from pywinauto.controls.uiawrapper import UIAWrapper
+        _uia = (IUIA(), UIAElementInfo, UIAWrapper)
+    return _uia
+
+
+class UiLocator:
+    """Поиск элементов по типу, имени и состоянию с замером времени каждого поиска"""
+
+    def __init__(self):
+        self.timings: Dict[str, dict] = {}
+        self._substring_supported = True  # False - имя проверяем сами (см. _find_native)
+
+    # --- Публичный интерфейс ---
+
+    def find_first(self, window, control_type: str, names: Optional[Sequence[str]] = None,
+                   enabled: Optional[bool] = None, visible: Optional[bool] = None,
+                   depth: Optional[int] = None, lookup: Optional[str] = None):
+        """
+        Первый элемент, подходящий под все условия, или None
+
+        Args:
+            window: Обертка pywinauto, в поддереве которой ищем
+            control_type: Тип элемента UIA ("Button", "Edit", ...)
+            names: Подстроки имени без учета регистра (любая из них)
+            enabled: Требуемое значение IsEnabled
+            visible: True - только элементы на экране (IsOffscreen = False)
+            depth: Ограничение глубины поиска (None - все потомки, 1 - только дочерние)
+            lookup: Имя поиска для статистики (по умолчанию control_type)
+        """
+        found = self._find(window, control_type, names, enabled, visible, depth, lookup, first=True)
+        return found[0] if found else None
+
+    def find_all(self, window, control_type: str, names: Optional[Sequence[str]] = None,
+                 enabled: Optional[bool] = None, visible: Optional[bool] = None,
+                 depth: Optional[int] = None, lookup: Optional[str] = None) -> list:
+        """Все подходящие элементы (параметры как у find_first)"""
+        return self._find(window, control_type, names, enabled, visible, depth, lookup, first=False)
+
+    def stats(self) -> Dict[str, dict]:
+        """Статистика по поискам: количество, попадания, среднее/последнее/максимальное время (мс)"""
+        result = {}
+        for name, timing in self.timings.items():
+            result[name] = {
+                'count': timing['count'],
+                'hits': timing['hits'],
+                'native': timing['native'],
+                'avg_ms': round(timing['total'] / timing['count'] * 1000, 2),
+                'last_ms': round(timing['last'] * 1000, 2),
+                'max_ms': round(timing['max'] * 1000, 2),
+            }
+        return result
+
+    # --- Реализация ---
+
+    def _find(self, window, control_type, names, enabled, visible, depth, lookup, first) -> list:
+        lookup = lookup or control_type
+        started = time.perf_counter()
+        native = hasattr(getattr(window, 'element_info', None), 'element')
+        found = []
+        try:
+            if native:
+                try:
+                    found = self._find_native(window, control_type, names, enabled, visible, depth, first)
+                except Exception as e:
+                    logger.debug("Поиск %s через условия UIA не удался, перебираем в Python: %s", lookup, e)
+                    native = False
+            if not native:
+                found = self._find_python(window, control_type, names, enabled, visible, depth, first)
+        finally:
+            self._record(lookup, time.perf_counter() - started, bool(found), native)
+        return found
+
+    def _record(self, lookup: str, elapsed: float, hit: bool, native: bool):
+        timing = self.timings.get(lookup)
+        if timing is None:
+            timing = self.timings[lookup] = {'count': 0, 'hits': 0, 'total': 0.0, 'last': 0.0, 'max': 0.0, 'native': native}
+        timing['count'] += 1
+        timing['hits'] += 1 if hit else 0
+        timing['total'] += elapsed
+        timing['last'] = elapsed
+        timing['max'] = max(timing['max'], elapsed)
+        timing['native'] = native
+        LOOKUP_SECONDS.observe(elapsed, lookup=lookup, native='yes' if native else 'no')
+        UI_CALLS.inc(kind='lookup')
+        RECORDER.event('ui_lookup', lookup=lookup, ms=round(elapsed * 1000, 1), hit=hit, native=native)
+        logger.debug("Поиск %s: %.1f мс (%s)", lookup, elapsed * 1000, 'uia' if native else 'python')
+
+    def _condition(self, control_type, names, enabled, visible):
+        """Собирает условие UIA: тип И (имя1 ИЛИ имя2 ...) И доступность И видимость"""
+        iuia, _, _ = _load_uia()
+        automation = iuia.iuia
+        dll = iuia.UIA_dll
+        conditions = [automation.CreatePropertyCondition(
+            dll.UIA_ControlTypePropertyId, iuia.known_control_types[control_type])]
+        if names:
+            name_conditions = [self._name_condition(automation, dll, name) for name in names]
+            combined = name_conditions[0]
+            for condition in name_conditions[1:]:
+                combined = automation.CreateOrCondition(combined, condition)
+            conditions.append(combined)
+        if enabled is not None:
+            conditions.append(automation.CreatePropertyCondition(dll.UIA_IsEnabledPropertyId, bool(enabled)))
+        if visible:
+            conditions.append(automation.CreatePropertyCondition(dll.UIA_IsOffscreenPropertyId, False))
+        result = conditions[0]
+        for condition in conditions[1:]:
+            result = automation.CreateAndCondition(result, condition)
+        return result
+
+    @staticmethod
+    def _name_condition(automation, dll, name):
+        return automation.CreatePropertyConditionEx(
+            dll.UIA_NamePropertyId, name, PROPERTY_CONDITION_IGNORE_CASE | PROPERTY_CONDITION_MATCH_SUBSTRING)
+
+    def _find_native(self, window, control_type, names, enabled, visible, depth, first) -> list:
+        if names and self._substring_supported:
+            try:
+                return self._find_uia(window, control_type, names, enabled, visible, depth, first)
+            except Exception as e:
+                # Старые версии Windows не ищут подстроку: отказ бывает и при создании условия,
+                # и только в FindFirst/FindAll - дальше имя проверяем на стороне клиента
+                logger.info("Поиск подстроки имени через UIA не поддерживается (%s), имя проверяется по элементам", e)
+                self._substring_supported = False
+        return self._find_uia(window, control_type, names, enabled, visible, depth, first)
+
+    def _find_uia(self, window, control_type, names, enabled, visible, depth, first) -> list:
+        iuia, element_info_cls, wrapper_cls = _load_uia()
+        match = None
+        if names and not self._substring_supported:
+            lowered = [name.lower() for name in names]
+
+            def match(element) -> bool:
+                return any(name in (element.CurrentName or '').lower() for name in lowered)
+            names = None
+        condition = self._condition(control_type, names, enabled, visible)
+        root = window.element_info.element
+
+        if depth is None:
+            elements = self._search(root, TREE_SCOPE_DESCENDANTS, condition, first, match)
+        else:
+            # Ограниченная глубина: ищем среди дочерних, спускаясь по уровням
+            elements = []
+            frontier = [root]
+            for level in range(depth):
+                next_frontier = []
+                for node in frontier:
+                    elements.extend(self._search(node, TREE_SCOPE_CHILDREN, condition, first, match))
+                    if first and elements:
+                        break
+                    if level + 1 < depth:
+                        next_frontier.extend(self._search(node, TREE_SCOPE_CHILDREN, iuia.true_condition, False))
+                if first and elements:
+                    break
+                frontier = next_frontier
+        return [wrapper_cls(element_info_cls(element)) for element in elements]
+
+    @staticmethod
+    def _search(node, scope, condition, first, match=None) -> list:
+        """FindFirst/FindAll; match - проверка имени на стороне клиента (тогда всегда FindAll)"""
+        if first and match is None:
+            element = node.FindFirst(scope, condition)
+            return [element] if element else []
+        array = node.FindAll(scope, condition)
+        elements = []
+        for i in range(array.Length):
+            element = array.GetElement(i)
+            if match is None or match(element):
+                elements.append(element)
+                if first:
+                    break
+        return elements
+
+    @staticmethod
+    def _find_python(window, control_type, names, enabled, visible, depth, first) -> List:
+        """Прежний способ: получить элементы и проверить каждый"""
+        candidates = window.descendants(control_type=control_type, depth=depth)
+        # backend win32 не фильтрует по control_type - сверяем класс сами
+        check_type = not hasattr(getattr(window, 'element_info', None), 'element')
+        lowered = [name.lower() for name in names] if names else None
+        found = []
+        for control in candidates:
+            try:
+                if check_type and control.friendly_class_name() != control_type:
+                    continue
+                if lowered and not any(name in control.window_text().lower() for name in lowered):
+                    continue
+                if enabled is not None and control.is_enabled() != enabled:
+                    continue
+                if visible and not control.is_visible():
+                    continue
+            except Exception:
+                continue
+            found.append(control)
+            if first:
+                break
+        return found
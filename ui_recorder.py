@@ -0,0 +1,172 @@
+"""
+Запись деревьев UI окна Telegram и переходов между экранами входа.
+
+Самодельное окно simulated_backend со временем расходится с тем, что на самом деле
+отдает Telegram Desktop: типы элементов (Edit или ComboBox), подписи кнопок, которые ищет
+_click_continue_button, и задержки между экранами. С UI_RECORD_DIR автоматизация пишет
+в файл JSON-lines компактные снимки дерева до и после каждого действия входа:
+
+  {"type": "screen", "id": "s1a2b3c4", "title": "Telegram", "rect": [l, t, w, h],
+   "controls": [["Edit", "", true], ["Button", "Next", true], ...]}
+  {"type": "action", "name": "enter_phone_number", "at": 12.3, "duration": 4.1,
+   "input": true, "before": "s1a2b3c4", "after": "s5d6e7f8", "delay": 0.8, "result": true}
+
+Экран записывается один раз (id - хэш содержимого; у экранов с одинаковым деревом,
+например кода и пароля, id совпадает). Действие ссылается на экраны до и после, input
+отличает ввод с Enter от проверок, delay - сколько после окончания действия окно шло
+к новому экрану (опрос раз в 0.1 с, не дольше UI_RECORD_SETTLE). Введенные значения не
+пишутся: текст полей ввода не сохраняется, цифры в заголовке (номер телефона) маскируются.
+
+Файлы воспроизводит simulated_backend.ReplayWindow (benchmarks/replay_login.py).
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+# Каталог записей; пусто - запись выключена
+UI_RECORD_DIR = os.getenv('UI_RECORD_DIR', '')
+# Сколько секунд ждать смены экрана после действия
+UI_RECORD_SETTLE = float(os.getenv('UI_RECORD_SETTLE', '5'))
+
+# Типы элементов, чей текст - введенное значение
+VALUE_CONTROLS = frozenset({'Edit', 'Document'})
+POLL_INTERVAL = 0.1
+
+
+def control_type(control) -> str:
+    """Тип элемента: UIA control_type или класс win32"""
+    info = getattr(control, 'element_info', None)
+    if info is not None and getattr(info, 'control_type', None):
+        return info.control_type
+    return control.friendly_class_name()
+
+
+def redact(text: str) -> str:
+    """Маскирует цифры в тексте, похожем на номер телефона или код"""
+    return re.sub(r'\d', '•', text) if re.search(r'\d{4,}', text) else text
+
+
+def capture(window) -> dict:
+    """Компактный снимок окна: заголовок, положение и плоский список элементов"""
+    controls = []
+    for control in window.descendants():
+        kind = control_type(control)
+        name = '' if kind in VALUE_CONTROLS else redact(control.window_text())
+        controls.append([kind, name, bool(control.is_enabled())])
+    rect = window.rectangle()
+    return {
+        'title': redact(window.window_text()),
+        'rect': [rect.left, rect.top, rect.width(), rect.height()],
+        'controls': controls,
+    }
+
+
+def screen_id(tree: dict) -> str:
+    payload = json.dumps([tree['title'], tree['controls']], ensure_ascii=False, sort_keys=True)
+    return 's' + hashlib.sha1(payload.encode('utf-8')).hexdigest()[:8]
+
+
+class UiTreeRecorder:
+    """Пишет снимки экранов и действия входа в один файл JSON-lines"""
+
+    def __init__(self, path: str, settle: float = UI_RECORD_SETTLE, clock=None):
+        self.path = path
+        self.settle = settle
+        self.clock = clock or SYSTEM_CLOCK
+        self._started = self.clock.monotonic()
+        self._screens = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, clock=None) -> Optional['UiTreeRecorder']:
+        """Рекордер в UI_RECORD_DIR или None, если запись выключена"""
+        if not UI_RECORD_DIR:
+            return None
+        os.makedirs(UI_RECORD_DIR, exist_ok=True)
+        name = f"ui-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+        logger.info("Запись деревьев UI в %s", os.path.join(UI_RECORD_DIR, name))
+        return cls(os.path.join(UI_RECORD_DIR, name), clock=clock)
+
+    def _write(self, payload: dict):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+
+    def screen(self, window) -> Optional[str]:
+        """Снимает окно и возвращает id экрана (None - окна нет или снять не удалось)"""
+        if window is None:
+            return None
+        try:
+            tree = capture(window)
+        except Exception as e:
+            logger.debug("Не удалось снять дерево окна: %s", e)
+            return None
+        sid = screen_id(tree)
+        if sid not in self._screens:
+            self._screens.add(sid)
+            self._write(dict(type='screen', id=sid, **tree))
+        return sid
+
+    def action(self, name: str, window, before: Optional[str], started: float, result, settle: bool):
+        """
+        Записывает действие
+
+        Args:
+            name: Метод автоматизации
+            window: Окно после действия
+            before: id экрана до действия
+            started: Начало действия (по часам рекордера)
+            result: Что вернул метод
+            settle: Ждать ли смены экрана (действия ввода) или только снять текущий (проверки)
+        """
+        finished = self.clock.monotonic()
+        after = self.screen(window)
+        delay = None
+        if settle:
+            while after == before and after is not None and self.clock.monotonic() - finished < self.settle:
+                self.clock.sleep(POLL_INTERVAL)
+                after = self.screen(window)
+            delay = round(self.clock.monotonic() - finished, 3) if after != before else None
+        self._write({
+            'type': 'action', 'name': name, 'at': round(started - self._started, 3),
+            'duration': round(finished - started, 3), 'input': settle, 'before': before, 'after': after,
+            'delay': delay, 'result': result,
+        })
+
+
+class Recording:
+    """Прочитанная запись: экраны по id и действия по порядку"""
+
+    def __init__(self, screens: Dict[str, dict], actions: List[dict]):
+        self.screens = screens
+        self.actions = actions
+
+    @classmethod
+    def load(cls, path: str) -> 'Recording':
+        screens, actions = {}, []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get('type') == 'screen':
+                    screens[entry['id']] = entry
+                elif entry.get('type') == 'action':
+                    actions.append(entry)
+        return cls(screens, actions)
+
+    @property
+    def start(self) -> Optional[str]:
+        """Первый снятый экран"""
+        for action in self.actions:
+            if action.get('before'):
+                return action['before']
+        return next(iter(self.screens), None)
@@ -0,0 +1,401 @@
+"""
+Поиск элементов экрана входа по шаблонам на снимке окна (резервный путь pyautogui).
+
+Когда UIA не находит поля, раньше клик шел по долям прямоугольника окна
+(width // 4, height // 3 + 30, height - 100) или по центру экрана. Здесь
+элемент ищется сравнением с шаблоном: сначала грубо на уменьшенном снимке,
+затем точно в окрестности лучших кандидатов на полном разрешении. Сравниваются
+карты границ, а не яркость, чтобы пустое поле не совпадало с белым фоном. Только Pillow.
+
+Найденная точка (относительно окна) кэшируется в JSON по ключу
+"размер окна, DPI, версия Telegram" - сравнение выполняется один раз, следующие
+запуски кликают в сохраненную точку. Шаблоны - PNG в VISUAL_TEMPLATES_DIR
+с именами целей (phone_field.png, country_field.png, code_field.png,
+password_field.png, continue_button.png), снятые при 96 DPI. Нет шаблона или совпадения - None,
+и вызывающий код использует прежние доли окна (об отсутствующих шаблонах - одно предупреждение
+в лог при запуске).
+
+Шаблоны зависят от темы и версии Telegram, поэтому снимаются на месте с открытого окна:
+элементы находит UIA, их прямоугольники вырезаются из снимка окна и приводятся к 96 DPI.
+На экране номера:
+
+    python visual_locator.py capture country_field phone_field continue_button
+
+затем на экране кода - capture code_field, на экране облачного пароля - capture password_field.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+VISUAL_TEMPLATES_DIR = os.getenv('VISUAL_TEMPLATES_DIR', 'visual_templates')
+VISUAL_CACHE_FILE = os.getenv('VISUAL_CACHE_FILE', 'visual_cache.json')
+# Минимальное сходство контуров (1.0 - полное совпадение, 0 - ничего общего)
+VISUAL_MATCH_THRESHOLD = float(os.getenv('VISUAL_MATCH_THRESHOLD', '0.8'))
+# Во сколько раз уменьшается снимок для грубого поиска
+VISUAL_DOWNSCALE = int(os.getenv('VISUAL_DOWNSCALE', '8'))
+
+BASE_DPI = 96
+
+# Цели резервного пути: тип элемента UIA и его номер среди таких элементов на экране
+# (None - кнопка продолжения, ищется по подписи)
+TARGETS = {
+    'country_field': ('Edit', 0),  # Экран номера
+    'phone_field': ('Edit', 1),  # Экран номера
+    'code_field': ('Edit', 0),  # Экран кода
+    'password_field': ('Edit', 0),  # Экран облачного пароля
+    'continue_button': ('Button', None),
+}
+
+_missing_reported = False
+
+LOCATE_SECONDS = REGISTRY.histogram(
+    'visual_locate_seconds', 'Время поиска элемента по шаблону',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+def _edges(image, blur: float = 0):
+    """
+    Карта границ: сравниваем контуры, а не заливку - белый шаблон поля не совпадет с пустым фоном.
+    Фильтр не обрабатывает крайние пиксели (оставляет исходную яркость), поэтому рамка в 1 пиксель обрезается.
+    """
+    from PIL import ImageFilter
+    edges = image.convert('L').filter(ImageFilter.FIND_EDGES)
+    edges = edges.crop((1, 1, edges.size[0] - 1, edges.size[1] - 1))
+    if blur:
+        # Размытие перед уменьшением: тонкие линии не пропадают при несовпадении сетки
+        edges = edges.filter(ImageFilter.GaussianBlur(blur))
+    return edges
+
+
+def _score(scene, template, template_mean: float, x: int, y: int) -> float:
+    """Сходство шаблона с областью снимка в точке (x, y): 1 - |разница| / (яркость шаблона + области)"""
+    from PIL import ImageChops, ImageStat
+    width, height = template.size
+    region = scene.crop((x, y, x + width, y + height))
+    diff = ImageStat.Stat(ImageChops.difference(region, template)).mean[0]
+    total = template_mean + ImageStat.Stat(region).mean[0]
+    return 1.0 - diff / total if total else 0.0
+
+
+def _ranked(scene, template, xs, ys, keep: int) -> List[Tuple[int, int, float]]:
+    """Лучшие позиции шаблона в заданных диапазонах; соседние позиции одного пика не повторяются"""
+    from PIL import ImageStat
+    template_mean = ImageStat.Stat(template).mean[0]
+    scores = [(x, y, _score(scene, template, template_mean, x, y)) for y in ys for x in xs]
+    if keep == 1:
+        return [max(scores, key=lambda item: item[2])]
+    spread_x, spread_y = max(1, template.size[0] // 2), max(1, template.size[1] // 2)
+    result = []
+    for x, y, score in sorted(scores, key=lambda item: item[2], reverse=True):
+        if all(abs(x - kx) > spread_x or abs(y - ky) > spread_y for kx, ky, _ in result):
+            result.append((x, y, score))
+            if len(result) == keep:
+                break
+    return result
+
+
+def match_template(scene, template, downscale: int = VISUAL_DOWNSCALE,
+                   candidates: int = 3) -> Optional[Tuple[int, int, float]]:
+    """
+    Ищет шаблон на снимке: грубо на уменьшенных копиях, затем точно рядом с лучшими кандидатами
+
+    Returns:
+        (x, y, сходство) левого верхнего угла или None, если шаблон больше снимка
+    """
+    from PIL import Image
+    scene_w, scene_h = scene.size
+    tpl_w, tpl_h = template.size
+    if tpl_w > scene_w or tpl_h > scene_h:
+        return None
+
+    # Координаты на картах границ сдвинуты на 1 пиксель (обрезанная рамка)
+    full_scene = _edges(scene)
+    full_tpl = _edges(template)
+    scene_w, scene_h = full_scene.size
+    tpl_w, tpl_h = full_tpl.size
+    # После уменьшения у шаблона должно остаться хотя бы 4 пикселя по каждой стороне
+    factor = max(1, min(downscale, tpl_w // 4, tpl_h // 4))
+    if factor == 1:
+        best = _ranked(full_scene, full_tpl, range(scene_w - tpl_w + 1), range(scene_h - tpl_h + 1), 1)[0]
+    else:
+        small_scene = _edges(scene, blur=factor / 2)
+        small_scene = small_scene.resize((scene_w // factor, scene_h // factor), Image.BOX)
+        small_tpl = _edges(template, blur=factor / 2)
+        small_tpl = small_tpl.resize((tpl_w // factor, tpl_h // factor), Image.BOX)
+        coarse = _ranked(small_scene, small_tpl,
+                         range(small_scene.size[0] - small_tpl.size[0] + 1),
+                         range(small_scene.size[1] - small_tpl.size[1] + 1), candidates)
+        best = None
+        for x, y, _ in coarse:
+            x, y = x * factor, y * factor
+            xs = range(max(0, x - factor), min(scene_w - tpl_w, x + factor) + 1)
+            ys = range(max(0, y - factor), min(scene_h - tpl_h, y + factor) + 1)
+            found = _ranked(full_scene, full_tpl, xs, ys, 1)[0]
+            if best is None or found[2] > best[2]:
+                best = found
+    return best[0], best[1], best[2]
+
+
+def window_dpi(window) -> int:
+    """DPI монитора окна (96, если узнать не удалось)"""
+    try:
+        import ctypes
+        dpi = ctypes.windll.user32.GetDpiForWindow(window.handle)
+        return int(dpi) or BASE_DPI
+    except Exception:
+        return BASE_DPI
+
+
+def telegram_version(window) -> str:
+    """Версия Telegram из ресурсов exe; если недоступна - размер и дата изменения файла"""
+    try:
+        import psutil
+        path = psutil.Process(window.process_id()).exe()
+    except Exception:
+        return 'unknown'
+    try:
+        import win32api
+        info = win32api.GetFileVersionInfo(path, '\\')
+        ms, ls = info['FileVersionMS'], info['FileVersionLS']
+        return f'{ms >> 16}.{ms & 0xFFFF}.{ls >> 16}.{ls & 0xFFFF}'
+    except Exception:
+        try:
+            stat = os.stat(path)
+            return f'{stat.st_size}-{int(stat.st_mtime)}'
+        except OSError:
+            return 'unknown'
+
+
+class VisualLocator:
+    """Поиск элементов по шаблонам с кэшем точек по размеру окна, DPI и версии Telegram"""
+
+    def __init__(self, templates_dir: str = VISUAL_TEMPLATES_DIR, cache_file: Optional[str] = VISUAL_CACHE_FILE,
+                 threshold: float = VISUAL_MATCH_THRESHOLD):
+        self.templates_dir = templates_dir
+        self.cache_file = cache_file
+        self.threshold = threshold
+        self._cache: Optional[Dict[str, Dict[str, list]]] = None
+        self._templates = {}
+        self._versions = {}  # pid -> версия Telegram
+        self._lock = threading.Lock()
+        self._report_missing()
+
+    def missing_templates(self) -> List[str]:
+        """Цели, для которых нет шаблона"""
+        return [target for target in TARGETS if not os.path.exists(os.path.join(self.templates_dir, f'{target}.png'))]
+
+    def _report_missing(self):
+        """Одно предупреждение на процесс: без шаблонов резервный путь кликает по долям окна"""
+        global _missing_reported
+        if _missing_reported:
+            return
+        _missing_reported = True
+        missing = self.missing_templates()
+        if missing:
+            logger.warning("Нет шаблонов %s в %s: резервный путь pyautogui кликает по долям окна. "
+                           "Снять с открытого окна Telegram: python visual_locator.py capture <цель>",
+                           ', '.join(missing), os.path.abspath(self.templates_dir))
+
+    # --- Кэш ---
+
+    def _load_cache(self) -> Dict[str, Dict[str, list]]:
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_file and os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        self._cache = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning("Не удалось прочитать кэш координат %s: %s", self.cache_file, e)
+        return self._cache
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        temp_path = self.cache_file + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.cache_file)
+        except OSError as e:
+            logger.warning("Не удалось сохранить кэш координат %s: %s", self.cache_file, e)
+
+    def cache_key(self, window) -> str:
+        rect = window.rectangle()
+        pid = window.process_id()
+        version = self._versions.get(pid)
+        if version is None:
+            version = self._versions[pid] = telegram_version(window)
+        return f'{rect.width()}x{rect.height()}@{window_dpi(window)}dpi/{version}'
+
+    def forget(self, window=None, target: Optional[str] = None):
+        """Удаляет сохраненные точки (например, если клик по ним не сработал)"""
+        with self._lock:
+            cache = self._load_cache()
+            if window is None:
+                cache.clear()
+            else:
+                key = self.cache_key(window)
+                if target is None:
+                    cache.pop(key, None)
+                else:
+                    cache.get(key, {}).pop(target, None)
+            self._save_cache()
+
+    # --- Поиск ---
+
+    def _template(self, target: str, dpi: int):
+        key = (target, dpi)
+        if key not in self._templates:
+            path = os.path.join(self.templates_dir, f'{target}.png')
+            template = None
+            if os.path.exists(path):
+                from PIL import Image
+                template = Image.open(path).convert('RGB')
+                if dpi != BASE_DPI:
+                    scale = dpi / BASE_DPI
+                    template = template.resize(
+                        (max(1, round(template.size[0] * scale)), max(1, round(template.size[1] * scale))),
+                        Image.BILINEAR)
+            self._templates[key] = template
+        return self._templates[key]
+
+    def locate(self, target: str, window, capture=None) -> Optional[Tuple[int, int]]:
+        """
+        Экранные координаты центра элемента или None
+
+        Args:
+            target: Имя цели (имя файла шаблона без .png)
+            window: Обертка pywinauto окна Telegram
+            capture: Функция (left, top, right, bottom) -> PIL.Image; по умолчанию ImageGrab.grab
+        """
+        started = time.perf_counter()
+        rect = window.rectangle()
+        with self._lock:
+            key = self.cache_key(window)
+            cached = self._load_cache().get(key, {}).get(target)
+        if cached is not None:
+            LOCATE_SECONDS.observe(time.perf_counter() - started, target=target, cached='yes')
+            return rect.left + cached[0], rect.top + cached[1]
+
+        template = self._template(target, window_dpi(window))
+        if template is None:
+            return None
+        if capture is None:
+            from PIL import ImageGrab
+            scene = ImageGrab.grab(bbox=(rect.left, rect.top, rect.right, rect.bottom))
+        else:
+            scene = capture(rect.left, rect.top, rect.right, rect.bottom)
+        found = match_template(scene, template)
+        elapsed = time.perf_counter() - started
+        LOCATE_SECONDS.observe(elapsed, target=target, cached='no')
+        if found is None or found[2] < self.threshold:
+            logger.debug("Шаблон %s не найден (сходство %s)", target, found and round(found[2], 3))
+            return None
+
+        x = found[0] + template.size[0] // 2
+        y = found[1] + template.size[1] // 2
+        logger.info("Элемент %s найден по шаблону за %.0f мс (сходство %.3f)", target, elapsed * 1000, found[2])
+        with self._lock:
+            self._load_cache().setdefault(key, {})[target] = [x, y, round(found[2], 4)]
+            self._save_cache()
+        return rect.left + x, rect.top + y
+
+
+# --- Снятие шаблонов ---
+
+def capture_template(window, element, target: str, templates_dir: str = VISUAL_TEMPLATES_DIR,
+                     capture=None) -> str:
+    """
+    Сохраняет снимок элемента окна как шаблон цели (приведенный к 96 DPI)
+
+    Args:
+        window: Обертка pywinauto окна Telegram (для DPI)
+        element: Элемент UIA, прямоугольник которого снимается
+        capture: Функция (left, top, right, bottom) -> PIL.Image; по умолчанию ImageGrab.grab
+
+    Returns:
+        Путь к файлу шаблона
+    """
+    rect = element.rectangle()
+    bbox = (rect.left, rect.top, rect.right, rect.bottom)
+    if capture is None:
+        from PIL import ImageGrab
+        image = ImageGrab.grab(bbox=bbox)
+    else:
+        image = capture(*bbox)
+    dpi = window_dpi(window)
+    if dpi != BASE_DPI:
+        from PIL import Image
+        scale = BASE_DPI / dpi
+        image = image.resize((max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale))),
+                             Image.BILINEAR)
+    os.makedirs(templates_dir, exist_ok=True)
+    path = os.path.join(templates_dir, f'{target}.png')
+    image.convert('RGB').save(path)
+    return path
+
+
+def find_target_element(automation, target: str):
+    """Элемент UIA цели в окне автоматизации (TelegramAutomation) или None"""
+    from telegram_automation import CONTINUE_BUTTON_NAMES
+    window = automation.telegram_window
+    control_type, index = TARGETS[target]
+    if index is None:
+        return automation.locator.find_first(window, control_type, names=CONTINUE_BUTTON_NAMES, enabled=True,
+                                             lookup=target)
+    elements = window.descendants(control_type=control_type)
+    return elements[index] if len(elements) > index else None
+
+
+def capture_templates(targets: Sequence[str], templates_dir: str = VISUAL_TEMPLATES_DIR, automation=None,
+                      capture=None) -> Dict[str, Optional[str]]:
+    """Снимает шаблоны целей с окна Telegram: цель -> путь к файлу (None - элемент не найден)"""
+    if automation is None:
+        from telegram_automation import TelegramAutomation
+        automation = TelegramAutomation()
+    if not automation.find_telegram_window():
+        raise LookupError("окно Telegram не найдено")
+    result = {}
+    for target in targets:
+        element = find_target_element(automation, target)
+        result[target] = None if element is None else capture_template(
+            automation.telegram_window, element, target, templates_dir, capture)
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Шаблоны элементов экрана входа для резервного пути pyautogui")
+    commands = parser.add_subparsers(dest='command')
+    capture = commands.add_parser('capture', help="Снять шаблоны с открытого окна Telegram (элементы находит UIA)")
+    capture.add_argument('targets', nargs='+', choices=sorted(TARGETS))
+    capture.add_argument('--dir', default=VISUAL_TEMPLATES_DIR, help="Каталог шаблонов")
+    args = parser.parse_args(argv)
+    if args.command != 'capture':
+        parser.print_help()
+        return 2
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        saved = capture_templates(args.targets, args.dir)
+    except LookupError as e:
+        print(f"❌ {e}: открой Telegram Desktop/Portable на нужном экране входа")
+        return 1
+    for target, path in saved.items():
+        if path:
+            print(f"✅ {target}: {path}")
+        else:
+            print(f"❌ {target}: элемент не найден на текущем экране")
+    return 0 if all(saved.values()) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,10 +1,23 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, send_file
 import os
 import json
 import psutil
 import logging
+import urllib.parse
+import urllib.request
 from telegram_automation import TelegramAutomation
+from window_attach import attach
+from inventory_service import InventoryClient, describe_session, error_session, list_telegram_processes
+from logging_setup import setup_logging
+from session_snapshot import SessionSnapshot
+from session_probe import SessionProber, parse_fields, probes_for
+from resource_sampler import RESOURCE_SAMPLE_INTERVAL, ResourceSampler
+from metrics import REGISTRY
+from flight_recorder import RECORDER, mark_slowest
+import profiling
+from profiling import PROFILER
 from datetime import datetime
+from typing import Tuple
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
@@ -14,101 +27,121 @@ logger = logging.getLogger(__name__)
 # Глобальный объект автоматизации
 automation = TelegramAutomation()
 
-# Временное хранилище активных сессий (в памяти, не сохраняется)
-active_sessions = {}
+# Сколько секунд список сессий считается свежим (опрос процессов и окон дорогой)
+SESSIONS_CACHE_TTL = float(os.getenv('SESSIONS_CACHE_TTL', '5'))
+
+# Служба инвентаризации окон (inventory_service.py): если задана, веб-приложение само окна не опрашивает
+INVENTORY_ADDR = os.getenv('INVENTORY_ADDR', '')
+
+# Служебный сервер бота (METRICS_PORT в bot.py), откуда берутся прогоны бота для панели
+BOT_METRICS_URL = os.getenv('BOT_METRICS_URL', '')
 
 
 def get_telegram_sessions():
-    """Получает список всех сессий Telegram Desktop"""
+    """Получает список всех сессий Telegram Desktop (опрос окон этим процессом, без службы)"""
     sessions = []
     
     try:
         # Ищем все процессы Telegram
-        telegram_processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'create_time']):
-            try:
-                proc_name = proc.info.get('name', '').lower() if proc.info.get('name') else ''
-                if 'telegram' in proc_name:
-                    telegram_processes.append({
-                        'pid': proc.info['pid'],
-                        'name': proc.info['name'],
-                        'started': datetime.fromtimestamp(proc.info['create_time']).strftime('%Y-%m-%d %H:%M:%S')
-                    })
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
-        
-        # Если процессов нет, возвращаем пустой список
-        if not telegram_processes:
-            return sessions
+        telegram_processes = list_telegram_processes()
         
         # Проверяем статус каждого процесса
         for proc_info in telegram_processes:
             try:
-                # Сбрасываем окно для нового поиска
-                automation.telegram_window = None
-                
-                # Пробуем найти окно для этого процесса
-                try:
-                    from pywinauto import Application
-                    app = Application(backend="uia").connect(process=proc_info['pid'])
-                    automation.telegram_window = app.top_window()
-                except:
-                    try:
-                        app = Application(backend="win32").connect(process=proc_info['pid'])
-                        automation.telegram_window = app.top_window()
-                    except:
-                        automation.telegram_window = None
-                
-                if automation.telegram_window:
-                    is_authorized = automation.check_if_authorized()
-                    
-                    # Получаем информацию об окне
-                    phone = "Неизвестно"
-                    try:
-                        window_text = automation.telegram_window.window_text()
-                        # Пробуем найти номер в тексте окна
-                        import re
-                        phone_match = re.search(r'\+?\d{10,15}', window_text)
-                        if phone_match:
-                            phone = phone_match.group()
-                    except:
-                        pass
-                    
-                    sessions.append({
-                        'pid': proc_info['pid'],
-                        'name': proc_info['name'],
-                        'started': proc_info['started'],
-                        'authorized': is_authorized,
-                        'phone': phone,
-                        'status': 'Авторизован' if is_authorized else 'Требуется вход'
-                    })
-                else:
-                    # Процесс есть, но окно не найдено
-                    sessions.append({
-                        'pid': proc_info['pid'],
-                        'name': proc_info['name'],
-                        'started': proc_info['started'],
-                        'authorized': False,
-                        'phone': 'Окно не найдено',
-                        'status': 'Окно не найдено'
-                    })
+                # Окно этого процесса - в своей автоматизации: общая automation.telegram_window
+                # принадлежит подключению и входу, проверка окна ждет ту же блокировку UI
+                probe = probe_automation()
+                probe.telegram_window, _ = attach(process=proc_info['pid'], exe=proc_info['name'])
+                sessions.append(describe_session(proc_info, probe))
             except Exception as e:
-                logger.error(f"Ошибка при проверке процесса {proc_info['pid']}: {e}")
-                sessions.append({
-                    'pid': proc_info['pid'],
-                    'name': proc_info['name'],
-                    'started': proc_info['started'],
-                    'authorized': False,
-                    'phone': 'Ошибка проверки',
-                    'status': 'Ошибка проверки'
-                })
+                logger.error("Ошибка при проверке процесса %s: %s", proc_info['pid'], e)
+                sessions.append(error_session(proc_info))
     
     except Exception as e:
-        logger.error(f"Ошибка при получении сессий: {e}")
+        logger.error("Ошибка при получении сессий: %s", e)
     
     return sessions
 
 
+# Со службой инвентаризации (INVENTORY_ADDR) окна опрашивает только она, а веб-приложение
+# получает готовые снимки: сразу при изменении (подписка) и по запросу, если подписка отстала
+inventory = InventoryClient(INVENTORY_ADDR) if INVENTORY_ADDR else None
+
+
+def take_resources(sessions: list) -> list:
+    """Отделяет замеры ресурсов от сессий службы: в снимке у ресурсов своя версия"""
+    snapshot.set_resources({session['pid']: session['resources'] for session in sessions if 'resources' in session})
+    return [{key: value for key, value in session.items() if key != 'resources'} for session in sessions]
+
+
+def get_inventory_sessions():
+    """Снимок от службы инвентаризации; если служба недоступна - опрос окон самим веб-приложением"""
+    try:
+        return take_resources(inventory.sessions())
+    except (OSError, ValueError) as e:
+        logger.warning("Служба инвентаризации недоступна (%s), опрашиваем окна сами", e)
+        return get_telegram_sessions()
+
+
+# Без службы дорогие поля (авторизация, номер) досчитываются по запросу под выбранные поля
+# (session_probe.py), а снимок держит только список процессов с уже известными полями
+def probe_automation() -> TelegramAutomation:
+    """Автоматизация для проб окна: своя на сессию, но блокировка UI общая с подключением"""
+    probe = TelegramAutomation()
+    probe._ui_lock = automation._ui_lock
+    return probe
+
+
+prober = None if inventory else SessionProber(automation_factory=probe_automation)
+
+# Снимок сессий с версией для ETag (создается ниже get_telegram_sessions)
+snapshot = SessionSnapshot(get_inventory_sessions if inventory else prober.sessions, ttl=SESSIONS_CACHE_TTL)
+if inventory:
+    inventory.subscribe(lambda message: snapshot.apply(take_resources(message['sessions'])))
+
+# Ресурсы процессов: со службой их замеряет она (приходят в списке сессий), без нее - фоновый поток здесь
+sampler = None
+if not inventory and RESOURCE_SAMPLE_INTERVAL > 0:
+    sampler = ResourceSampler(RESOURCE_SAMPLE_INTERVAL)
+    sampler.subscribe(snapshot.set_resources)
+    sampler.start()
+
+# Временное хранилище активных сессий (в памяти, не сохраняется)
+active_sessions = snapshot.active
+
+
+def needs_refresh(kind: str, fields, force: bool) -> bool:
+    """Нужна ли для ответа блокирующая работа: опрос процессов или пробы окон (без обращений к UI)"""
+    if force or not snapshot.is_fresh():
+        return True
+    return kind == 'sessions' and prober is not None and prober.needs_probe(
+        list(snapshot.sessions.values()), probes_for(fields))
+
+
+def refresh_sessions(kind: str, fields, force: bool):
+    """Обновляет снимок под ответ: список процессов и пробы окон только для выбранных полей"""
+    snapshot.ensure_fresh(force=force)
+    if kind == 'sessions' and prober is not None:
+        prober.ensure(snapshot, probes_for(fields), force=force)
+
+
+def snapshot_response(kind: str) -> Response:
+    """Ответ из снимка: 304 если у клиента актуальная версия, иначе готовый JSON (?fields= - выборка полей)"""
+    try:
+        fields = parse_fields(request.args.get('fields')) if kind == 'sessions' else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    refresh_sessions(kind, fields, force=request.args.get('refresh') == '1')
+    etag, body = snapshot.current(kind, fields)
+    if snapshot.matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.headers['ETag'] = f'"{etag}"'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/')
 def index():
     """Главная страница"""
@@ -117,61 +150,69 @@ def index():
 
 @app.route('/api/sessions')
 def get_sessions():
-    """API для получения списка сессий"""
-    sessions = get_telegram_sessions()
-    return jsonify({'sessions': sessions, 'count': len(sessions)})
+    """API для получения списка сессий (поддерживает If-None-Match и ?fields=pid,name,status)"""
+    return snapshot_response('sessions')
 
 
-@app.route('/api/connect/<int:pid>', methods=['POST'])
-def connect_session(pid):
-    """Подключение к сессии по PID"""
+def connect_to_session(pid: int) -> Tuple[dict, int]:
+    """Подключение к сессии по PID: ответ и код HTTP (общая часть Flask и web_async)"""
     try:
         # Пробуем найти процесс
         try:
             proc = psutil.Process(pid)
             if 'telegram' not in proc.name().lower():
-                return jsonify({'success': False, 'error': 'Процесс не является Telegram'}), 400
+                return {'success': False, 'error': 'Процесс не является Telegram'}, 400
         except psutil.NoSuchProcess:
-            return jsonify({'success': False, 'error': 'Процесс не найден'}), 404
+            return {'success': False, 'error': 'Процесс не найден'}, 404
         
-        # Подключаемся к окну
-        automation.telegram_window = None
-        automation.find_telegram_window()
-        
-        if not automation.telegram_window:
-            return jsonify({'success': False, 'error': 'Не удалось найти окно Telegram'}), 404
-        
-        # Активируем окно
-        if automation.activate_window():
-            # Проверяем статус авторизации
-            is_authorized = automation.check_if_authorized()
+        # Подключаемся к окну именно этого процесса; до ответа окно не подменят прогрев,
+        # пробы и параллельные подключения - они ждут ту же блокировку UI
+        with automation._ui_lock:
+            automation.telegram_window = None
+            automation.attach_to_process(pid, proc.name())
             
-            # Сохраняем в активные сессии (в памяти)
-            active_sessions[pid] = {
-                'pid': pid,
-                'connected_at': datetime.now().isoformat(),
-                'authorized': is_authorized
-            }
+            if not automation.telegram_window:
+                if automation.breaker.is_open:
+                    return {'success': False, 'error': automation.breaker.status()}, 503
+                return {'success': False, 'error': 'Не удалось найти окно Telegram'}, 404
             
-            return jsonify({
-                'success': True,
-                'message': 'Подключено успешно',
-                'authorized': is_authorized
-            })
-        else:
-            return jsonify({'success': False, 'error': 'Не удалось активировать окно'}), 500
+            # Активируем окно
+            if not automation.activate_window():
+                return {'success': False, 'error': 'Не удалось активировать окно'}, 500
+            
+            # Проверяем статус авторизации
+            is_authorized = automation.check_if_authorized()
+        
+        # Сохраняем в активные сессии (в памяти)
+        snapshot.connect(pid, {
+            'pid': pid,
+            'connected_at': datetime.now().isoformat(),
+            'authorized': is_authorized
+        })
+        
+        return {
+            'success': True,
+            'message': 'Подключено успешно',
+            'authorized': is_authorized
+        }, 200
             
     except Exception as e:
-        logger.error(f"Ошибка при подключении к сессии {pid}: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        logger.error("Ошибка при подключении к сессии %s: %s", pid, e)
+        return {'success': False, 'error': str(e)}, 500
+
+
+@app.route('/api/connect/<int:pid>', methods=['POST'])
+def connect_session(pid):
+    """Подключение к сессии по PID"""
+    payload, status = connect_to_session(pid)
+    return jsonify(payload), status
 
 
 @app.route('/api/disconnect/<int:pid>', methods=['POST'])
 def disconnect_session(pid):
     """Отключение от сессии"""
     try:
-        if pid in active_sessions:
-            del active_sessions[pid]
+        snapshot.disconnect(pid)
         return jsonify({'success': True, 'message': 'Отключено'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -179,16 +220,151 @@ def disconnect_session(pid):
 
 @app.route('/api/status')
 def get_status():
-    """Получение статуса системы"""
-    sessions = get_telegram_sessions()
-    return jsonify({
-        'active_sessions': len(active_sessions),
-        'total_sessions': len(sessions),
-        'authorized_sessions': len([s for s in sessions if s.get('authorized', False)])
-    })
+    """Получение статуса системы (счетчики из снимка, поддерживает If-None-Match)"""
+    return snapshot_response('status')
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Метрики веб-приложения в формате Prometheus (в том числе ресурсы процессов Telegram)"""
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def bot_request(path: str, params: dict = None, timeout: float = 2) -> bytes:
+    """GET к служебному серверу бота (BOT_METRICS_URL)"""
+    url = BOT_METRICS_URL.rstrip('/') + path
+    if params:
+        url += '?' + urllib.parse.urlencode(params)
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def fetch_bot_runs():
+    """Прогоны автоматизации процесса бота (None, если бот недоступен)"""
+    if not BOT_METRICS_URL:
+        return None
+    try:
+        return json.loads(bot_request('/runs').decode('utf-8'))['runs']
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug("Не удалось получить прогоны бота: %s", e)
+        return None
+
+
+def runs_payload() -> dict:
+    """Последние прогоны автоматизации (веб-приложение и бот), самые медленные помечены"""
+    runs = [dict(run, source='web') for run in RECORDER.snapshot()['runs']]
+    bot_runs = fetch_bot_runs()
+    runs.extend(dict(run, source='bot') for run in bot_runs or [])
+    runs.sort(key=lambda run: run['started'], reverse=True)
+    return {
+        'runs': mark_slowest(runs),
+        'bot_available': bot_runs is not None,
+    }
+
+
+@app.route('/api/runs')
+def get_runs():
+    """Последние прогоны автоматизации (веб-приложение и бот), самые медленные помечены"""
+    return jsonify(runs_payload())
+
+
+def funnel_payload() -> dict:
+    """Воронка входа бота (login_funnel.py); без служебного сервера бота - пустая"""
+    if BOT_METRICS_URL:
+        try:
+            return {'funnel': json.loads(bot_request('/funnel').decode('utf-8')), 'bot_available': True}
+        except (OSError, ValueError) as e:
+            logger.debug("Не удалось получить воронку бота: %s", e)
+    return {'funnel': None, 'bot_available': False}
+
+
+@app.route('/api/funnel')
+def get_funnel():
+    """Воронка входа бота: конверсия, повторы и время по состояниям диалога"""
+    return jsonify(funnel_payload())
+
+
+def profiling_denied():
+    """Ответ-отказ для служебных маршрутов профилирования или None, если доступ есть"""
+    if not profiling.enabled():
+        return jsonify({'success': False, 'error': 'Профилирование выключено (PROFILING=1)'}), 404
+    token = request.headers.get('X-Profile-Token') or request.args.get('token')
+    if not profiling.check_token(token):
+        return jsonify({'success': False, 'error': 'Неверный токен'}), 403
+    return None
+
+
+@app.route('/debug/profiles')
+def list_profiles():
+    """Взведенные цели и файлы результатов (общий PROFILE_DIR бота и веб-приложения)"""
+    denied = profiling_denied()
+    if denied:
+        return denied
+    return jsonify({'armed': PROFILER.armed(), 'files': PROFILER.results()})
+
+
+@app.route('/debug/profiles/<name>')
+def download_profile(name):
+    """Скачивание файла результата (.prof, .folded, .txt, .tracemalloc)"""
+    denied = profiling_denied()
+    if denied:
+        return denied
+    path = PROFILER.result_path(name)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Файл не найден'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name)
+
+
+@app.route('/debug/profile/arm', methods=['POST'])
+def arm_profile():
+    """Взвести профилирование: {"target": "/api/sessions", "count": 5, "mode": "cprofile", "process": "web|bot"}"""
+    denied = profiling_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    target = data.get('target')
+    count = int(data.get('count', 1))
+    mode = data.get('mode', 'cprofile')
+    if not target:
+        return jsonify({'success': False, 'error': 'Не указана цель'}), 400
+    try:
+        if data.get('process') == 'bot':
+            body = bot_request('/debug/profile/arm', {
+                'target': target, 'count': count, 'mode': mode, 'token': os.getenv('PROFILE_TOKEN', ''),
+            })
+            return jsonify({'success': True, **json.loads(body.decode('utf-8'))})
+        PROFILER.arm(target, count, mode)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({'success': False, 'error': f'Бот недоступен: {e}'}), 502
+    return jsonify({'success': True, 'armed': PROFILER.armed()})
+
+
+@app.route('/debug/tracemalloc', methods=['POST'])
+def tracemalloc_snapshot():
+    """Снимок памяти и разница с предыдущим: {"process": "web|bot"}"""
+    denied = profiling_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('process') == 'bot':
+            report = bot_request('/debug/tracemalloc', {'token': os.getenv('PROFILE_TOKEN', '')}, timeout=30)
+            report = report.decode('utf-8')
+        else:
+            report = PROFILER.tracemalloc_snapshot()
+    except OSError as e:
+        return jsonify({'success': False, 'error': f'Бот недоступен: {e}'}), 502
+    return Response(report, mimetype='text/plain')
+
+
+# При PROFILING=1 маршруты можно взвести по правилу (например /api/sessions)
+profiling.instrument_flask(app)
 
 
 if __name__ == '__main__':
+    setup_logging()
     print("🌐 Веб-приложение запущено на http://localhost:5000")
     print("📱 Откройте браузер и перейдите по адресу http://localhost:5000")
     app.run(host='0.0.0.0', port=5000, debug=False)
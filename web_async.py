@@ -0,0 +1,194 @@
+"""
+Асинхронный вариант панели: те же маршруты и JSON, что у web_app.py, на tornado.
+
+В web_app (Flask) каждый запрос занимает поток сервера, пока идет опрос psutil и
+pywinauto. Несколько медленных опросов - и главная страница и /metrics ждут свободный
+поток. Здесь запросы обслуживает один цикл asyncio:
+- главная страница, /metrics, /api/disconnect и ответы из свежего снимка сессий
+  (в том числе 304 по If-None-Match) отдаются прямо в цикле, без потоков;
+- блокирующая работа (опрос окон при устаревшем снимке или ?refresh=1, подключение,
+  прогоны бота по HTTP) уходит в пул из WEB_ASYNC_WORKERS потоков. В очереди пула не
+  больше WEB_ASYNC_QUEUE задач, сверх этого сразу 503 "Сервер занят" вместо ожидания;
+- простаивающее соединение стоит сокет и немного памяти, а не поток.
+
+Состояние общее с web_app: автоматизация, снимок сессий, замер ресурсов. Служебные
+маршруты профилирования (/debug/...) остаются только во Flask-варианте.
+tornado приходит с python-telegram-bot[webhooks] (webhook бота работает на нем же).
+
+Запуск: python web_async.py (порт WEB_ASYNC_PORT, по умолчанию 5000);
+сравнение с Flask под нагрузкой: python benchmarks/web_load.py --server both
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+
+import web_app
+from logging_setup import setup_logging
+from metrics import REGISTRY
+from session_snapshot import SessionSnapshot
+
+# Потоков для блокирующей работы (опрос окон, подключение) и предел очереди к ним
+WEB_ASYNC_WORKERS = int(os.getenv('WEB_ASYNC_WORKERS', '4'))
+WEB_ASYNC_QUEUE = int(os.getenv('WEB_ASYNC_QUEUE', '32'))
+WEB_ASYNC_PORT = int(os.getenv('WEB_ASYNC_PORT', '5000'))
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html')
+
+EXECUTOR_PENDING = REGISTRY.gauge('web_executor_pending', 'Задачи пула блокирующей работы (в работе и в очереди)')
+EXECUTOR_REJECTED = REGISTRY.counter('web_executor_rejected_total', 'Запросы, отклоненные из-за полной очереди пула')
+
+
+class Busy(Exception):
+    """Очередь пула заполнена"""
+
+
+class BlockingPool:
+    """Пул потоков с ограниченной очередью: лишние задачи отклоняются сразу"""
+
+    def __init__(self, workers: int = WEB_ASYNC_WORKERS, limit: int = WEB_ASYNC_QUEUE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='web-async')
+        self.limit = workers + limit
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        """Выполняет fn(*args) в пуле; Busy, если в работе и в очереди уже limit задач"""
+        with self._lock:
+            if self.pending >= self.limit:
+                EXECUTOR_REJECTED.inc()
+                raise Busy()
+            self.pending += 1
+            EXECUTOR_PENDING.set(self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                EXECUTOR_PENDING.set(self.pending)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+pool = BlockingPool()
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    """Общее для маршрутов API: JSON-ответы и отказ при занятом пуле"""
+
+    def send_json(self, payload: dict, status: int = 200):
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(payload, ensure_ascii=False))
+
+    async def blocking(self, fn, *args):
+        """Результат fn(*args) из пула; при полной очереди запрос сразу завершается ответом 503"""
+        try:
+            return await pool.run(fn, *args)
+        except Busy:
+            self.send_json({'success': False, 'error': 'Сервер занят, повторите запрос'}, 503)
+            raise tornado.web.Finish()
+
+    def write_error(self, status_code: int, **kwargs):
+        self.finish(json.dumps({'success': False, 'error': self._reason}, ensure_ascii=False))
+
+
+class IndexHandler(tornado.web.RequestHandler):
+    """Главная страница (шаблон без подстановок - читается один раз)"""
+
+    body = None
+
+    def get(self):
+        if IndexHandler.body is None:
+            with open(TEMPLATE_PATH, 'rb') as f:
+                IndexHandler.body = f.read()
+        self.set_header('Content-Type', 'text/html; charset=utf-8')
+        self.finish(IndexHandler.body)
+
+
+class SnapshotHandler(ApiHandler):
+    """/api/sessions и /api/status из снимка (поддерживают If-None-Match, /api/sessions - ?fields=)"""
+
+    def initialize(self, kind: str):
+        self.kind = kind
+
+    async def get(self):
+        force = self.get_argument('refresh', '') == '1'
+        try:
+            fields = web_app.parse_fields(self.get_argument('fields', '')) if self.kind == 'sessions' else None
+        except ValueError as e:
+            self.send_json({'success': False, 'error': str(e)}, 400)
+            return
+        snapshot = web_app.snapshot
+        if web_app.needs_refresh(self.kind, fields, force):
+            # Опрос процессов и пробы окон - в пуле; параллельные запросы там же дождутся общего опроса
+            await self.blocking(web_app.refresh_sessions, self.kind, fields, force)
+        etag, body = snapshot.current(self.kind, fields)
+        self.set_header('ETag', f'"{etag}"')
+        self.set_header('Cache-Control', 'no-cache')
+        if SessionSnapshot.matches(self.request.headers.get('If-None-Match'), etag):
+            self.set_status(304)
+            self.finish()
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.finish(body)
+
+
+class ConnectHandler(ApiHandler):
+    async def post(self, pid: str):
+        self.send_json(*await self.blocking(web_app.connect_to_session, int(pid)))
+
+
+class DisconnectHandler(ApiHandler):
+    def post(self, pid: str):
+        web_app.snapshot.disconnect(int(pid))
+        self.send_json({'success': True, 'message': 'Отключено'})
+
+
+class RunsHandler(ApiHandler):
+    async def get(self):
+        # Прогоны бота запрашиваются по HTTP - не в цикле
+        self.send_json(await self.blocking(web_app.runs_payload))
+
+
+class FunnelHandler(ApiHandler):
+    async def get(self):
+        self.send_json(await self.blocking(web_app.funnel_payload))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.finish(REGISTRY.render_prometheus())
+
+
+def make_app() -> tornado.web.Application:
+    return tornado.web.Application([
+        (r'/', IndexHandler),
+        (r'/api/sessions', SnapshotHandler, {'kind': 'sessions'}),
+        (r'/api/status', SnapshotHandler, {'kind': 'status'}),
+        (r'/api/connect/(\d+)', ConnectHandler),
+        (r'/api/disconnect/(\d+)', DisconnectHandler),
+        (r'/api/runs', RunsHandler),
+        (r'/api/funnel', FunnelHandler),
+        (r'/metrics', MetricsHandler),
+    ])
+
+
+async def serve(port: int = WEB_ASYNC_PORT, address: str = '0.0.0.0'):
+    make_app().listen(port, address)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    print(f"🌐 Веб-приложение (async) запущено на http://localhost:{WEB_ASYNC_PORT}")
+    print(f"📱 Откройте браузер и перейдите по адресу http://localhost:{WEB_ASYNC_PORT}")
+    try:
+        asyncio.run(serve())
+    finally:
+        pool.shutdown()
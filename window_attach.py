@@ -0,0 +1,260 @@
+"""
+Подключение к окну Telegram с гонкой backend-ов pywinauto.
+
+Раньше подключение шло последовательно: Application(backend="uia").connect(...) и только
+после его ошибки - backend="win32". Если UIA зависает, каждый поиск окна платил полный
+таймаут UIA. Здесь оба backend-а (и все паттерны заголовка) запускаются одновременно с
+общим дедлайном, берется первое пригодное окно, остальные попытки отменяются.
+
+Победивший backend запоминается для исполняемого файла: следующие подключения сразу идут
+через него, а гонка запускается снова, только если он перестал работать.
+
+Попытки идут в пуле потоков своего backend-а (не больше ATTACH_WORKERS на backend, потоки
+переиспользуются между гонками). Зависший вызов COM прервать нельзя: такой поток доработает
+в фоне, а его результат будет отброшен. Зависшие попытки занимают не больше ATTACH_WORKERS
+потоков, и зависший UIA не отнимает потоки у win32. Отмененная попытка, которая еще ждет
+поток, не запускается. Если потоки backend-а заняты и столько же попыток уже ждет,
+новые попытки через него не запускаются, пока потоки не освободятся. Из рабочего потока возвращается только дескриптор окна. Обертку
+pywinauto создает вызывающий поток: объекты UIA привязаны к апартаменту COM потока,
+в котором созданы.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+from metrics import REGISTRY
+from flight_recorder import RECORDER
+from ui_locator import UI_CALLS
+
+logger = logging.getLogger(__name__)
+
+# Общий дедлайн подключения (секунды)
+ATTACH_TIMEOUT = float(os.getenv('ATTACH_TIMEOUT', '10'))
+# Потоков попыток подключения на backend (столько же паттернов заголовка проверяются параллельно)
+ATTACH_WORKERS = int(os.getenv('ATTACH_WORKERS', '3'))
+
+BACKENDS = ("uia", "win32")
+
+ATTACH_SECONDS = REGISTRY.histogram(
+    'window_attach_seconds', 'Время подключения к окну Telegram',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+ATTACH_BUSY = REGISTRY.gauge(
+    'window_attach_busy_workers', 'Занятые потоки попыток подключения (в том числе зависшие)')
+
+# Исполняемый файл (или 'title' для поиска по заголовку) -> backend, который подключился последним
+_preferred: Dict[str, str] = {}
+_preferred_lock = threading.Lock()
+
+
+def preferred_backends() -> Dict[str, str]:
+    """Запомненные backend-ы по исполняемым файлам"""
+    with _preferred_lock:
+        return dict(_preferred)
+
+
+def forget(key: Optional[str] = None):
+    """Сбрасывает запомненный backend (для одного файла или все)"""
+    with _preferred_lock:
+        if key is None:
+            _preferred.clear()
+        else:
+            _preferred.pop(key.lower(), None)
+
+
+def _init_com():
+    """В новом потоке COM не инициализирован - без этого UIA не работает"""
+    try:
+        import comtypes
+        comtypes.CoInitialize()
+    except Exception:
+        pass
+
+
+class _AttachPool:
+    """
+    Потоки попыток подключения одного backend-а: не больше size, переиспользуются
+
+    Потоки - daemon (а не ThreadPoolExecutor): зависший вызов COM не должен держать выход процесса.
+    """
+
+    def __init__(self, backend: str, size: int):
+        self.backend = backend
+        self.size = max(1, size)
+        self.threads = 0
+        self.busy = 0  # Отправленные и еще не завершенные попытки (выполняются и ждут поток)
+        self.saturated = False
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args) -> bool:
+        """
+        Отправляет попытку в пул
+
+        Returns:
+            False - все потоки заняты и ждущих попыток уже size (backend завис): попытка не запущена
+        """
+        with self._lock:
+            if self.busy >= 2 * self.size:
+                if not self.saturated:
+                    self.saturated = True
+                    logger.warning("Все %s потоков подключения %s заняты (зависшие вызовы?): новые попытки "
+                                   "через %s не запускаются", self.size, self.backend, self.backend)
+                return False
+            self.busy += 1
+            if self.busy > self.threads and self.threads < self.size:
+                self.threads += 1
+                threading.Thread(target=self._run, name=f'attach-{self.backend}-{self.threads}',
+                                 daemon=True).start()
+            ATTACH_BUSY.set(self.busy, backend=self.backend)
+        self._tasks.put((func, args))
+        return True
+
+    def _run(self):
+        _init_com()
+        while True:
+            func, args = self._tasks.get()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.debug("Ошибка в потоке подключения %s: %s", self.backend, e)
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                    if self.saturated and self.busy < self.size:
+                        self.saturated = False
+                        logger.info("Потоки подключения %s освободились", self.backend)
+                    ATTACH_BUSY.set(self.busy, backend=self.backend)
+
+
+_pools: Dict[str, _AttachPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(backend: str) -> _AttachPool:
+    with _pools_lock:
+        pool = _pools.get(backend)
+        if pool is None:
+            pool = _pools[backend] = _AttachPool(backend, ATTACH_WORKERS)
+        return pool
+
+
+def _connect(backend: str, process: Optional[int], pattern: Optional[str], cancelled: threading.Event):
+    """Одна попытка подключения. Возвращает дескриптор окна или None (если попытку уже отменили)"""
+    from telegram_automation import load_application
+    Application = load_application()
+    UI_CALLS.inc(kind='attach')
+    app = Application(backend=backend)
+    if process is not None:
+        app.connect(process=process)
+        if cancelled.is_set():
+            return None
+        return app.top_window().wrapper_object().handle
+    app.connect(title_re=pattern)
+    for win in app.windows():
+        if cancelled.is_set():
+            return None
+        try:
+            if win.is_visible():
+                return win.handle
+        except Exception:
+            continue
+    raise LookupError(f"нет видимых окон с заголовком '{pattern}'")
+
+
+def _wrap(backend: str, handle):
+    """Обертка окна по дескриптору в вызывающем потоке (подключение по дескриптору не ищет окна)"""
+    from telegram_automation import load_application
+    Application = load_application()
+    app = Application(backend=backend).connect(handle=handle)
+    return app.window(handle=handle).wrapper_object()
+
+
+def _race(attempts: Sequence[Tuple[str, Optional[str]]], process: Optional[int], deadline: float):
+    """Запускает попытки параллельно и ждет первую успешную до дедлайна"""
+    results = queue.Queue()
+    cancelled = threading.Event()
+
+    def worker(backend, pattern):
+        if cancelled.is_set():
+            return  # Гонка закончилась, пока попытка ждала свободный поток
+        try:
+            results.put((backend, pattern, _connect(backend, process, pattern, cancelled), None))
+        except Exception as e:
+            results.put((backend, pattern, None, e))
+
+    pending = 0
+    for backend, pattern in attempts:
+        if _pool(backend).submit(worker, backend, pattern):
+            pending += 1
+
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                backend, pattern, handle, error = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending -= 1
+            if handle is not None:
+                try:
+                    return _wrap(backend, handle), backend, pattern
+                except Exception as e:
+                    error = e  # Окно закрылось между попыткой и оберткой
+            target = f"PID {process}" if process is not None else f"паттерн '{pattern}'"
+            logger.debug("Не удалось подключиться через %s (%s): %s", backend, target, error)
+        if pending:
+            logger.debug("Дедлайн подключения истек, не ответили попыток: %s", pending)
+        return None, None, None
+    finally:
+        cancelled.set()
+
+
+def attach(process: Optional[int] = None, title_patterns: Optional[Sequence[str]] = None,
+           exe: Optional[str] = None, timeout: Optional[float] = None):
+    """
+    Подключается к окну по PID или по паттернам заголовка
+
+    Args:
+        process: PID процесса Telegram
+        title_patterns: Регулярные выражения заголовка (если PID не задан)
+        exe: Имя исполняемого файла - ключ для запоминания backend-а
+        timeout: Общий дедлайн в секундах (по умолчанию ATTACH_TIMEOUT)
+
+    Returns:
+        (окно, backend) или (None, None)
+    """
+    patterns = [None] if process is not None else list(title_patterns or [])
+    key = (exe or 'title').lower()
+    started = time.monotonic()
+    deadline = started + (ATTACH_TIMEOUT if timeout is None else timeout)
+
+    with _preferred_lock:
+        preferred = _preferred.get(key)
+
+    window = backend = None
+    if preferred:
+        # Сначала только запомненный backend (не больше половины дедлайна);
+        # если он перестал подключаться - гонка всех остальных на оставшееся время
+        window, backend, _ = _race([(preferred, p) for p in patterns], process,
+                                   started + (deadline - started) / 2)
+        if window is None:
+            logger.debug("Backend %s больше не подключается к %s, запускаем гонку", preferred, key)
+            forget(key)
+    if window is None:
+        attempts = [(b, p) for p in patterns for b in BACKENDS if b != preferred]
+        window, backend, _ = _race(attempts, process, deadline)
+
+    elapsed = time.monotonic() - started
+    ATTACH_SECONDS.observe(elapsed, backend=backend or 'none')
+    RECORDER.event('attach', target=key, backend=backend, ms=round(elapsed * 1000, 1))
+    if window is None:
+        return None, None
+    with _preferred_lock:
+        _preferred[key] = backend
+    logger.debug("Подключение к %s через %s за %.0f мс", key, backend, elapsed * 1000)
+    return window, backend
@@ -0,0 +1,164 @@
+"""
+Предохранитель (circuit breaker) доступности окна Telegram.
+
+Без запущенного Telegram Desktop каждый activate_window проходил всю лестницу поиска:
+перебор процессов, три шаблона заголовка на двух backend-ах, Alt+Tab и еще один полный
+поиск, а ввод номера после этого все равно ждал и кликал в центр экрана. Повторные
+попытки из бота и опросы панели гоняли этот путь раз за разом.
+
+Состояния:
+- closed - окно ищется как обычно; WINDOW_BREAKER_FAILURES неудачных поисков подряд
+  размыкают предохранитель;
+- open - поиск окна сразу возвращает неудачу, фоновый поток раз в backoff проверяет
+  (только списком процессов, без обращений к UI), не появился ли процесс Telegram;
+  пауза удваивается до WINDOW_PROBE_MAX;
+- half_open - процесс появился: разрешается одна настоящая попытка поиска. Удалась -
+  closed, нет - снова open с увеличенной паузой.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import psutil
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Неудачных поисков окна подряд до размыкания
+WINDOW_BREAKER_FAILURES = int(os.getenv('WINDOW_BREAKER_FAILURES', '3'))
+# Первая пауза между фоновыми проверками процесса и ее верхняя граница (секунды)
+WINDOW_PROBE_INTERVAL = float(os.getenv('WINDOW_PROBE_INTERVAL', '2'))
+WINDOW_PROBE_MAX = float(os.getenv('WINDOW_PROBE_MAX', '60'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+BREAKER_STATE = REGISTRY.gauge('telegram_window_breaker_open', 'Предохранитель окна Telegram разомкнут (1) или нет (0)')
+BREAKER_FAST_FAILS = REGISTRY.counter('telegram_window_fast_fail_total', 'Поиски окна, отклоненные предохранителем')
+BREAKER_PROBES = REGISTRY.counter('telegram_window_probe_total', 'Фоновые проверки процесса Telegram по итогу (found, missing)')
+
+
+def telegram_running() -> bool:
+    """Есть ли процесс Telegram (дешевая проверка без обращений к UI)"""
+    for proc in psutil.process_iter(['name']):
+        try:
+            if proc.info['name'] and 'telegram' in proc.info['name'].lower():
+                return True
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return False
+
+
+class WindowBreaker:
+    """Предохранитель поиска окна Telegram с фоновой проверкой процесса"""
+
+    def __init__(self, failures: int = WINDOW_BREAKER_FAILURES, probe_interval: float = WINDOW_PROBE_INTERVAL,
+                 probe_max: float = WINDOW_PROBE_MAX, probe: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            failures: Неудачных поисков подряд до размыкания
+            probe_interval: Первая пауза между фоновыми проверками (секунды)
+            probe_max: Верхняя граница паузы
+            probe: Проверка "процесс Telegram есть" (по умолчанию telegram_running)
+        """
+        self.failures = failures
+        self.probe_interval = probe_interval
+        self.probe_max = probe_max
+        self._probe = probe or telegram_running
+        self.state = CLOSED
+        self.misses = 0
+        self.backoff = probe_interval
+        self.opened_at = None
+        self.next_probe_at = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._prober = None
+
+    # --- Поиск окна ---
+
+    def allow(self) -> bool:
+        """Можно ли сейчас искать окно. False - предохранитель разомкнут, искать не нужно"""
+        with self._lock:
+            if self.state == OPEN:
+                BREAKER_FAST_FAILS.inc()
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Окно Telegram снова доступно")
+            self.state = CLOSED
+            self.misses = 0
+            self.backoff = self.probe_interval
+            self.opened_at = self.next_probe_at = None
+            BREAKER_STATE.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self.misses += 1
+            if self.state == HALF_OPEN:
+                # Процесс есть, а окна нет - ждем дольше
+                self.backoff = min(self.probe_max, self.backoff * 2)
+            elif self.misses < self.failures:
+                return
+            if self.state != OPEN:
+                logger.warning("Окно Telegram не найдено %s раз подряд, поиск приостановлен (проверка через %.0f с)",
+                               self.misses, self.backoff)
+            self._open()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def status(self) -> str:
+        """Понятное описание для пользователя (пустая строка, если окно ищется как обычно)"""
+        if self.state != OPEN:
+            return ''
+        seconds = max(0.0, (self.next_probe_at or 0) - time.monotonic())
+        return f"Telegram Desktop не найден, следующая проверка через {seconds:.0f} с"
+
+    # --- Фоновая проверка ---
+
+    def _open(self):
+        """Размыкает предохранитель и запускает фоновую проверку (вызывается под self._lock)"""
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.next_probe_at = self.opened_at + self.backoff
+        BREAKER_STATE.set(1)
+        self._wakeup.set()
+        if self._prober is None or not self._prober.is_alive():
+            self._prober = threading.Thread(target=self._probe_loop, name='window-probe', daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            with self._lock:
+                if self.state != OPEN:
+                    self._prober = None
+                    return
+                self._wakeup.clear()
+                delay = self.next_probe_at - time.monotonic()
+            if delay > 0:
+                # Повторное размыкание (новая пауза) будит поток раньше
+                self._wakeup.wait(delay)
+                continue
+            try:
+                found = self._probe()
+            except Exception as e:
+                logger.debug("Ошибка проверки процесса Telegram: %s", e)
+                found = False
+            BREAKER_PROBES.inc(outcome='found' if found else 'missing')
+            with self._lock:
+                if self.state != OPEN:
+                    continue
+                if found:
+                    logger.info("Процесс Telegram найден, пробуем подключиться к окну")
+                    self.state = HALF_OPEN
+                else:
+                    self.backoff = min(self.probe_max, self.backoff * 2)
+                    self.next_probe_at = time.monotonic() + self.backoff